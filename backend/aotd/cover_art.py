@@ -0,0 +1,118 @@
+from django.db import connection, transaction
+
+import requests
+from PIL import Image as PILImage
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import io
+import os
+
+from .models import (
+  Album
+)
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Directory cover art is stored in
+COVER_ART_PATH = os.getenv('COVER_ART_PATH') or "cover_art"
+# Url cover art thumbnails are served from (See views_album.getCoverArt), can point at a proxy or CDN serving COVER_ART_PATH
+COVER_ART_BASE_URL = (os.getenv('COVER_ART_BASE_URL') or "/aotd/coverArt").rstrip("/")
+# Internal nginx location serving COVER_ART_PATH, used when FILE_OFFLOAD is X-Accel-Redirect
+COVER_ART_ACCEL_PREFIX = os.getenv('COVER_ART_ACCEL_PREFIX') or None
+# Square sizes (in pixels) thumbnails are generated at
+COVER_ART_SIZES = (64, 250, 500)
+# Seconds to wait to connect and for a response
+COVER_ART_TIMEOUT = (3.05, 30)
+
+##
+# Local cache of album covers. Each cover is downloaded once, stored under the SHA-256 of its content
+# (So albums sharing a cover share its files), and resized to fixed size JPEG thumbnails.
+# Since a hash always names the same bytes, thumbnails can be cached by clients forever.
+##
+
+# Reused connection to the Cover Art Archive (and the image hosts it redirects to)
+_session = requests.Session()
+_session.headers.update({'User-Agent': 'CordPal/0.0.1 ( www.cordpal.app )'})
+
+
+def coverArtFilePath(cover_hash: str, size: int = None):
+  """Return the path of a stored cover (Or of one of its thumbnails), sharded by the first two characters of its hash"""
+  if(size == None):
+    return os.path.join(COVER_ART_PATH, "original", cover_hash[:2], cover_hash)
+  return os.path.join(COVER_ART_PATH, str(size), cover_hash[:2], f"{cover_hash}.jpg")
+
+
+def coverArtOffloadUri(cover_hash: str, size: int):
+  """Return the internal proxy location of a cover thumbnail, or None if no location is configured"""
+  if(COVER_ART_ACCEL_PREFIX == None):
+    return None
+  return f"{COVER_ART_ACCEL_PREFIX.rstrip('/')}/{size}/{cover_hash[:2]}/{cover_hash}.jpg"
+
+
+def coverArtUrl(cover_hash: str, size: int):
+  """Return the url of a cover thumbnail"""
+  return f"{COVER_ART_BASE_URL}/{cover_hash}/{size}"
+
+
+def writeFileAtomically(path: str, content: bytes):
+  """Write a file through a temporary file, so a partially written file is never seen under its real name"""
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  temp_path = f"{path}.{os.getpid()}.tmp"
+  with open(temp_path, "wb") as file:
+    file.write(content)
+  os.replace(temp_path, path)
+
+
+def storeCoverArt(content: bytes):
+  """Store a cover image and its thumbnails (Skipping any already stored), returning its hash"""
+  cover_hash = hashlib.sha256(content).hexdigest()
+  if(not os.path.exists(coverArtFilePath(cover_hash))):
+    writeFileAtomically(coverArtFilePath(cover_hash), content)
+  image = None
+  for size in COVER_ART_SIZES:
+    if(os.path.exists(coverArtFilePath(cover_hash, size))):
+      continue
+    if(image == None):
+      image = PILImage.open(io.BytesIO(content))
+      image.draft("RGB", (max(COVER_ART_SIZES), max(COVER_ART_SIZES)))
+      image = image.convert("RGB")
+    thumbnail = image.copy()
+    thumbnail.thumbnail((size, size), PILImage.LANCZOS)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format="JPEG", quality=85, optimize=True, progressive=True)
+    writeFileAtomically(coverArtFilePath(cover_hash, size), buffer.getvalue())
+  return cover_hash
+
+
+def fetchAlbumCoverArt(mbid: str):
+  """Download an album's cover (Following the Cover Art Archive's redirects), store it and record its hash on the album"""
+  album = Album.objects.get(mbid=mbid)
+  response = _session.get(album.cover_url, timeout=COVER_ART_TIMEOUT)
+  response.raise_for_status()
+  cover_hash = storeCoverArt(response.content)
+  if(album.cover_hash != cover_hash):
+    album.cover_hash = cover_hash
+    # Saved through the model, so cached album responses and month summaries pick up the new urls
+    album.save(update_fields=['cover_hash'])
+  return cover_hash
+
+
+# Background worker for cover downloads
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cover-art")
+
+def queueCoverArtFetch(mbid: str):
+  """Download an album's cover in the background, once the current transaction (that saved the album) commits"""
+  def fetch():
+    try:
+      cover_hash = fetchAlbumCoverArt(mbid)
+      logger.info(f"Cached cover art of album {mbid} ({cover_hash})")
+    except Exception as e:
+      # Albums left without a cached cover are picked up by the cache_cover_art script
+      logger.error(f"Failed to cache cover art of album {mbid}. Error: {e}")
+    finally:
+      # The worker thread's connection is not managed by the request cycle
+      connection.close()
+  transaction.on_commit(lambda: _executor.submit(fetch))
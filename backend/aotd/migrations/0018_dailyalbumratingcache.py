@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum, Min, Max, F
+
+
+def populate_rating_caches(apps, schema_editor):
+    """Build a rating cache for every existing AOtD using one grouped query over all reviews"""
+    DailyAlbum = apps.get_model('aotd', 'DailyAlbum')
+    DailyAlbumRatingCache = apps.get_model('aotd', 'DailyAlbumRatingCache')
+    Review = apps.get_model('aotd', 'Review')
+    day_stats = {
+        (row['album_id'], row['aotd_date']): row
+        for row in Review.objects.values('album_id', 'aotd_date').annotate(
+            review_count=Count('pk'),
+            score_sum=Sum('score'),
+            score_square_sum=Sum(F('score') * F('score')),
+            score_min=Min('score'),
+            score_max=Max('score'),
+        )
+    }
+    caches = []
+    for aotd in DailyAlbum.objects.all():
+        stats = day_stats.get((aotd.album_id, aotd.date))
+        if stats is None:
+            caches.append(DailyAlbumRatingCache(aotd=aotd))
+            continue
+        caches.append(DailyAlbumRatingCache(
+            aotd=aotd,
+            review_count=stats['review_count'],
+            score_sum=stats['score_sum'],
+            score_square_sum=stats['score_square_sum'],
+            score_min=stats['score_min'],
+            score_max=stats['score_max'],
+            average_score=stats['score_sum'] / stats['review_count'],
+        ))
+    DailyAlbumRatingCache.objects.bulk_create(caches, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aotd', '0017_alter_aotduserdata_highest_score_date_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAlbumRatingCache',
+            fields=[
+                ('aotd', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_cache', serialize=False, to='aotd.dailyalbum')),
+                ('review_count', models.IntegerField(default=0)),
+                ('score_sum', models.FloatField(default=0)),
+                ('score_square_sum', models.FloatField(default=0)),
+                ('score_min', models.FloatField(default=None, null=True)),
+                ('score_max', models.FloatField(default=None, null=True)),
+                ('average_score', models.FloatField(db_index=True, default=None, null=True)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_rating_caches, migrations.RunPython.noop),
+    ]
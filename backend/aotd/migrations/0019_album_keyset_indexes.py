@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aotd', '0018_dailyalbumratingcache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['-submission_date', '-id'], name='album_submission_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyalbum',
+            index=models.Index(fields=['album', '-date'], name='dailyalbum_album_date_idx'),
+        ),
+    ]
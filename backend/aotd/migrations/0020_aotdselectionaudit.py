@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aotd', '0019_album_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AotdSelectionAudit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('seed', models.BigIntegerField()),
+                ('weighting', models.CharField(max_length=20)),
+                ('candidate_count', models.IntegerField()),
+                ('eligible_user_count', models.IntegerField()),
+                ('dry_run', models.BooleanField(default=False)),
+                ('duration_ms', models.FloatField()),
+                ('creation_timestamp', models.DateTimeField(auto_now_add=True)),
+                ('album', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='selection_audits', to='aotd.album')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aotd', '0020_aotdselectionaudit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingTimelineEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('score', models.FloatField()),
+                ('value', models.FloatField()),
+                ('aotd', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_events', to='aotd.dailyalbum')),
+                ('review', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_events', to='aotd.review')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aotd_timeline_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['aotd', 'timestamp'], name='timeline_event_aotd_time_idx')],
+            },
+        ),
+    ]
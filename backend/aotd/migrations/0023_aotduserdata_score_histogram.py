@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aotd', '0022_monthsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aotduserdata',
+            name='score_histogram',
+            field=models.JSONField(default=None, null=True),
+        ),
+    ]
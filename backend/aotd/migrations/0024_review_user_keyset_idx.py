@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aotd', '0023_aotduserdata_score_histogram'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['user', '-aotd_date', '-id'], name='review_user_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aotd', '0026_musicbrainz_cache_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_hash',
+            field=models.CharField(default=None, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:12
+
+import datetime
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def backfill_submission_dates(apps, schema_editor):
+    """Give every album without a submission date its legacy album's submission date, else the start of its first AOtD, else now"""
+    Album = apps.get_model('aotd', 'Album')
+    DailyAlbum = apps.get_model('aotd', 'DailyAlbum')
+    albums = list(Album.objects.filter(submission_date__isnull=True).select_related('legacy_album'))
+    if not albums:
+        return
+    first_aotd = {
+        row['album_id']: row['first_date']
+        for row in DailyAlbum.objects.filter(album__in=albums).values('album_id').annotate(first_date=Min('date'))
+    }
+    now = django.utils.timezone.now()
+    for album in albums:
+        if album.legacy_album is not None:
+            album.submission_date = album.legacy_album.submission_date
+        elif album.pk in first_aotd:
+            album.submission_date = django.utils.timezone.make_aware(datetime.datetime.combine(first_aotd[album.pk], datetime.time.min))
+        else:
+            album.submission_date = now
+    Album.objects.bulk_update(albums, ['submission_date'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aotd', '0027_album_cover_hash'),
+        ('spotifyapi', '0036_alter_review_user_alter_reviewhistory_review_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_submission_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='album',
+            name='submission_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
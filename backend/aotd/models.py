@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.contenttypes.fields import GenericRelation
 from django.utils.timezone import now
 from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 
 import logging
 
@@ -10,6 +11,8 @@ from spotifyapi.models import Album as SpotAlbum
 from reactions.models import Reaction
 
 import json
+import math
+import pytz
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +43,7 @@ class AotdUserData(models.Model):
   highest_score_given = models.FloatField(default=None, null=True)
   highest_score_mbid = models.CharField(max_length=256, null=True, default=None)
   highest_score_date = models.DateField(null=True, default=None)
+  score_histogram = models.JSONField(default=None, null=True) # Count of reviews given at each half point score (21 buckets, 0 to 10), null until first built
 
   # toString Method
   def __str__(self):
@@ -53,6 +57,7 @@ class Album(models.Model):
   artist = models.CharField(max_length=256)
   artist_url = models.CharField(default="", max_length=512) # Links back to MusicBrainz Page using artistID
   cover_url = models.CharField(max_length=512) # Retrieved using CoverArtArchive
+  cover_hash = models.CharField(max_length=64, null=True, default=None) # SHA-256 of the locally cached cover (See aotd/cover_art.py), null until it is fetched
   album_url= models.CharField(default="", max_length=512) # Url to access album from MusicBrainz
   submitted_by = models.ForeignKey(
     User, 
@@ -62,7 +67,7 @@ class Album(models.Model):
     related_name="submitted_albums"
   )
   user_comment = models.TextField(null=True, blank=True)  # User's comment on the album
-  submission_date = models.DateTimeField(null=True, default=now) 
+  submission_date = models.DateTimeField(default=now) 
   release_date = models.DateField(max_length=50, null=True) # Date Object Release Date (Optional if a release date can be parsed)
   release_date_str = models.CharField(max_length=50, null=True) # Raw Release date, if found or provided
   disambiguation = models.CharField(max_length=256, null=False, default="") # If its a remaster or not, defauly to ""
@@ -78,8 +83,28 @@ class Album(models.Model):
     unique=True
   )
 
+  class Meta:
+    indexes = [
+      # Supports keyset pagination over the album pool (newest submissions first)
+      models.Index(fields=['-submission_date', '-id'], name='album_submission_keyset_idx'),
+    ]
+
   def subDateToCalString(self):
     return self.submission_date.strftime('%Y-%m-%d')
+
+  def getCoverUrl(self, size: int = None):
+    """Return the url of the album's cover thumbnail at a size (One of COVER_ART_SIZES), or the full size cover if it is not cached yet"""
+    from .cover_art import coverArtUrl  # Import inside to avoid circular import
+    if((self.cover_hash == None) or (size == None)):
+      return self.cover_url
+    return coverArtUrl(self.cover_hash, size)
+
+  def getCoverThumbnails(self):
+    """Return the urls of every cover thumbnail by size, empty if the cover is not cached yet"""
+    from .cover_art import coverArtUrl, COVER_ART_SIZES  # Import inside to avoid circular import
+    if(self.cover_hash == None):
+      return {}
+    return {str(size): coverArtUrl(self.cover_hash, size) for size in COVER_ART_SIZES}
     
   def relDateToCalString(self):
     if(self.release_date_date):
@@ -89,33 +114,39 @@ class Album(models.Model):
     else:
       return "Not Available"
     
-  def toJSON(self):
-    """Return an Album as a JSON. (For HTTP JSON Responses)"""
+  def toJSON(self, include_raw: bool = True):
+    """
+    Return an Album as a JSON. (For HTTP JSON Responses)
+    Parameters:
+    - include_raw: Boolean - Include the raw MusicBrainz data (The largest part of an album by far)
+    """
     out = {}
     out['mbid'] = self.mbid
     out['title'] = self.title
     out['artist'] = self.artist
     out['artist_url'] = self.artist_url
     out['cover_url'] = self.cover_url
+    out['cover_thumbnails'] = self.getCoverThumbnails()
     out['album_url'] = self.album_url
     out['submitter'] = self.submitted_by.nickname
     out['submitter_id'] = self.submitted_by.discord_id
     out['submission_date'] = self.submission_date.strftime("%m/%d/%Y, %H:%M:%S")
     out['release_date_str'] = self.release_date_str
     out['user_comment'] = self.user_comment
-    out['raw_album'] = self.raw_data
+    if(include_raw):
+      out['raw_album'] = self.raw_data
     return out
 
   # Custom delete function to log the user action
   def delete(self, deleter=None, reason=None, *args, **kwargs):
     # Log the action before actually deleting
-    from users.models import UserAction  # Import inside to avoid circular import
+    from users.audit import recordUserAction  # Import inside to avoid circular import
     # If deleter is not provided, log critical log and do not delete album
     if(deleter == None):
       logger.critical(f"ATTEMPTED DELETE OF ALBUM (ID: {self.mbid}) WITH NO USER PASSED IN! KEEPING ALBUM: {self.title}")
       return
     # Create user action log
-    UserAction.objects.create(
+    recordUserAction(
       user=deleter, 
       action_type="DELETE",
       entity_type="ALBUM",
@@ -138,11 +169,74 @@ class DailyAlbum(models.Model):
     rating_timeline = models.JSONField(default=generateTimelineDict, null=True)
     rating = models.FloatField(default=11.0, null=True) # Score for this day, will only be populated after the day is over (11 means it was not populated yet, Null means no reviews were made)
 
+    class Meta:
+      indexes = [
+        # Supports "most recent AOtD for this album" lookups
+        models.Index(fields=['album', '-date'], name='dailyalbum_album_date_idx'),
+      ]
+
     def dateToCalString(self):
       return self.date.strftime('%Y-%m-%d')
 
     def __str__(self):
       return f"Album for {self.date}: {self.album}"
+
+
+
+# Running rating aggregate for an album of the day, maintained as reviews are submitted and updated so ratings never need a full review scan
+class DailyAlbumRatingCache(models.Model):
+  aotd = models.OneToOneField(
+    DailyAlbum,
+    on_delete=models.CASCADE,
+    primary_key=True,
+    related_name="rating_cache"
+  )
+  review_count = models.IntegerField(default=0)
+  score_sum = models.FloatField(default=0)
+  score_square_sum = models.FloatField(default=0) # Sum of squared scores, allows standard deviation without a review scan
+  score_min = models.FloatField(default=None, null=True)
+  score_max = models.FloatField(default=None, null=True)
+  average_score = models.FloatField(default=None, null=True, db_index=True) # Null if the day has no reviews
+  last_updated = models.DateTimeField(auto_now=True)
+
+  def refreshAverage(self):
+    """Recalculate the stored average from the running sum and count"""
+    self.average_score = (self.score_sum/float(self.review_count)) if (self.review_count > 0) else None
+
+  def getRating(self, rounded: bool = True):
+    """Return the average rating for the day (rounded to the nearest half point if requested), or None if there are no reviews"""
+    if(self.review_count == 0):
+      return None
+    return (round(self.average_score*2)/2) if rounded else self.average_score
+
+  def getStandardDeviation(self):
+    """Return the population standard deviation of the day's scores, or None if there are no reviews"""
+    if(self.review_count == 0):
+      return None
+    variance = (self.score_square_sum/float(self.review_count)) - (self.average_score ** 2)
+    return math.sqrt(max(variance, 0.0))
+
+  def __str__(self):
+    return f"Rating cache for {self.aotd}"
+
+
+
+# Precomputed getAOtDByMonth payload for a month. Days are added as they close, and the month is frozen once its last day has closed.
+class MonthSummary(models.Model):
+  year = models.IntegerField()
+  month = models.IntegerField()
+  through_date = models.DateField(null=True, default=None) # Last day included in the payload, null if no days have closed yet
+  closed = models.BooleanField(default=False) # True once every day of the month is included, the payload will not change again
+  payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder) # Day entries and stats, in the getAOtDByMonth response format
+  last_updated = models.DateTimeField(auto_now=True)
+
+  class Meta:
+    constraints = [
+      models.UniqueConstraint(fields=['year', 'month'], name='unique_month_summary'),
+    ]
+
+  def __str__(self):
+    return f"AOtD summary for {self.year}-{self.month:02d}{' (Closed)' if self.closed else ''}"
     
 
 
@@ -163,12 +257,19 @@ class Review(models.Model):
 
     class Meta:
       unique_together = ('album', 'user', 'aotd_date')  # Prevent duplicate reviews for the same user and album
-
-    def toJSON(self, full: bool = False):
+      indexes = [
+        # Supports keyset pagination over a user's reviews (newest AOtD first)
+        models.Index(fields=['user', '-aotd_date', '-id'], name='review_user_keyset_idx'),
+        # Supports looking up a user's lowest and highest scored reviews
+        models.Index(fields=['user', 'score', 'id'], name='review_user_score_idx'),
+      ]
+
+    def toJSON(self, full: bool = False, include_raw_album: bool = True):
       """
       Return a review as a JSON. (For HTTP JSON Responses)
       Parameters:
       - full: Boolean - Include all data from album and any other related objects
+      - include_raw_album: Boolean - Include the album's raw MusicBrainz data (Only used with full)
       """
       outObj = {}
       outObj['id'] = self.pk
@@ -176,7 +277,7 @@ class Review(models.Model):
       outObj['user_nickname'] = self.user.nickname
       outObj['album_id'] = self.album.mbid
       if(full):
-        outObj['album'] = self.album.toJSON()
+        outObj['album'] = self.album.toJSON(include_raw=include_raw_album)
       outObj['score'] = self.score
       outObj['comment'] = self.review_text
       outObj['review_date'] = self.review_date.strftime("%m/%d/%Y, %H:%M:%S")
@@ -202,39 +303,97 @@ class Review(models.Model):
       outObj['reactions'] = list(rObj.values())
       return outObj
 
+    # Fields copied into a ReviewHistory when a review is updated
+    HISTORY_FIELDS = ['score', 'review_text', 'review_date', 'last_updated', 'first_listen', 'aotd_date', 'version']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+      """Keep the stored values of a loaded review, so an update can record its history without fetching it again"""
+      instance = super().from_db(db, field_names, values)
+      instance._stored_values = {field: value for field, value in zip(field_names, values) if field in cls.HISTORY_FIELDS}
+      return instance
+
+    def getStoredValues(self):
+      """Return the values of the history fields as they are in the database (before any unsaved changes)"""
+      stored = getattr(self, '_stored_values', {})
+      if(len(stored) != len(self.HISTORY_FIELDS)):
+        # Not loaded from the database, or loaded with deferred fields
+        stored = Review.objects.filter(pk=self.pk).values(*self.HISTORY_FIELDS).get()
+      return stored
+
     def save(self, *args, **kwargs):
-      """Save override, will create a history object and user action."""
-      from users.models import UserAction
-      # Create a history record before updating the review
-      if self.pk:  # Only if this is an update, not a new review
-        # Fetch the original (pre-save) instance from the DB
-        old_review = Review.objects.get(pk=self.pk)
-        # Create review history object
-        history = ReviewHistory.objects.create(
-          review=self,
-          score=old_review.score,
-          review_text=old_review.review_text,
-          review_date=old_review.review_date,
-          last_updated=old_review.last_updated,
-          first_listen=old_review.first_listen,
-          aotd_date=old_review.aotd_date,
-          version=old_review.version
-        )
-        # Create UserAction for review update
-        UserAction.objects.create(
-          user=self.user, 
-          action_type="UPDATE",
-          entity_type="REVIEW",
-          entity_id=self.pk,
-          details={"old_review_score": self.score, "old_review_text": self.review_text, "reviewhistory_pk": history.pk}
-        )
-      super().save(*args, **kwargs)
+      """Save override, will create a history object and user action, and update the day's rating cache."""
+      from users.audit import recordUserAction
+      from .utils import updateDailyAlbumRating, appendToDayRatingTimeline, updateUserReviewStats
+      # Views may pass the AOtD date as a string, the rating cache, stats and signals compare it as a date
+      self.aotd_date = self._meta.get_field('aotd_date').to_python(self.aotd_date)
+      # Keep the review, its history and the day's rating cache consistent with each other
+      with transaction.atomic():
+        old_score = None
+        # Create a history record before updating the review
+        if self.pk:  # Only if this is an update, not a new review
+          # Original (pre-save) values of the review
+          old_review = self.getStoredValues()
+          old_score = old_review['score']
+          # Create review history object
+          history = ReviewHistory.objects.create(review=self, **old_review)
+          # Create UserAction for review update
+          recordUserAction(
+            user=self.user, 
+            action_type="UPDATE",
+            entity_type="REVIEW",
+            entity_id=self.pk,
+            details={"old_review_score": self.score, "old_review_text": self.review_text, "reviewhistory_pk": history.pk}
+          )
+        super().save(*args, **kwargs)
+        # Apply the new score (or the change in score) to the day's rating cache, the day's live timeline and the user's review stats
+        updateDailyAlbumRating(self, old_score)
+        appendToDayRatingTimeline(self, old_score)
+        updateUserReviewStats(self, old_score, self.score)
+        # The saved values are now the stored ones
+        self._stored_values = {field: getattr(self, field) for field in self.HISTORY_FIELDS}
 
     def __str__(self):
       return f"Review by {self.user.username} for {self.album.title}"
     
 
 
+# Model for a single point on an AOtD's rating timeline, appended as reviews are submitted or change score
+class RatingTimelineEvent(models.Model):
+    aotd = models.ForeignKey(DailyAlbum, on_delete=models.CASCADE, related_name="timeline_events")
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name="timeline_events")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="aotd_timeline_events")
+    timestamp = models.DateTimeField() # When this version of the review was recorded
+    score = models.FloatField() # The score given for this version of the review
+    value = models.FloatField() # The average rating of the album after this event
+
+    class Meta:
+      indexes = [
+        models.Index(fields=['aotd', 'timestamp'], name='timeline_event_aotd_time_idx'),
+      ]
+
+    def toJSON(self, event_type: str):
+      """
+      Return a timeline event as a JSON. (For HTTP JSON Responses)
+      Parameters:
+      - event_type: "Review" for a user's final review, "First Update" for their initial review if it was changed later, or "Update"
+      """
+      outObj = {}
+      outObj['timestamp'] = self.timestamp.astimezone(pytz.UTC).isoformat()
+      outObj['value'] = self.value
+      outObj['user_id'] = self.user.pk
+      outObj['user_discord_id'] = self.user.discord_id
+      outObj['user_nickname'] = self.user.nickname
+      outObj['type'] = event_type
+      outObj['score'] = self.score
+      outObj['review_id'] = self.review_id
+      return outObj
+
+    def __str__(self):
+      return f"Timeline event for {self.aotd} at {self.timestamp}"
+
+
+
 # Model for a User's older review of an album.
 class ReviewHistory(models.Model):
     review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name="history")
@@ -316,14 +475,14 @@ class UserAlbumOutage(models.Model):
   # Custom delete function to log the user action
   def delete(self, deleter=None, delete_reason=None, *args, **kwargs):
     # Log the action before actually deleting
-    from users.models import UserAction  # Import inside to avoid circular import
+    from users.audit import recordUserAction  # Import inside to avoid circular import
 
     # If deleter is not provided, log critical log and do not delete album
     if(deleter == None):
       logger.critical(f"ATTEMPTED DELETE OF ALBUM_SELECTION_OUTAGE (ID: {self.pk}) WITH NO DELETER USER PASSED IN! KEEPING OUTAGE: {self.pk}")
       return
     # Create user action log
-    UserAction.objects.create(
+    recordUserAction(
       user=deleter, 
       action_type="DELETE",
       entity_type="ALBUM_SELECTION_OUTAGE",
@@ -364,4 +523,56 @@ class UserChanceCache(models.Model):
       out['outage']["admin_outage"] = f"{self.outage.admin_enacted}"
       out['outage']["outage_start"] = self.outage.start_date.strftime('%Y-%m-%d')
       out['outage']["outage_end"] = self.outage.end_date.strftime('%Y-%m-%d')
-    return out
\ No newline at end of file
+    return out
+
+
+
+# Audit record of an album of the day selection (or dry run), storing the inputs of the draw so it can be reproduced and analysed offline
+class AotdSelectionAudit(models.Model):
+  date = models.DateField() # Date the selection was made for
+  album = models.ForeignKey(Album, on_delete=models.SET_NULL, null=True, related_name="selection_audits") # Selected album, null if the pool was empty
+  seed = models.BigIntegerField() # Seed of the RNG used for the draw, the same seed and pool will always select the same album
+  weighting = models.CharField(max_length=20) # Should be either "ALBUM" or "USER"
+  candidate_count = models.IntegerField() # Number of albums eligible for selection
+  eligible_user_count = models.IntegerField() # Number of distinct submitters in the eligible pool
+  dry_run = models.BooleanField(default=False)
+  duration_ms = models.FloatField() # Time taken to build the pool and draw
+  creation_timestamp = models.DateTimeField(auto_now_add=True)
+
+  def toJSON(self):
+    """Convert audit object to a dict for HTTP transfer"""
+    out = {}
+    out['date'] = self.date.strftime('%Y-%m-%d')
+    out['album_id'] = self.album.mbid if self.album else None
+    out['seed'] = self.seed
+    out['weighting'] = self.weighting
+    out['candidate_count'] = self.candidate_count
+    out['eligible_user_count'] = self.eligible_user_count
+    out['dry_run'] = self.dry_run
+    out['duration_ms'] = self.duration_ms
+    out['creation_timestamp'] = self.creation_timestamp.strftime('%m/%d/%Y, %H:%M:%S') if self.creation_timestamp else None # Unsaved audits (Previews) have none
+    return out
+
+
+
+# Cached response from the MusicBrainz API, shared by every worker (See aotd/musicbrainz.py)
+class MusicBrainzCacheEntry(models.Model):
+  key = models.CharField(max_length=64, unique=True) # SHA-256 of the request path and params
+  url = models.TextField() # Requested url, for debugging
+  response = models.JSONField()
+  fetched_at = models.DateTimeField(auto_now=True)
+  expires_at = models.DateTimeField(db_index=True)
+
+  def __str__(self):
+    return f"MusicBrainz response for {self.url} (Expires {self.expires_at})"
+
+
+
+# Token bucket used to rate limit requests to an external API across every worker process
+class RateLimitBucket(models.Model):
+  name = models.CharField(max_length=64, unique=True) # Name of the rate limited API
+  tokens = models.FloatField() # Tokens left as of last_refill
+  last_refill = models.DateTimeField()
+
+  def __str__(self):
+    return f"Rate limit bucket {self.name} ({self.tokens} tokens at {self.last_refill})"
@@ -0,0 +1,222 @@
+from django.db import connection, transaction, IntegrityError
+from django.utils import timezone
+from django.utils.http import parse_http_date_safe
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import hashlib
+import logging
+import json
+import time
+import os
+
+from backend.view_cache import bumpGeneration
+from .models import (
+  Album,
+  MusicBrainzCacheEntry,
+  RateLimitBucket
+)
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Base url of the MusicBrainz web service (Can point at a local stub server for testing)
+MUSICBRAINZ_API_URL = (os.getenv('MUSICBRAINZ_API_URL') or "https://musicbrainz.org/ws/2").rstrip("/")
+# Requests per second allowed by MusicBrainz, shared by every worker process
+MUSICBRAINZ_RATE_LIMIT = float(os.getenv('MUSICBRAINZ_RATE_LIMIT') or 1)
+# Seconds a MusicBrainz response is cached for (Releases rarely change)
+MUSICBRAINZ_CACHE_SECONDS = int(os.getenv('MUSICBRAINZ_CACHE_SECONDS') or 60 * 60 * 24 * 7)
+# Seconds to wait to connect and for a response
+MUSICBRAINZ_TIMEOUT = (3.05, 15)
+# MusicBrainz requires an identifying user agent
+MUSICBRAINZ_USER_AGENT = 'CordPal/0.0.1 ( www.cordpal.app )'
+
+
+class MusicBrainzError(Exception):
+  """Raised when MusicBrainz cannot be reached or does not return a usable response"""
+
+  def __init__(self, message: str, status_code: int = None):
+    super().__init__(message)
+    self.status_code = status_code
+
+
+def parseRetryAfter(value: str, default: float):
+  """Return the seconds to wait from a Retry-After header (Seconds or an HTTP date), or default if it is missing or malformed"""
+  if(not value):
+    return default
+  try:
+    return max(float(value), 0)
+  except ValueError:
+    pass
+  retry_at = parse_http_date_safe(value)
+  if(retry_at == None):
+    return default
+  return max(retry_at - time.time(), 0)
+
+
+##
+# Token bucket stored in the database, so every worker process (and script) draws from the same budget.
+# The bucket row is locked while tokens are taken, so the wait between requests holds across processes.
+##
+class DatabaseTokenBucket:
+
+  def __init__(self, name: str, rate: float, capacity: float = 1):
+    self.name = name
+    self.rate = rate
+    self.capacity = capacity
+
+  def acquire(self):
+    """Take a token, sleeping until one is available. Returns the seconds spent waiting."""
+    waited = 0
+    while True:
+      wait = self.tryAcquire()
+      if(wait == 0):
+        return waited
+      time.sleep(wait)
+      waited += wait
+
+  def tryAcquire(self):
+    """Take a token if one is available, returning 0 on success or the seconds until the next token otherwise"""
+    try:
+      with transaction.atomic():
+        bucket = RateLimitBucket.objects.select_for_update().filter(name=self.name).first()
+        if(bucket == None):
+          # First use, start with a full bucket (A concurrent first use raises IntegrityError and retries)
+          RateLimitBucket.objects.create(name=self.name, tokens=self.capacity - 1, last_refill=timezone.now())
+          return 0
+        # Refill for the time since the last refill
+        now = timezone.now()
+        elapsed = max((now - bucket.last_refill).total_seconds(), 0)
+        tokens = min(self.capacity, bucket.tokens + (elapsed * self.rate))
+        if(tokens < 1):
+          return (1 - tokens) / self.rate
+        bucket.tokens = tokens - 1
+        bucket.last_refill = now
+        bucket.save(update_fields=['tokens', 'last_refill'])
+        return 0
+    except IntegrityError:
+      return 0.05
+
+
+##
+# Client for the MusicBrainz web service.
+# Connections are pooled, every request waits its turn in the shared rate limit, and responses are cached in the database.
+##
+class MusicBrainzClient:
+
+  def __init__(self, base_url: str = None, rate_limit: float = MUSICBRAINZ_RATE_LIMIT, cache_seconds: int = MUSICBRAINZ_CACHE_SECONDS, timeout: tuple = MUSICBRAINZ_TIMEOUT, max_attempts: int = 3):
+    self.base_url = (base_url or MUSICBRAINZ_API_URL).rstrip("/")
+    self.cache_seconds = cache_seconds
+    self.timeout = timeout
+    self.max_attempts = max_attempts
+    self.bucket = DatabaseTokenBucket("musicbrainz", rate_limit)
+    # Keep connections open between requests
+    self.session = requests.Session()
+    self.session.headers.update({'User-Agent': MUSICBRAINZ_USER_AGENT, 'Accept': 'application/json'})
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+    self.session.mount("http://", adapter)
+    self.session.mount("https://", adapter)
+
+  def get(self, path: str, params: dict = None, use_cache: bool = True):
+    """
+    Return the JSON response of a MusicBrainz request, from the cache if a fresh copy is stored.
+    Parameters:
+    - path: Path under the web service root, such as "release/<mbid>"
+    - params: Query params (fmt=json is added)
+    - use_cache: False to always make the request (The response is still cached)
+    """
+    params = {**(params or {}), 'fmt': 'json'}
+    url = f"{self.base_url}/{path.lstrip('/')}"
+    key = hashlib.sha256(f"{url}?{json.dumps(params, sort_keys=True)}".encode()).hexdigest()
+    # Return cached response if it has not expired
+    if(use_cache):
+      entry = MusicBrainzCacheEntry.objects.filter(key=key, expires_at__gt=timezone.now()).only('response').first()
+      if(entry != None):
+        return entry.response
+    data = self.request(url, params)
+    MusicBrainzCacheEntry.objects.update_or_create(
+      key=key,
+      defaults={"url": url, "response": data, "expires_at": timezone.now() + datetime.timedelta(seconds=self.cache_seconds)}
+    )
+    return data
+
+  def request(self, url: str, params: dict):
+    """Make a rate limited request, retrying when MusicBrainz is busy"""
+    for attempt in range(1, self.max_attempts + 1):
+      self.bucket.acquire()
+      try:
+        response = self.session.get(url, params=params, timeout=self.timeout)
+      except requests.RequestException as e:
+        logger.warning(f"MusicBrainz request to {url} failed (Attempt {attempt}/{self.max_attempts}). Error: {e}")
+        if(attempt == self.max_attempts):
+          raise MusicBrainzError(f"MusicBrainz request to {url} failed: {e}") from e
+        continue
+      # MusicBrainz answers 503 when it is over its rate limit
+      if((response.status_code in (502, 503, 504)) and (attempt < self.max_attempts)):
+        logger.warning(f"MusicBrainz returned {response.status_code} for {url} (Attempt {attempt}/{self.max_attempts}), retrying...")
+        time.sleep(parseRetryAfter(response.headers.get('Retry-After'), default=attempt))
+        continue
+      if(response.status_code != 200):
+        raise MusicBrainzError(f"MusicBrainz returned {response.status_code} for {url}", response.status_code)
+      try:
+        return response.json()
+      except ValueError as e:
+        raise MusicBrainzError(f"MusicBrainz returned invalid JSON for {url}") from e
+
+  def getRelease(self, mbid: str, inc: tuple = ("recordings",)):
+    """Return a release, including the passed in subqueries"""
+    # Subqueries are separated by "+", which is how requests encodes a space
+    return self.get(f"release/{mbid}", {'inc': " ".join(inc)})
+
+  def searchReleases(self, query: str):
+    """Return the releases matching a Lucene search query"""
+    return self.get("release", {'query': query})
+
+
+def clearExpiredMusicBrainzCache():
+  """Delete expired cached responses, returning the number deleted"""
+  deleted, _ = MusicBrainzCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+  return deleted
+
+
+# Process wide client, created on first use
+_client = None
+
+def getMusicBrainzClient():
+  """Return the MusicBrainz client for this process"""
+  global _client
+  if(_client == None):
+    _client = MusicBrainzClient()
+  return _client
+
+
+# Background worker for MusicBrainz lookups, a single thread since requests are rate limited anyway
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="musicbrainz")
+
+def fetchAlbumTrackList(mbid: str):
+  """Fetch an album's track list from MusicBrainz and store it on the album, returning the number of tracks"""
+  release = getMusicBrainzClient().getRelease(mbid, ["recordings"])
+  media = release.get('media') or [{}]
+  tracks = media[0].get('tracks', [])
+  Album.objects.filter(mbid=mbid).update(track_list={'tracks': tracks})
+  # Saved with update(), so no signal bumps the cached album responses
+  bumpGeneration("Album")
+  return len(tracks)
+
+
+def queueTrackListFetch(mbid: str):
+  """Fetch an album's track list in the background, once the current transaction (that saved the album) commits"""
+  def fetch():
+    try:
+      track_count = fetchAlbumTrackList(mbid)
+      logger.info(f"Fetched track list of album {mbid} ({track_count} tracks)")
+    except Exception as e:
+      # Albums left without a track list are picked up by the fetch_missing_track_lists script
+      logger.error(f"Failed to fetch track list of album {mbid}. Error: {e}")
+    finally:
+      # The worker thread's connection is not managed by the request cycle
+      connection.close()
+  transaction.on_commit(lambda: _executor.submit(fetch))
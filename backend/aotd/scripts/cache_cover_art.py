@@ -0,0 +1,23 @@
+# Downloads and stores the cover art (and thumbnails) of every album that does not have a locally cached cover yet.
+# Covers are normally cached in the background after an album is submitted, run this once to fill in existing albums and to pick up any failed downloads.
+from aotd.models import (
+  Album
+)
+
+from aotd.cover_art import (
+  fetchAlbumCoverArt
+)
+
+def run():
+  failed_update = []
+  # Retreive all albums without a cached cover
+  albums = list(Album.objects.filter(cover_hash__isnull=True).values_list('mbid', 'title'))
+  # Iterate albums
+  for index, (mbid, title) in enumerate(albums):
+    try:
+      print(f"Caching cover art for {title} ({index+1}/{len(albums)})")
+      fetchAlbumCoverArt(mbid)
+    except Exception as e:
+      failed_update.append({"mbid": mbid, "error": e})
+  # Print out any failures
+  print(f"\n\nFAILED:\n{failed_update}")
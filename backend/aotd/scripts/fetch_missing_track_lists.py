@@ -0,0 +1,26 @@
+# Fetches the track list of every album that does not have one yet.
+# Track lists are normally fetched in the background after an album is submitted, this picks up any fetch that failed or was lost to a restart.
+from aotd.models import (
+  Album
+)
+
+from aotd.musicbrainz import (
+  fetchAlbumTrackList,
+  clearExpiredMusicBrainzCache
+)
+
+def run():
+  failed_update = []
+  # Retreive all albums without a track list
+  albums = list(Album.objects.filter(track_list__isnull=True).values_list('mbid', 'title'))
+  # Iterate albums (Requests are rate limited by the MusicBrainz client)
+  for index, (mbid, title) in enumerate(albums):
+    try:
+      print(f"Fetching track list for {title} ({index+1}/{len(albums)})")
+      fetchAlbumTrackList(mbid)
+    except Exception as e:
+      failed_update.append({"mbid": mbid, "error": e})
+  # Drop expired cached responses
+  print(f"Cleared {clearExpiredMusicBrainzCache()} expired MusicBrainz responses")
+  # Print out any failures
+  print(f"\n\nFAILED:\n{failed_update}")
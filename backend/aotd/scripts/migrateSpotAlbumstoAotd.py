@@ -4,9 +4,9 @@ from datetime import datetime
 from spotifyapi.models import Album as SpotAlbum
 from aotd.models import Album
 
-import requests
+from aotd.musicbrainz import getMusicBrainzClient
+
 import datetime
-import time
 
 def parseReleaseDate(date_str):
   if(len(date_str) > 7):
@@ -23,11 +23,9 @@ def run():
   failed_update = []
   # Retreive all Spotify Album objects
   spot_album_objects = SpotAlbum.objects.all().order_by('pk')
-  # Iterate album objects and create a new Album Object in AOTD (sleep for 1 second after to avoid rate limiting)
+  # Iterate album objects and create a new Album Object in AOTD (Requests are rate limited by the MusicBrainz client)
   index = 1
-  headers = {
-    'User-Agent': 'CordPal/0.0.1 ( www.cordpal.app )'
-  }
+  client = getMusicBrainzClient()
   for spot_album in spot_album_objects:
     print(f"Attempting to migrate {spot_album.title} by {spot_album.artist} ({index}/{len(spot_album_objects)})...")
     try:
@@ -39,32 +37,18 @@ def run():
       continue
     except Exception as e:
       print(f"\tMigrated album for {spot_album.title} not found...")
-    # Sleep for 1 second no matter what, to avoid rate limiting (this is wasting time but I want to play it safe)
-    time.sleep(1)
     try:
       if(spot_album.mbid):
         spot_album.mbid = spot_album.mbid.strip()
         spot_album.save()
         print(f"\tUnmigrated album mbid provided, searching using mbid...")
         # MBID provided but no matching album found post-migration, this lets us pull remasters and manually located mbids
-        url = f"https://musicbrainz.org/ws/2/release/{spot_album.mbid}"
-        params = {
-          'inc': "artists+release-groups+recordings",
-          'fmt': 'json'
-        }
-        response = requests.get(url, params=params, headers=headers)
-        album_data = response.json()
+        album_data = client.getRelease(spot_album.mbid, ["artists", "release-groups", "recordings"])
         album_data['track_data'] = { 'tracks': album_data['media'][0]['tracks'] }
       else:
-        # Build search URL
-        url = f"https://musicbrainz.org/ws/2/release"
-        params = {
-          'query': f"release:\"{spot_album.title}\" AND artist:\"{spot_album.artist}\"",
-          'fmt': 'json'
-        }
+        # Search for the album
         print(f"\tMaking request to musicbrainz search url for album {spot_album.title} by {spot_album.artist} ({index}/{len(spot_album_objects)})...")
-        response = requests.get(url, params=params, headers=headers)
-        data = response.json()
+        data = client.searchReleases(f"release:\"{spot_album.title}\" AND artist:\"{spot_album.artist}\"")
         try:
           album_data = None
           for result in data['releases']:
@@ -74,27 +58,11 @@ def run():
           if(album_data == None):
             raise Exception("Album not found in inital search...")
         except:
-          # Sleep for 1 second no matter what, to avoid rate limiting (this is wasting time but I want to play it safe)
-          time.sleep(1)
           print(f"\tDid not locate album based on artist and album title search, using just album title and only accepting various artists as artist...")
-          url = f"https://musicbrainz.org/ws/2/release"
-          params = {
-            'query': f"release:\"{spot_album.title}\" AND artist:\"Various Artists\"",
-            'fmt': 'json'
-          }
-          response = requests.get(url, params=params, headers=headers)
-          data = response.json()
+          data = client.searchReleases(f"release:\"{spot_album.title}\" AND artist:\"Various Artists\"")
           album_data = data['releases'][0]
-        # Sleep for 1 second no matter what, to avoid rate limiting (this is wasting time but I want to play it safe)
-        time.sleep(1)
-        # Build Tracks Url
-        url = f"https://musicbrainz.org/ws/2/release/{album_data['id']}"
-        params = {
-          'inc': 'recordings',
-          'fmt': 'json'
-        }
-        response = requests.get(url, params=params, headers=headers)
-        data = response.json()
+        # Get tracks
+        data = client.getRelease(album_data['id'], ["recordings"])
         album_data['track_data'] = { 'tracks': data['media'][0]['tracks'], 'track_count': album_data['track-count'] }
       # Attempt to pull release date from tracks if not present in original data
       if('date' not in album_data.keys()):
@@ -0,0 +1,25 @@
+# Only to be run once, will store the rating timeline of every past AOtD as RatingTimelineEvents
+# Days are rebuilt from their reviews and review history, replacing the timeline generated at the end of each day.
+from aotd.models import (
+  DailyAlbum
+)
+
+from aotd.utils import (
+  generateDayRatingTimeline
+)
+
+def run():
+  failed_update = []
+  # Retreive all AOTD objects
+  aotd_list = DailyAlbum.objects.all().select_related('album')
+  # Iterate all aotd objects
+  index = 0
+  for aotd in aotd_list:
+    try:
+      print(f"Attempting to populate timeline events for AOTD {aotd.pk}: {aotd.album.title} ({index+1}/{len(aotd_list)})")
+      generateDayRatingTimeline(aotd)
+    except Exception as e:
+      failed_update.append({"aotd": aotd.pk, "error": e})
+    index += 1
+  # Print out any failures
+  print(f"\n\nFAILED:\n{failed_update}")
@@ -0,0 +1,17 @@
+# Dry run of the album of the day selection, printing the album a draw would select without creating an AOtD.
+# The draw is recorded as a dry run AotdSelectionAudit, so it can be compared with the real selection later.
+# Usage: python manage.py runscript preview_aotd_selection --script-args <date> <seed> <weighting>
+# All arguments are optional, defaults are today (YYYY-MM-DD), a random seed and "ALBUM" weighting.
+import datetime
+
+from aotd.utils import (
+  selectAlbumOfDay
+)
+
+def run(*args):
+  day = datetime.datetime.strptime(args[0], "%Y-%m-%d").date() if (len(args) > 0) else datetime.date.today()
+  seed = int(args[1]) if (len(args) > 1) else None
+  weighting = args[2].upper() if (len(args) > 2) else "ALBUM"
+  album, audit = selectAlbumOfDay(day, seed=seed, weighting=weighting, dry_run=True)
+  print(f"Selected: {album} (Submitted by: {album.submitted_by.nickname if album else None})")
+  print(audit.toJSON())
@@ -0,0 +1,10 @@
+# Recalculates the review stats and score histogram of every user from their reviews.
+# Stats are normally kept up to date as reviews are saved and deleted, run this to repair them if they ever drift.
+from aotd.utils import (
+  rebuildAllUserReviewStats
+)
+
+def run():
+  print("Rebuilding review stats for all users...")
+  updated = rebuildAllUserReviewStats()
+  print(f"Rebuilt review stats for {updated} users")
@@ -0,0 +1,43 @@
+# Simulate many AOtD draws against today's eligible pool without selecting anything, to check selection fairness and timing offline.
+# Usage: python manage.py runscript aotd.scripts.simulate_aotd_selection --script-args <draws> <weighting> <seed>
+# All arguments are optional, defaults are 10000 draws, "ALBUM" weighting and seed 0.
+import datetime
+import random
+import time
+from collections import Counter
+
+from users.models import User
+from aotd.utils import (
+  getEligibleAlbumPool,
+  drawFromAlbumPool
+)
+
+def run(*args):
+  draws = int(args[0]) if (len(args) > 0) else 10000
+  weighting = args[1].upper() if (len(args) > 1) else "ALBUM"
+  seed = int(args[2]) if (len(args) > 2) else 0
+  # Build the pool once, the same way the real selection does
+  start_time = time.perf_counter()
+  pool = getEligibleAlbumPool(datetime.date.today())
+  pool_time = (time.perf_counter() - start_time) * 1000.0
+  if(len(pool) == 0):
+    print("No albums are eligible for selection!")
+    return
+  # Draw repeatedly from a single seeded RNG
+  rng = random.Random(seed)
+  submitter_counts = Counter(submitter for _, submitter in pool)
+  selected_counts = Counter()
+  start_time = time.perf_counter()
+  for _ in range(draws):
+    selected_counts[drawFromAlbumPool(pool, rng, weighting)[1]] += 1
+  draw_time = (time.perf_counter() - start_time) * 1000.0
+  # Print out summary
+  print(f"Pool: {len(pool)} albums from {len(submitter_counts)} users (built in {pool_time:.2f}ms)")
+  print(f"Draws: {draws} using {weighting} weighting (avg {draw_time/draws:.4f}ms per draw)\n")
+  nicknames = dict(User.objects.filter(pk__in=submitter_counts.keys()).values_list('pk', 'nickname'))
+  print("| User | Eligible Albums | Expected % | Selected % |")
+  print("| ---- | --------------- | ---------- | ---------- |")
+  for submitter, album_count in submitter_counts.most_common():
+    expected = (100.0/len(submitter_counts)) if (weighting == "USER") else (album_count/float(len(pool)) * 100.0)
+    selected = selected_counts[submitter]/float(draws) * 100.0
+    print(f"| {nicknames.get(submitter, submitter)} | {album_count} | {expected:.2f} | {selected:.2f} |")
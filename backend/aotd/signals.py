@@ -1,17 +1,24 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.forms.models import model_to_dict
+from django.utils import timezone
+
 from .models import ( 
   Album,
+  AotdUserData,
+  DailyAlbum,
   Review,
   UserAlbumOutage
 )
-from users.models import UserAction
+from users.models import User
+from users.audit import recordUserAction
+from backend.events import publishEvent
+from backend.view_cache import bumpGeneration
 
 @receiver(post_save, sender=Album)
 def log_album_creation(sender, instance: Album, created, **kwargs):
   if created:  # Ensure it runs only on first creation
-    UserAction.objects.create(
+    recordUserAction(
       user=instance.submitted_by,
       action_type="CREATE",
       entity_type="ALBUM",
@@ -22,7 +29,7 @@ def log_album_creation(sender, instance: Album, created, **kwargs):
 @receiver(post_save, sender=Review)
 def log_review_creation(sender, instance: Review, created, **kwargs):
   if created:  # Ensure it runs only on first creation
-    UserAction.objects.create(
+    recordUserAction(
       user=instance.user,
       action_type="CREATE",
       entity_type="REVIEW",
@@ -31,13 +38,93 @@ def log_review_creation(sender, instance: Review, created, **kwargs):
       details={"album_pk": instance.album.pk, "review_pk": instance.pk}
     )
 
+@receiver(post_save, sender=Review)
+def publish_review_change(sender, instance: Review, created, **kwargs):
+  # Push the new or updated review to event stream subscribers
+  publishEvent("review", {
+    "action": "CREATE" if created else "UPDATE",
+    "review_id": instance.pk,
+    "album_id": instance.album.mbid,
+    "aotd_date": str(instance.aotd_date),
+    "user_id": instance.user_id,
+    "score": float(instance.score)
+  })
+
+@receiver(post_save, sender=DailyAlbum)
+def publish_aotd_selection(sender, instance: DailyAlbum, created, **kwargs):
+  if created:  # Only a new day's selection, not the end of day rating update
+    publishEvent("aotd", {
+      "date": str(instance.date),
+      "album_id": instance.album.mbid,
+      "title": instance.album.title,
+      "artist": instance.album.artist,
+      "cover_url": instance.album.cover_url
+    })
+
+@receiver(post_delete, sender=Review)
+def update_stats_on_review_deletion(sender, instance: Review, **kwargs):
+  from .utils import rebuildDailyAlbumRating, generateDayRatingTimeline, updateUserReviewStats
+  # Remove the review from its user's review stats and score histogram
+  updateUserReviewStats(instance, instance.score, None)
+  # Removing a review can change every value in the aggregate and the timeline, so rebuild both for the day
+  aotd = DailyAlbum.objects.filter(date=instance.aotd_date, album_id=instance.album_id).first()
+  if aotd:
+    rebuildDailyAlbumRating(aotd)
+    generateDayRatingTimeline(aotd)
+  # Let event stream subscribers drop the review
+  publishEvent("review", {
+    "action": "DELETE",
+    "review_id": instance.pk,
+    "album_id": instance.album.mbid,
+    "aotd_date": str(instance.aotd_date),
+    "user_id": instance.user_id
+  })
+
 @receiver(post_save, sender=UserAlbumOutage)
 def log_album_selection_outage_creation(sender, instance: UserAlbumOutage, created, **kwargs):
   if created:  # Ensure it runs only on first creation
-    UserAction.objects.create(
+    recordUserAction(
       user=(instance.admin_enactor if (instance.admin_enacted) else instance.user),
       action_type="CREATE",
       entity_type="ALBUM_SELECTION_OUTAGE",
       entity_id=instance.pk,
       details={"affected_user": instance.user.pk, "reason": instance.reason}
-    )
\ No newline at end of file
+    )
+
+@receiver([post_save, post_delete], sender=Album)
+@receiver([post_save, post_delete], sender=AotdUserData)
+@receiver([post_save, post_delete], sender=DailyAlbum)
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=UserAlbumOutage)
+@receiver([post_save, post_delete], sender=User)
+def bump_view_cache_generation(sender, instance, **kwargs):
+  # Cached responses built from this model's data are now out of date
+  bumpGeneration(sender.__name__)
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_month_summary_on_past_review_change(sender, instance: Review, **kwargs):
+  from .utils import invalidateMonthSummaries
+  # Ratings of closed days are stored in their month's summary, the current day is always built live
+  if(instance.aotd_date < timezone.localdate()):
+    invalidateMonthSummaries([instance.aotd_date])
+
+@receiver(post_save, sender=Album)
+def invalidate_month_summary_on_album_update(sender, instance: Album, created, **kwargs):
+  from .utils import invalidateMonthSummaries
+  if not created:  # A new album has never been selected
+    invalidateMonthSummaries(list(instance.dailyalbum_set.values_list('date', flat=True)))
+
+@receiver(post_delete, sender=DailyAlbum)
+def invalidate_month_summary_on_aotd_deletion(sender, instance: DailyAlbum, **kwargs):
+  from .utils import invalidateMonthSummaries
+  invalidateMonthSummaries([instance.date])
+
+@receiver(post_save, sender=DailyAlbum)
+def invalidate_month_summary_on_past_aotd_change(sender, instance: DailyAlbum, **kwargs):
+  from .utils import invalidateMonthSummaries
+  # Views may set the date as a datetime, compare it as a date
+  date = sender._meta.get_field('date').to_python(instance.date)
+  # Closed days are stored in their month's summary, the current day is always built live
+  if(date < timezone.localdate()):
+    invalidateMonthSummaries([date])
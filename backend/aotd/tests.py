@@ -1,3 +1,313 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import http_date
 
-# Create your tests here.
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import datetime
+import threading
+import json
+import time
+
+from users.models import User
+from .models import (
+  AotdUserData,
+  Album,
+  Review
+)
+from .utils import (
+  calculateUserReviewData,
+  rebuildUserScoreHistogram,
+  rebuildAllUserReviewStats,
+  REVIEW_STAT_FIELDS
+)
+from .views_review import getReviewStatsByMonth, getUserReviewStats
+from .views_aotd import getAOtDByMonth
+from . import musicbrainz
+from .musicbrainz import (
+  getMusicBrainzClient,
+  parseRetryAfter,
+  MusicBrainzError
+)
+from backend.view_cache import getGenerations
+
+
+class ReviewStatsByMonthTests(TestCase):
+
+  @classmethod
+  def setUpTestData(cls):
+    cls.users = []
+    for index in range(3):
+      user = User.objects.create(username=f"user{index}", nickname=f"user{index}", discord_id=f"{index}", discord_discriminator="0001", email=f"user{index}@example.com")
+      AotdUserData.objects.create(user=user)
+      cls.users.append(user)
+    cls.albums = [
+      Album.objects.create(mbid=f"mbid{index}", title=f"Album {index}", artist="Artist", cover_url="", submitted_by=cls.users[0])
+      for index in range(3)
+    ]
+    # User 0 reviews every album, user 1 reviews two, user 2 reviews one (Not enough to be the biggest lover or hater)
+    scores = [(0, 0, 8.0, True), (0, 1, 6.0, False), (0, 2, 7.0, None), (1, 0, 3.0, True), (1, 1, 4.5, True), (2, 2, 10.0, False)]
+    today = datetime.date.today()
+    for user_index, album_index, score, first_listen in scores:
+      Review.objects.create(album=cls.albums[album_index], user=cls.users[user_index], score=score, first_listen=first_listen, aotd_date=today)
+
+  def setUp(self):
+    # Responses are cached by generation, make sure the view is actually run
+    cache.clear()
+
+  def getStats(self, year: int, month: int):
+    request = RequestFactory().get(f"/aotd/getReviewStatsByMonth/{year}/{month}")
+    return json.loads(getReviewStatsByMonth(request, str(year), str(month)).content)
+
+  def test_query_count_is_constant(self):
+    # All stats come from a single query, no matter how many users or score buckets there are
+    now = timezone.localtime()
+    with self.assertNumQueries(1):
+      self.getStats(now.year, now.month)
+
+  def test_stats(self):
+    now = timezone.localtime()
+    stats = self.getStats(now.year, now.month)
+    self.assertEqual(stats['total_reviews'], 6)
+    self.assertEqual(stats['all_review_sum'], 38.5)
+    self.assertEqual(stats['all_first_listen_count'], 3)
+    self.assertEqual(stats['all_first_listen_percentage'], 50.0)
+    self.assertEqual(stats['biggest_lover_id'], "0")
+    self.assertEqual(stats['biggest_hater_id'], "1")
+    self.assertEqual(stats['user_stats']["1"]['review_average'], 3.75)
+    self.assertEqual(stats['user_stats']["2"]['first_listen_count'], 0)
+    # Score breakdowns have a bucket for every half point
+    self.assertEqual(len(stats['score_stats']), 21)
+    self.assertEqual(stats['score_stats'][9], {"score": "4.5", "count": 1, "percent": (1/6.0 * 100)})
+    self.assertEqual(stats['user_stats']["0"]['score_breakdown'][16], {"score": "8.0", "count": 1, "percent": (1/3.0 * 100)})
+
+  def test_empty_month(self):
+    stats = self.getStats(2000, 1)
+    self.assertEqual(stats['total_reviews'], 0)
+    self.assertEqual(stats['all_review_sum'], None)
+    self.assertEqual(stats['biggest_lover_id'], None)
+    self.assertEqual(stats['user_stats'], {})
+    self.assertEqual(stats['score_stats'][0], {"score": "0.0", "count": 0, "percent": 0})
+
+
+class UserReviewStatsTests(TestCase):
+
+  @classmethod
+  def setUpTestData(cls):
+    cls.user = User.objects.create(username="user0", nickname="user0", discord_id="0", discord_discriminator="0001", email="user0@example.com")
+    AotdUserData.objects.create(user=cls.user)
+    cls.albums = [
+      Album.objects.create(mbid=f"mbid{index}", title=f"Album {index}", artist="Artist", cover_url="", submitted_by=cls.user)
+      for index in range(3)
+    ]
+
+  def createReview(self, album_index: int, score: float):
+    return Review.objects.create(album=self.albums[album_index], user=self.user, score=score, aotd_date=datetime.date(2024, 1, album_index + 1))
+
+  def getStoredStats(self):
+    aotd_user = AotdUserData.objects.get(user=self.user)
+    return {field: getattr(aotd_user, field) for field in REVIEW_STAT_FIELDS + ['score_histogram']}
+
+  def assertStatsMatchRebuild(self):
+    # The incrementally updated stats must equal stats calculated from scratch
+    stored = self.getStoredStats()
+    aotd_user = AotdUserData.objects.get(user=self.user)
+    calculateUserReviewData(aotd_user)
+    rebuildUserScoreHistogram(aotd_user)
+    self.assertEqual(stored, self.getStoredStats())
+    return stored
+
+  def test_create_update_delete(self):
+    first = self.createReview(0, 6.0)
+    second = self.createReview(1, 9.0)
+    third = self.createReview(2, 3.0)
+    stats = self.assertStatsMatchRebuild()
+    self.assertEqual((stats['total_reviews'], stats['review_score_sum']), (3, 18.0))
+    self.assertEqual((stats['lowest_score_given'], stats['lowest_score_mbid']), (3.0, "mbid2"))
+    self.assertEqual((stats['highest_score_given'], stats['highest_score_mbid']), (9.0, "mbid1"))
+    self.assertEqual((stats['score_histogram'][6], stats['score_histogram'][12], stats['score_histogram'][18]), (1, 1, 1))
+    # Moving the lowest review up hands the lowest score to another review
+    third.score = 7.0
+    third.save()
+    stats = self.assertStatsMatchRebuild()
+    self.assertEqual((stats['lowest_score_given'], stats['lowest_score_mbid']), (6.0, "mbid0"))
+    self.assertEqual((stats['score_histogram'][6], stats['score_histogram'][14]), (0, 1))
+    # Raising the highest review keeps it
+    second.score = 9.5
+    second.save()
+    stats = self.assertStatsMatchRebuild()
+    self.assertEqual((stats['highest_score_given'], stats['highest_score_mbid']), (9.5, "mbid1"))
+    # Deleting the highest review hands the highest score to another review
+    second.delete()
+    stats = self.assertStatsMatchRebuild()
+    self.assertEqual((stats['total_reviews'], stats['review_score_sum']), (2, 13.0))
+    self.assertEqual((stats['highest_score_given'], stats['highest_score_mbid']), (7.0, "mbid2"))
+    # Deleting every review clears the stats
+    first.delete()
+    third.delete()
+    stats = self.assertStatsMatchRebuild()
+    self.assertEqual((stats['total_reviews'], stats['review_score_sum'], stats['average_review_score']), (0, 0, 0))
+    self.assertEqual((stats['lowest_score_date'], stats['highest_score_date']), (None, None))
+    self.assertEqual(sum(stats['score_histogram']), 0)
+
+  def test_tied_scores(self):
+    # Ties go to the oldest review, whichever order the scores got there in
+    first = self.createReview(0, 9.0)
+    second = self.createReview(1, 9.0)
+    third = self.createReview(2, 3.0)
+    stats = self.assertStatsMatchRebuild()
+    self.assertEqual((stats['highest_score_given'], stats['highest_score_mbid']), (9.0, "mbid0"))
+    self.assertEqual((stats['lowest_score_given'], stats['lowest_score_mbid']), (3.0, "mbid2"))
+    # An older review rising to tie the highest takes it over
+    first.score = 5.0
+    first.save()
+    stats = self.assertStatsMatchRebuild()
+    self.assertEqual(stats['highest_score_mbid'], "mbid1")
+    first.score = 9.0
+    first.save()
+    stats = self.assertStatsMatchRebuild()
+    self.assertEqual(stats['highest_score_mbid'], "mbid0")
+    # An older review falling to tie the lowest takes it over
+    second.score = 3.0
+    second.save()
+    stats = self.assertStatsMatchRebuild()
+    self.assertEqual((stats['lowest_score_given'], stats['lowest_score_mbid']), (3.0, "mbid1"))
+    # The bulk rebuild agrees, and invalidates the cached stats
+    generation = getGenerations(["AotdUserData"])[0]
+    with self.captureOnCommitCallbacks(execute=True):
+      rebuildAllUserReviewStats()
+    self.assertEqual(stats, self.getStoredStats())
+    self.assertNotEqual(generation, getGenerations(["AotdUserData"])[0])
+
+  def test_stats_view_without_reviews(self):
+    review = self.createReview(0, 5.0)
+    review.delete()
+    request = RequestFactory().get(f"/aotd/getUserReviewStats/{self.user.discord_id}")
+    response = getUserReviewStats(request, self.user.discord_id)
+    self.assertEqual(response.status_code, 200)
+    stats = json.loads(response.content)
+    self.assertEqual((stats['total_reviews'], stats['lowest_score_date'], stats['highest_score_date']), (0, None, None))
+
+
+class AOtDByMonthTests(TestCase):
+
+  def setUp(self):
+    # Responses are cached by generation, make sure the view is actually run
+    cache.clear()
+
+  def getMonth(self, year: str, month: str):
+    request = RequestFactory().get(f"/aotd/getAOtDByMonth/{year}/{month}")
+    return getAOtDByMonth(request, year, month)
+
+  def test_invalid_month(self):
+    for year, month in [("2024", "0"), ("2024", "13"), ("2024", "abc"), ("abc", "1"), ("0", "1"), ("99999999999999999999", "1")]:
+      self.assertEqual(self.getMonth(year, month).status_code, 400, f"{year}/{month}")
+
+  def test_empty_month(self):
+    response = self.getMonth("2000", "1")
+    self.assertEqual(response.status_code, 200)
+    self.assertIn("timestamp", json.loads(response.content))
+
+
+class MusicBrainzStubHandler(BaseHTTPRequestHandler):
+  """Local stand in for the MusicBrainz web service, answering each path with the next of its queued responses"""
+
+  # Path -> list of (status, headers, body) tuples, the last one is repeated
+  responses = {}
+  # (Monotonic time, path) of every request
+  requests = []
+
+  def do_GET(self):
+    path = self.path.split("?")[0]
+    self.requests.append((time.monotonic(), path))
+    queue = self.responses.get(path, [(404, {}, b"")])
+    status, headers, body = queue.pop(0) if (len(queue) > 1) else queue[0]
+    self.send_response(status)
+    for name, value in headers.items():
+      self.send_header(name, value)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class MusicBrainzClientTests(TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.server = ThreadingHTTPServer(("127.0.0.1", 0), MusicBrainzStubHandler)
+    threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.shutdown()
+    cls.server.server_close()
+    super().tearDownClass()
+
+  def setUp(self):
+    MusicBrainzStubHandler.responses = {}
+    MusicBrainzStubHandler.requests = []
+    # Point the process wide client at the stub server
+    patcher = mock.patch.object(musicbrainz, "MUSICBRAINZ_API_URL", f"http://127.0.0.1:{self.server.server_port}/ws/2")
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    musicbrainz._client = None
+    self.addCleanup(setattr, musicbrainz, "_client", None)
+    # Only test_rate_limit needs to wait between requests
+    self.mb_client = getMusicBrainzClient()
+    self.mb_client.bucket.rate = 1000
+
+  def release(self, title: str):
+    return (200, {"Content-Type": "application/json"}, json.dumps({"title": title}).encode())
+
+  def test_rate_limit(self):
+    for index in range(3):
+      MusicBrainzStubHandler.responses[f"/ws/2/release/mbid{index}"] = [self.release(f"Release {index}")]
+    self.mb_client.bucket.rate = 10
+    for index in range(3):
+      self.assertEqual(self.mb_client.getRelease(f"mbid{index}")['title'], f"Release {index}")
+    # Requests are spaced out by the token bucket
+    times = [request_time for request_time, _ in MusicBrainzStubHandler.requests]
+    for previous, current in zip(times, times[1:]):
+      self.assertGreaterEqual(current - previous, 0.09)
+
+  def test_cache(self):
+    MusicBrainzStubHandler.responses["/ws/2/release/mbid0"] = [self.release("First"), self.release("Second")]
+    self.assertEqual(self.mb_client.getRelease("mbid0")['title'], "First")
+    self.assertEqual(self.mb_client.getRelease("mbid0")['title'], "First")
+    self.assertEqual(len(MusicBrainzStubHandler.requests), 1)
+    # An expired response is requested again
+    self.mb_client.cache_seconds = 0
+    self.assertEqual(self.mb_client.get("release/mbid0", {'inc': "labels"})['title'], "Second")
+    self.assertEqual(self.mb_client.get("release/mbid0", {'inc': "labels"})['title'], "Second")
+    self.assertEqual(len(MusicBrainzStubHandler.requests), 3)
+
+  def test_retry(self):
+    # Retry-After may be a number of seconds or an HTTP date
+    MusicBrainzStubHandler.responses["/ws/2/release/mbid0"] = [
+      (503, {"Retry-After": "0"}, b""),
+      (503, {"Retry-After": http_date(time.time() - 60)}, b""),
+      self.release("Release"),
+    ]
+    self.assertEqual(self.mb_client.getRelease("mbid0")['title'], "Release")
+    self.assertEqual(len(MusicBrainzStubHandler.requests), 3)
+    # Giving up after the last attempt, or on a malformed response, raises MusicBrainzError
+    MusicBrainzStubHandler.responses["/ws/2/release/mbid1"] = [(503, {"Retry-After": "soon"}, b"")]
+    with mock.patch.object(self.mb_client.bucket, "acquire"), mock.patch.object(musicbrainz.time, "sleep") as sleep:
+      with self.assertRaises(MusicBrainzError) as error:
+        self.mb_client.getRelease("mbid1")
+    self.assertEqual(error.exception.status_code, 503)
+    self.assertEqual([call.args[0] for call in sleep.call_args_list], [1, 2])
+    MusicBrainzStubHandler.responses["/ws/2/release/mbid2"] = [(200, {"Content-Type": "application/json"}, b"not json")]
+    with self.assertRaises(MusicBrainzError):
+      self.mb_client.getRelease("mbid2")
+
+  def test_parse_retry_after(self):
+    self.assertEqual(parseRetryAfter("5", default=1), 5)
+    self.assertEqual(parseRetryAfter(None, default=1), 1)
+    self.assertEqual(parseRetryAfter("soon", default=2), 2)
+    self.assertAlmostEqual(parseRetryAfter(http_date(time.time() + 30), default=1), 30, delta=1.5)
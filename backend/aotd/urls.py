@@ -32,7 +32,9 @@ urlpatterns = [
   path('deleteAlbum', views_album.deleteAlbum),
   path('getAlbum/<str:mbid>', views_album.getAlbum),
   path('getAllAlbums', views_album.getAllAlbums),
+  path('getAlbumsPage', views_album.getAlbumsPage),
   path('getLastXAlbums/<int:count>', views_album.getLastXAlbums),
+  path('coverArt/<str:cover_hash>/<int:size>', views_album.getCoverArt),
   # Below URL has three variations (for different URL params)
   path('getAlbumAvgRating/<str:mbid>/<str:rounded>/<str:date>', views_album.getAlbumAvgRating),
   path('getAlbumAvgRating/<str:mbid>/<str:rounded>', views_album.getAlbumAvgRating),
@@ -66,6 +68,11 @@ urlpatterns = [
   # Below URL has two variations, for lack of userID provided
   path('getAllUserReviews/<str:user_discord_id>', views_review.getAllUserReviews),
   path('getAllUserReviews', views_review.getAllUserReviews),
+  # Below URLs have two variations, for lack of userID provided
+  path('getUserReviewsPage/<str:user_discord_id>', views_review.getUserReviewsPage),
+  path('getUserReviewsPage', views_review.getUserReviewsPage),
+  path('exportUserReviews/<str:user_discord_id>', views_review.exportUserReviews),
+  path('exportUserReviews', views_review.exportUserReviews),
   path('getReviewStatsByMonth/<str:year>/<str:month>', views_review.getReviewStatsByMonth),
   path('submitReviewReaction', views_review.submitReviewReaction),
   path('deleteReviewReaction', views_review.deleteReviewReaction),
@@ -79,6 +86,8 @@ urlpatterns = [
   path('getAlbumOfDay', views_aotd.getAlbumOfDay),
   # Command to be called by cronjob to set the album of the day
   path('setAlbumOfDay', views_aotd.setAlbumOfDay),
+  # Dry run of the album of the day selection, for testing selection fairness and timing
+  path('previewAlbumOfDay', views_aotd.previewAlbumOfDay),
   # Command to be called by cronjob to calculate selection chances on a cadence
   path('calculateAOTDChances', views_aotd.calculateAOTDChances),
   # ADMIN Command to be called by admin for special occasion album of the days
@@ -1,6 +1,9 @@
 from django.http import HttpRequest
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Sum
+from django.db.models import Sum, Count, Min, Max, F, Q, Exists, OuterRef, Prefetch, Window
+from django.db.models.functions import RowNumber
+from django.db import transaction, connection
+from django.forms.models import model_to_dict
 
 import logging
 from dotenv import load_dotenv
@@ -10,21 +13,36 @@ import base64
 import datetime
 import requests
 import pytz
-from django.utils.timezone import now
+import numpy
+import random
+import bisect
+import time
+import calendar
+from itertools import accumulate
+from collections import Counter
+from django.utils.timezone import now, localdate
 from datetime import timedelta
 
 from users.models import User
+from reactions.models import Reaction
 from .models import (
   AotdUserData,
   Album,
   DailyAlbum,
+  DailyAlbumRatingCache,
   UserAlbumOutage,
   Review,
-  ReviewHistory
+  ReviewHistory,
+  AotdSelectionAudit,
+  UserChanceCache,
+  RatingTimelineEvent,
+  MonthSummary
 )
 
+from backend.view_cache import bumpGeneration
 from users.utils import (
-  getUserObj
+  getUserObj,
+  getRequestUser
 )
 
 # Declare logging
@@ -36,9 +54,15 @@ load_dotenv(".env.production" if APP_ENV=="PROD" else ".env.local")
 
 
 def getAotdUserObj(discord_id):
-  """Return Aotd Specific User Object corresponding to discord id"""
+  """Return Aotd Specific User Object corresponding to discord id, reusing the current request's user when it matches"""
+  request_user = getRequestUser()
+  if((request_user != None) and (discord_id != None) and (request_user.discord_id == discord_id)):
+    try:
+      return request_user.aotd_data
+    except ObjectDoesNotExist:
+      return None
   try:
-    return AotdUserData.objects.get(user__discord_id=discord_id)
+    return AotdUserData.objects.select_related('user').get(user__discord_id=discord_id)
   except ObjectDoesNotExist:
     return None
 
@@ -49,8 +73,8 @@ def isUserAotdParticipant(request: HttpRequest):
   try:
     # Retrieve users discord_id from session
     discord_id = request.session.get("discord_id")
-    # Get user object from DB
-    site_user = User.objects.get(discord_id=discord_id)
+    # Get user object (Already resolved for this request by the middleware)
+    site_user = getUserObj(discord_id)
     # Return boolean of aotd connection status
     return site_user.aotd_enrolled
   except Exception as e:
@@ -63,29 +87,81 @@ def getAlbumRating(mbid, rounded=True, date: str = None):
   # Get most recent aotd date if date is not provided
   aotd_date = date if (date) else DailyAlbum.objects.filter(album__mbid=mbid).latest('date').date
   # Attempt to get aotd from database
-  aotd = DailyAlbum.objects.get(date=aotd_date)
-  # If there is already a value in the databse for this date (not an 11) then return that, else calculate rating 
-  if(aotd.rating != 11):
-    return (round(aotd.rating) if rounded else aotd.rating)
-  # Retrieve album from database
-  albumObj = aotd.album
-  # Get average review score of album
-  reviewList = Review.objects.filter(album=albumObj).filter(aotd_date=aotd_date)
-  # Return None if the album has not been reviewed
-  if(len(reviewList) == 0):
-    return None
-  review_sum = 0.0
-  for review in reviewList:
-    review_sum += float(review.score)
-  # Calculate Average
-  if(rounded):
-    rating = (round((review_sum/float(len(reviewList)))*2)/2 if len(reviewList) > 0 else 0.0)
-    # Return rating
-    return rating
-  else:
-    rating = review_sum/float(len(reviewList))
-    # Return rating
-    return rating
+  aotd = DailyAlbum.objects.select_related('rating_cache').get(date=aotd_date)
+  # Read the rating from the day's running aggregate (Returns None if the album has not been reviewed)
+  return getDailyAlbumRatingCache(aotd).getRating(rounded)
+
+
+def getDailyAlbumRatingCache(aotd: DailyAlbum):
+  """Return the rating cache for an AOtD, building it from the day's reviews if it does not exist yet"""
+  try:
+    return aotd.rating_cache
+  except DailyAlbumRatingCache.DoesNotExist:
+    return rebuildDailyAlbumRating(aotd)
+
+
+def rebuildDailyAlbumRating(aotd: DailyAlbum):
+  """Recalculate an AOtD's rating cache from scratch using a single aggregate query over the day's reviews"""
+  stats = Review.objects.filter(album_id=aotd.album_id, aotd_date=aotd.date).aggregate(
+    review_count=Count('pk'),
+    score_sum=Sum('score'),
+    score_square_sum=Sum(F('score') * F('score')),
+    score_min=Min('score'),
+    score_max=Max('score')
+  )
+  cache = DailyAlbumRatingCache(
+    aotd=aotd,
+    review_count=stats['review_count'],
+    score_sum=stats['score_sum'] or 0.0,
+    score_square_sum=stats['score_square_sum'] or 0.0,
+    score_min=stats['score_min'],
+    score_max=stats['score_max']
+  )
+  cache.refreshAverage()
+  cache.save()
+  aotd.rating_cache = cache
+  return cache
+
+
+def updateDailyAlbumRating(review: Review, old_score: float = None):
+  """
+  Apply a saved review to its AOtD's rating cache in O(1).
+  Parameters:
+  - review: The review that was just saved
+  - old_score: The score of the review before this save, None if the review was just created
+  """
+  try:
+    aotd = DailyAlbum.objects.get(date=review.aotd_date, album_id=review.album_id)
+  except DailyAlbum.DoesNotExist:
+    logger.warning(f"Review {review.pk} does not belong to an AOtD, skipping rating cache update...")
+    return
+  new_score = float(review.score)
+  # Lock the cache row so concurrent submissions for the same day are applied one at a time
+  with transaction.atomic():
+    try:
+      cache = DailyAlbumRatingCache.objects.select_for_update().get(aotd=aotd)
+    except DailyAlbumRatingCache.DoesNotExist:
+      # No cache yet, building it from the database will include this review
+      rebuildDailyAlbumRating(aotd)
+      return
+    if(old_score == None):
+      cache.review_count += 1
+      cache.score_sum += new_score
+      cache.score_square_sum += new_score ** 2
+    else:
+      old_score = float(old_score)
+      if(old_score == new_score):
+        return
+      # If the old score was one of the extremes it may no longer be, so rebuild instead of guessing the new extreme
+      if(old_score in (cache.score_min, cache.score_max)):
+        rebuildDailyAlbumRating(aotd)
+        return
+      cache.score_sum += (new_score - old_score)
+      cache.score_square_sum += (new_score ** 2) - (old_score ** 2)
+    cache.score_min = new_score if (cache.score_min == None) else min(cache.score_min, new_score)
+    cache.score_max = new_score if (cache.score_max == None) else max(cache.score_max, new_score)
+    cache.refreshAverage()
+    cache.save()
 
 
 # Check and set a user's aotd "selection_blocked_flag"
@@ -118,161 +194,662 @@ def checkSelectionFlag(aotd_user: AotdUserData):
   if(aotd_user.selection_blocked_flag != blocked):
     aotd_user.selection_blocked_flag = blocked
     logger.info(f"Changing `selection_blocked_flag` to {blocked} for {aotd_user.user.nickname}...")
-    aotd_user.save()
+    aotd_user.save(update_fields=['selection_blocked_flag'])
+
+
+# Supported ways of weighting the AOtD draw
+# - ALBUM: Every eligible album is equally likely (A user's chance grows with their number of eligible albums)
+# - USER: Every eligible submitter is equally likely, then one of their albums is picked
+SELECTION_WEIGHTINGS = ("ALBUM", "USER")
 
 
-# Iterate all reviews and review updates associate with a given AOtD, returning in a format (sorted by timestamp) showing changes to AOTD average rating over the course of the day
-# This data should be updated to be stored in the database, so as to avoid having to recalculate it every time its viewed
+def getEligibleAlbumPool(day: datetime.date):
+  """
+  Return a list of (album pk, submitter pk) tuples for every album eligible to be AOtD on the passed in day, built in a single query.
+  An album is eligible if it has not been AOtD in the last 365 days and its submitter is neither selection blocked nor under an outage.
+  """
+  one_year_ago = day - datetime.timedelta(days=365)
+  return list(
+    Album.objects.filter(submitted_by__isnull=False).filter(
+      ~Exists(DailyAlbum.objects.filter(album=OuterRef('pk'), date__gte=one_year_ago)),
+      ~Exists(AotdUserData.objects.filter(user=OuterRef('submitted_by'), selection_blocked_flag=True)),
+      ~Exists(UserAlbumOutage.objects.filter(user=OuterRef('submitted_by'), start_date__lte=day, end_date__gte=day)),
+    ).order_by('pk').values_list('pk', 'submitted_by_id')
+  )
+
+
+def drawFromAlbumPool(pool: list, rng: random.Random, weighting: str = "ALBUM"):
+  """
+  Draw one entry from a pool built by getEligibleAlbumPool using the passed in RNG, returning None if the pool is empty.
+  Builds a cumulative weight table in O(n), then each draw is a binary search in O(log n).
+  """
+  if(len(pool) == 0):
+    return None
+  if(weighting == "USER"):
+    # Split each submitter's equal share evenly across their albums
+    submitter_counts = Counter(submitter for _, submitter in pool)
+    weights = [1.0/submitter_counts[submitter] for _, submitter in pool]
+  else:
+    weights = [1.0] * len(pool)
+  cumulative = list(accumulate(weights))
+  index = bisect.bisect_right(cumulative, rng.random() * cumulative[-1])
+  # Guard against float rounding at the very top of the range
+  return pool[min(index, len(pool) - 1)]
+
+
+def selectAlbumOfDay(day: datetime.date, seed: int = None, weighting: str = "ALBUM", dry_run: bool = False, save_audit: bool = True):
+  """
+  Select an album of the day and record an AotdSelectionAudit for the draw.
+  Does not create the DailyAlbum itself, returns a tuple of (Album or None if nothing is eligible, AotdSelectionAudit).
+  Parameters:
+  - day: Date the selection is for
+  - seed: Seed for the RNG, a random seed is generated (and recorded in the audit) if not provided
+  - weighting: One of SELECTION_WEIGHTINGS
+  - dry_run: Mark the audit as a dry run, for selections that will not become an AOtD
+  - save_audit: False to return the audit without storing it
+  """
+  if(weighting not in SELECTION_WEIGHTINGS):
+    raise ValueError(f"Unknown selection weighting: {weighting}")
+  start_time = time.perf_counter()
+  # Generate a seed if one is not provided, so every draw can be reproduced from its audit
+  if(seed == None):
+    seed = random.SystemRandom().randrange(2**63)
+  pool = getEligibleAlbumPool(day)
+  selection = drawFromAlbumPool(pool, random.Random(seed), weighting)
+  album = Album.objects.select_related('submitted_by').get(pk=selection[0]) if selection else None
+  # Record the draw
+  audit = AotdSelectionAudit(
+    date=day,
+    album=album,
+    seed=seed,
+    weighting=weighting,
+    candidate_count=len(pool),
+    eligible_user_count=len(set(submitter for _, submitter in pool)),
+    dry_run=dry_run,
+    duration_ms=(time.perf_counter() - start_time) * 1000.0
+  )
+  if(save_audit):
+    audit.save()
+  logger.info(f"AOtD draw for {day} (dry run: {dry_run}): {len(pool)} candidates, seed {seed}, selected: {album}")
+  return album, audit
+
+
+# Batch version of checkSelectionFlag, updating every passed in user's "selection_blocked_flag" with two queries and a bulk update
+# Returns the list of AotdUserData objects with their flags updated in place
+def updateSelectionFlags(aotd_users: list):
+  '''Batch version of checkSelectionFlag, updating every passed in user's "selection_blocked_flag" with two queries and a bulk update'''
+  tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+  # Users under an outage tomorrow keep their current flag, same as checkSelectionFlag
+  outage_user_ids = set(UserAlbumOutage.objects.filter(start_date__lte=tomorrow, end_date__gte=tomorrow).values_list('user_id', flat=True))
+  # Get the next midnight, then subtract 2 days to determine validity of users
+  selection_timeout = tomorrow - timedelta(days=2)
+  recent_review_user_ids = set(Review.objects.filter(review_date__gte=selection_timeout).values_list('user_id', flat=True).distinct())
+  # Only write the users whose flag actually changed
+  changed_users = []
+  for aotd_user in aotd_users:
+    if(aotd_user.user_id in outage_user_ids):
+      continue
+    blocked = aotd_user.user_id not in recent_review_user_ids
+    if(aotd_user.selection_blocked_flag != blocked):
+      aotd_user.selection_blocked_flag = blocked
+      changed_users.append(aotd_user)
+  if(len(changed_users) > 0):
+    logger.info(f"Changing `selection_blocked_flag` for {len(changed_users)} users...")
+    AotdUserData.objects.bulk_update(changed_users, ['selection_blocked_flag'])
+    # bulk_update does not send signals, so invalidate cached responses here
+    bumpGeneration("AotdUserData")
+  return aotd_users
+
+
+# Calculate every user's chance of being selected for the next AOtD and store it in their UserChanceCache
+# All counts are gathered with a fixed number of grouped queries and every cache row is written in bulk, so the cost does not grow per user
+def calculateAllAOTDChances():
+  '''
+  Calculate every user's chance of being selected for the next AOtD and store it in their UserChanceCache.
+  Returns a dict with the number of users processed, the time taken, and the number of queries made.
+  '''
+  from backend.utils import QueryCounter
+  start_time = time.perf_counter()
+  query_counter = QueryCounter()
+  with connection.execute_wrapper(query_counter), transaction.atomic():
+    day = datetime.date.today()
+    tomorrow = day + datetime.timedelta(days=1)
+    one_year_ago = day - datetime.timedelta(days=365)
+    # Refresh selection flags for everyone first
+    aotd_users = updateSelectionFlags(list(AotdUserData.objects.select_related('user').order_by('pk')))
+    # Gather all per-user data in grouped queries
+    outages = {outage.user_id: outage for outage in UserAlbumOutage.objects.filter(start_date__lte=tomorrow, end_date__gte=tomorrow)}
+    submission_counts = dict(Album.objects.values_list('submitted_by').annotate(count=Count('pk')))
+    recent_pick_counts = dict(DailyAlbum.objects.filter(date__gte=one_year_ago).values_list('album__submitted_by').annotate(count=Count('pk')))
+    last_review_dates = dict(Review.objects.values_list('user').annotate(last_date=Max('aotd_date')))
+    chance_caches = {cache.aotd_user_id: cache for cache in UserChanceCache.objects.all()}
+    # Calculate percentages for every user at once
+    user_ids = [aotd_user.user_id for aotd_user in aotd_users]
+    eligible_counts = numpy.array([submission_counts.get(user_id, 0) - recent_pick_counts.get(user_id, 0) for user_id in user_ids], dtype=float)
+    is_eligible = numpy.array([(user_id not in outages) and (not aotd_user.selection_blocked_flag) for user_id, aotd_user in zip(user_ids, aotd_users)], dtype=bool)
+    total_eligible_count = eligible_counts[is_eligible].sum()
+    if(total_eligible_count > 0):
+      chances = numpy.where(is_eligible, numpy.round((eligible_counts/total_eligible_count) * 100.00, 2), 0.00)
+    else:
+      chances = numpy.zeros(len(aotd_users))
+    # Build cache objects
+    timestamp = now()
+    to_create = []
+    to_update = []
+    for index, aotd_user in enumerate(aotd_users):
+      cache = chance_caches.get(aotd_user.pk) or UserChanceCache(aotd_user=aotd_user)
+      cache.chance_percentage = float(chances[index])
+      cache.block_type = None
+      cache.outage = None
+      cache.reason = None
+      cache.last_updated = timestamp
+      if(aotd_user.user_id in outages):
+        outage = outages[aotd_user.user_id]
+        cache.block_type = "OUTAGE"
+        cache.outage = outage
+        cache.reason = f"{outage.reason}"
+      elif(aotd_user.selection_blocked_flag):
+        days_since = day - last_review_dates.get(aotd_user.user_id, day)
+        cache.block_type = "INACTIVITY"
+        cache.reason = f"Inactivity, user has not reviewed in over two days. Last review was {days_since.days} days ago."
+      (to_update if cache.pk else to_create).append(cache)
+    # Write all caches
+    UserChanceCache.objects.bulk_update(to_update, ['chance_percentage', 'block_type', 'outage', 'reason', 'last_updated'], batch_size=500)
+    UserChanceCache.objects.bulk_create(to_create, batch_size=500)
+    # Bulk writes do not send signals, so invalidate cached responses here
+    bumpGeneration("UserChanceCache")
+  out = {}
+  out['user_count'] = len(aotd_users)
+  out['duration_ms'] = (time.perf_counter() - start_time) * 1000.0
+  out['query_count'] = query_counter.count
+  logger.info(f"Calculated AOtD chances for {out['user_count']} users in {out['duration_ms']:.2f}ms using {out['query_count']} queries")
+  return out
+
+
+# Iterate all reviews and review updates associated with a given AOtD, returning unsaved RatingTimelineEvents (sorted by timestamp) showing changes to the AOtD average rating over the course of the day
+# Each review contributes one event per version that changed its score.
+# The day is built in a single sweep: two queries, a sort of all events, then a running sum and running per-user score map.
+def buildDayRatingTimeline(aotd_obj: DailyAlbum):
+  """Build the rating timeline events for an AOtD from its reviews and review history in a single O(n log n) sweep"""
+  # Retrieve all reviews for the day with their users, and their history rows for the day, in two queries
+  reviews = Review.objects.filter(album_id=aotd_obj.album_id, aotd_date=aotd_obj.date).select_related('user').prefetch_related(
+    Prefetch('history', queryset=ReviewHistory.objects.filter(aotd_date=aotd_obj.date).order_by('recorded_at'), to_attr='day_history')
+  )
+  # Collect each review's score changing versions as (timestamp, score, review) tuples
+  versions = []
+  for review in reviews:
+    review_versions = [((update.last_updated or update.review_date), float(update.score)) for update in review.day_history]
+    review_versions.append((review.last_updated, float(review.score)))
+    last_score = None
+    for timestamp, score in review_versions:
+      if(score != last_score):
+        versions.append((timestamp, score, review))
+        last_score = score
+  versions.sort(key=lambda version: version[0])
+  # Sweep events in time order, tracking each user's current score and the running sum
+  user_scores = {}
+  score_sum = 0.0
+  events = []
+  for timestamp, score, review in versions:
+    score_sum += score - user_scores.get(review.user_id, 0.0)
+    user_scores[review.user_id] = score
+    events.append(RatingTimelineEvent(
+      aotd=aotd_obj,
+      review=review,
+      user=review.user,
+      timestamp=timestamp,
+      score=score,
+      value=score_sum/len(user_scores)
+    ))
+  return events
+
+
+# Regenerate and store the rating timeline of an AOtD, replacing any events already stored for the day
 def generateDayRatingTimeline(aotd_obj: DailyAlbum):
+  """Regenerate and store the rating timeline of an AOtD"""
+  events = buildDayRatingTimeline(aotd_obj)
+  with transaction.atomic():
+    RatingTimelineEvent.objects.filter(aotd=aotd_obj).delete()
+    RatingTimelineEvent.objects.bulk_create(events)
+  return events
+
+
+# Add a review submission or score change to its AOtD's rating timeline with a single insert, without rebuilding the day
+def appendToDayRatingTimeline(review: Review, old_score: float = None):
+  """
+  Add a review submission or score change to its AOtD's rating timeline without rebuilding the day.
+  Must be called after the day's rating cache has been updated for this review.
+  Parameters:
+  - review: The review that was just saved
+  - old_score: The score of the review before this save, None if the review was just created
+  """
+  # Edits that do not change the score do not move the timeline
+  if((old_score != None) and (float(old_score) == float(review.score))):
+    return
+  try:
+    aotd = DailyAlbum.objects.select_related('rating_cache').get(date=review.aotd_date, album_id=review.album_id)
+  except DailyAlbum.DoesNotExist:
+    return
+  # The day's running average is already maintained by the rating cache
+  RatingTimelineEvent.objects.create(
+    aotd=aotd,
+    review=review,
+    user_id=review.user_id,
+    timestamp=review.last_updated,
+    score=float(review.score),
+    value=getDailyAlbumRatingCache(aotd).average_score
+  )
 
-  def createReviewObj(reviewObj: Review):
-    """Generate a review object for the timeline"""
-    return {
-      "timestamp": reviewObj.last_updated.astimezone(pytz.UTC).isoformat(),
-      "value": getAlbumPartialReviewScore(review = reviewObj), # The average value of the album by this timestamp
-      "user_id": reviewObj.user.pk,
-      "user_discord_id": reviewObj.user.discord_id,
-      "user_nickname": reviewObj.user.nickname,
-      "type": "Review",
-      "score": reviewObj.score, # The score given for this object
-      "review_id": reviewObj.pk
+
+# Convert an AOtD's timeline events (in timestamp order) to the timeline object returned to the frontend
+# A user's last event is their "Review" (final review), their first event is their "First Update" (initial review) if they changed their score later, and any events in between are an "Update".
+def serializeDayRatingTimeline(events: list):
+  """Convert an AOtD's timeline events (in timestamp order, with users loaded) to the timeline object returned to the frontend"""
+  # Count events per user so each event can be labelled in a single pass
+  remaining_events = Counter(event.user_id for event in events)
+  seen_users = set()
+  timeline = []
+  for event in events:
+    remaining_events[event.user_id] -= 1
+    if(remaining_events[event.user_id] == 0):
+      event_type = "Review"
+    elif(event.user_id not in seen_users):
+      event_type = "First Update"
+    else:
+      event_type = "Update"
+    seen_users.add(event.user_id)
+    timeline.append(event.toJSON(event_type))
+  return {"timeline": timeline}
+
+
+# Build the getAOtDByMonth entry for a single AOtD
+def buildMonthDayEntry(aotd: DailyAlbum, rating: float):
+  """Build the getAOtDByMonth entry for a single AOtD"""
+  albumObj = aotd.album
+  temp = {}
+  temp['raw_data'] = model_to_dict(albumObj)
+  temp['title'] = albumObj.title
+  temp['album_id'] = albumObj.mbid
+  temp['album_img_src'] = albumObj.getCoverUrl(250)
+  temp['album_img_full_src'] = albumObj.cover_url
+  temp['album_src'] = albumObj.album_url
+  temp['artist'] = {}
+  temp['artist']['name'] = albumObj.artist
+  temp['artist']['href'] = (albumObj.artist_url)
+  temp['submitter'] = albumObj.submitted_by.discord_id
+  temp['submitter_comment'] = albumObj.user_comment
+  temp['submission_date'] = albumObj.submission_date.strftime("%m/%d/%Y, %H:%M:%S")
+  # Attach rating of album
+  temp['rating'] = rating
+  return temp
+
+
+# Add an AOtD to a month's getAOtDByMonth payload, updating the month's stats in place.
+# Days must be added in date order. Only the submitters of the month are revisited, so adding a day does not rescan the month.
+def addDayToMonthPayload(payload: dict, aotd: DailyAlbum):
+  """Add an AOtD (the next day in date order) to a month's getAOtDByMonth payload, updating its stats"""
+  # Get album Rating from the day's rating cache
+  rating = getDailyAlbumRatingCache(aotd).getRating(rounded=False)
+  date_str = aotd.dateToCalString()
+  payload[date_str] = buildMonthDayEntry(aotd, rating)
+  # The first day of the month starts as both the highest and lowest rated day
+  if('stats' not in payload):
+    payload['stats'] = {
+      "lowest_aotd_date": date_str,
+      "highest_aotd_date": date_str,
+      "selection_counts": [],
+      "selection_total": 0,
     }
+  stats = payload['stats']
+  # Check highest and lowest ratings if rating is not null
+  if(rating):
+    highest_aotd_rating = payload[stats['highest_aotd_date']]['rating']
+    lowest_aotd_rating = payload[stats['lowest_aotd_date']]['rating']
+    if((highest_aotd_rating == None) or (rating > highest_aotd_rating)):
+      stats['highest_aotd_date'] = date_str
+    if((lowest_aotd_rating == None) or (rating < lowest_aotd_rating)):
+      stats['lowest_aotd_date'] = date_str
+  # Increment submitter selection count (Submitters stay in order of their first selection of the month)
+  submitter = aotd.album.submitted_by.discord_id
+  user_stats = {user_stat['discord_id']: user_stat for user_stat in stats['selection_counts']}
+  if(submitter not in user_stats):
+    user_stats[submitter] = {"discord_id": submitter, "count": 0, "percent": 0, "selection_dates": []}
+    stats['selection_counts'].append(user_stats[submitter])
+  user_stats[submitter]['count'] += 1
+  user_stats[submitter]['selection_dates'].append(date_str)
+  stats['selection_total'] += 1
+  # Percentages change for every submitter as the month grows
+  for user_stat in stats['selection_counts']:
+    user_stat['percent'] = ((user_stat['count']/float(stats['selection_total'])) * 100)
+  # Provide the above list as a object as well
+  stats['user_stats'] = user_stats
+  return payload
+
+
+# Return the MonthSummary for a month, adding any days that have closed since it was last updated
+def getMonthSummary(year: int, month: int):
+  """
+  Return the MonthSummary for a month, bringing it up to date through the last closed day (yesterday).
+  Closed months are returned as stored. A summary is built from scratch the first time a month is requested.
+  """
+  first_day = datetime.date(year, month, 1)
+  last_day = datetime.date(year, month, calendar.monthrange(year, month)[1])
+  # The current day is still open, so only days up to yesterday are stored
+  through = min(last_day, localdate() - timedelta(days=1))
+  if(through < first_day):
+    # No days of this month have closed yet
+    return MonthSummary(year=year, month=month)
+  # Closed and up to date summaries are read without taking a lock
+  summary = MonthSummary.objects.filter(year=year, month=month).first()
+  if((summary != None) and (summary.closed or ((summary.through_date != None) and (summary.through_date >= through)))):
+    return summary
+  with transaction.atomic():
+    summary, created = MonthSummary.objects.select_for_update().get_or_create(year=year, month=month)
+    # Another request may have updated the summary while this one waited for the lock
+    if(summary.closed or ((summary.through_date != None) and (summary.through_date >= through))):
+      return summary
+    # Add the days that closed since the last update (Normally just yesterday, or the whole month for a new summary)
+    start = (summary.through_date + timedelta(days=1)) if (summary.through_date != None) else first_day
+    new_days = DailyAlbum.objects.filter(date__gte=start, date__lte=through).select_related('album__submitted_by', 'rating_cache').order_by('date')
+    for aotd in new_days:
+      addDayToMonthPayload(summary.payload, aotd)
+    summary.through_date = through
+    summary.closed = (through == last_day)
+    summary.save()
+    logger.info(f"Updated {summary} through {through}")
+  return summary
+
 
-  def createUpdateObj(updateObj: ReviewHistory, is_first_submission: bool = False):
-    """Generate an update object for the timeline"""
-    return {
-      "timestamp": updateObj.last_updated.astimezone(pytz.UTC).isoformat(),
-      "value": getAlbumPartialReviewScore(update = updateObj), # The average value of the album by this timestamp
-      "user_id": updateObj.review.user.pk,
-      "user_discord_id": updateObj.review.user.discord_id,
-      "user_nickname": updateObj.review.user.nickname,
-      "type": "First Update" if is_first_submission else "Update",
-      "score": updateObj.score, # The score given for this object
-      "review_id": updateObj.review.pk
+# Delete the stored summaries of the months containing the passed in dates, so they are rebuilt on their next request
+def invalidateMonthSummaries(dates: list):
+  """Delete the stored summaries of the months containing the passed in dates"""
+  months = set((date.year, date.month) for date in dates)
+  for year, month in months:
+    MonthSummary.objects.filter(year=year, month=month).delete()
+
+
+# Calculate review statistics for a set of reviews (e.g. a month) from a single query, in the getReviewStatsByMonth response format
+# Reviews are loaded as compact NumPy arrays, then every total, per user average and per user score histogram is calculated with vectorized operations.
+def calculateReviewStats(reviews):
+  """
+  Calculate review statistics for a queryset of reviews using one query.
+  Returns totals, first listen stats, per user stats (with score histograms), the biggest lover and hater, and the score breakdown.
+  """
+  # Retrieve only the needed columns of every review, in a single query
+  rows = list(reviews.order_by('pk').values_list('user__discord_id', 'album_id', 'score', 'first_listen'))
+  review_total = len(rows)
+  user_ids = [row[0] for row in rows]
+  album_ids = numpy.array([row[1] for row in rows], dtype=numpy.int64)
+  scores = numpy.array([row[2] for row in rows], dtype=numpy.float64)
+  first_listens = numpy.array([row[3] == True for row in rows], dtype=numpy.float64)
+  # Map users to indexes, keeping users in order of their first review
+  unique_users, first_index, user_index = numpy.unique(numpy.array(user_ids, dtype=object), return_index=True, return_inverse=True)
+  user_order = numpy.argsort(first_index)
+  user_count = len(unique_users)
+  # Score buckets are half points from 0 to 10, scores off the half point grid do not count towards any bucket
+  buckets = scores * 2
+  on_grid = (buckets == numpy.round(buckets)) & (buckets >= 0) & (buckets <= 20)
+  bucket_index = buckets[on_grid].astype(numpy.int64)
+  score_counts = numpy.bincount(bucket_index, minlength=21)
+  user_score_counts = numpy.zeros((user_count, 21), dtype=numpy.int64)
+  numpy.add.at(user_score_counts, (user_index[on_grid], bucket_index), 1)
+  # Per user totals
+  user_review_counts = numpy.bincount(user_index, minlength=user_count)
+  user_review_sums = numpy.bincount(user_index, weights=scores, minlength=user_count)
+  user_first_listen_counts = numpy.bincount(user_index, weights=first_listens, minlength=user_count)
+  # Only users with a review count of at least a third of the overall album count can be the biggest lover or hater
+  album_count = len(numpy.unique(album_ids))
+  # Summed in review order, like the database aggregate
+  review_sum = float(sum(scores.tolist())) if (review_total != 0) else None
+  first_listen_total = int(first_listens.sum())
+  out = {
+    "total_reviews": review_total,
+    "all_review_sum": review_sum,
+    "all_review_average": (review_sum/float(review_total)) if (review_total != 0) else 0,
+    "all_first_listen_count": first_listen_total,
+    "all_first_listen_percentage": (first_listen_total/float(review_total) * 100) if (review_total != 0) else 0,
+    "biggest_lover_id": None,
+    "biggest_hater_id": None,
+    "user_stats": {},
+    "score_stats": [],
+  }
+  biggest_lover = None
+  biggest_hater = None
+  for index in user_order:
+    user_id = unique_users[index]
+    review_count = int(user_review_counts[index])
+    average_score = float(user_review_sums[index])/review_count
+    first_listen_count = int(user_first_listen_counts[index])
+    if(review_count > (album_count / 3)):
+      if((biggest_lover == None) or (biggest_lover[1] < average_score)):
+        biggest_lover = (user_id, average_score)
+      if((biggest_hater == None) or (biggest_hater[1] > average_score)):
+        biggest_hater = (user_id, average_score)
+    out['user_stats'][user_id] = {
+      "discord_id": user_id,
+      "review_count": review_count,
+      "review_sum": float(user_review_sums[index]),
+      "review_average": average_score,
+      "first_listen_count": first_listen_count,
+      "first_listen_percentage": (first_listen_count/float(review_count) * 100),
+      "score_breakdown": [
+        {
+          "score": f"{bucket/2.0}",
+          "count": int(user_score_counts[index][bucket]),
+          "percent": (int(user_score_counts[index][bucket])/float(review_count) * 100)
+        }
+        for bucket in range(21)
+      ]
     }
-  
-  def addToUserStack(trackingObj, updateObj: ReviewHistory):
-    '''
-    Add to user stack and return true if this update changes a users score. (Updates that have no previous version also return true as they altered score.s)
-    Return Data: (Updated Tracking Object, Boolean showing if update was a changing update, Boolean showing if this was the first submission)
-    '''
-    tracking: dict = trackingObj
-    if updateObj.review.user.nickname in trackingObj.keys():
-      status = (tracking[updateObj.review.user.nickname][-1].score != updateObj.score)
-      tracking[updateObj.review.user.nickname].append(updateObj)
-      return tracking, status, False
+  out['biggest_lover_id'] = biggest_lover[0] if biggest_lover else None
+  out['biggest_hater_id'] = biggest_hater[0] if biggest_hater else None
+  # Breakdown of all scores by count
+  for bucket in range(21):
+    out['score_stats'].append({
+      "score": f"{bucket/2.0}",
+      "count": int(score_counts[bucket]),
+      "percent": (int(score_counts[bucket])/float(review_total) * 100) if (review_total != 0) else 0
+    })
+  return out
+
+
+# Prepare a queryset of reviews for serialization with Review.toJSON, without per review queries
+# Users and albums (with submitters) are joined, and every reaction of every review (with its user) is fetched in one query and grouped in memory.
+def prefetchReviewsForJSON(reviews):
+  """Prepare a queryset of reviews for Review.toJSON: users and albums are joined, and all reactions are fetched in one query"""
+  return reviews.select_related('user', 'album__submitted_by').prefetch_related(
+    Prefetch('reactions', queryset=Reaction.objects.select_related('user').order_by('pk'))
+  )
+
+
+# Serialize a queryset of reviews using a constant number of queries
+def serializeReviews(reviews, full: bool = False, include_raw_album: bool = True):
+  """Serialize a queryset of reviews with Review.toJSON using a constant number of queries (two, or one if there are no reviews)"""
+  if(not include_raw_album):
+    # Leave the raw album data in the database instead of loading and dropping it
+    reviews = reviews.defer('album__raw_data')
+  return [review.toJSON(full=full, include_raw_album=include_raw_album) for review in prefetchReviewsForJSON(reviews)]
+
+
+# Number of half point score buckets (0 to 10)
+SCORE_BUCKET_COUNT = 21
+
+def scoreToBucket(score: float):
+  """Return the histogram bucket of a score, or None if the score is not on a half point"""
+  if(score == None):
+    return None
+  bucket = float(score) * 2
+  if((bucket != round(bucket)) or (bucket < 0) or (bucket >= SCORE_BUCKET_COUNT)):
+    return None
+  return int(bucket)
+
+
+# Recalculate a user's score histogram with a single aggregate query over their reviews
+def rebuildUserScoreHistogram(aotd_user: AotdUserData):
+  """Recalculate and store a user's score histogram with a single aggregate query over their reviews"""
+  histogram = [0] * SCORE_BUCKET_COUNT
+  for row in Review.objects.filter(user_id=aotd_user.user_id).values('score').annotate(count=Count('pk')).order_by():
+    bucket = scoreToBucket(row['score'])
+    if(bucket != None):
+      histogram[bucket] += row['count']
+  aotd_user.score_histogram = histogram
+  aotd_user.save(update_fields=['score_histogram'])
+  return histogram
+
+
+# Return a user's score histogram, building it if it has not been built yet
+def getUserScoreHistogram(aotd_user: AotdUserData):
+  """Return a user's score histogram (a count of reviews for each half point score), building it if needed"""
+  if(aotd_user.score_histogram == None):
+    return rebuildUserScoreHistogram(aotd_user)
+  return aotd_user.score_histogram
+
+
+# AotdUserData fields holding a user's review stats
+REVIEW_STAT_FIELDS = ['total_reviews', 'review_score_sum', 'average_review_score', 'lowest_score_given', 'lowest_score_mbid', 'lowest_score_date', 'highest_score_given', 'highest_score_mbid', 'highest_score_date']
+
+# Find a user's lowest or highest scored review with a single indexed lookup
+def getUserExtremeReview(user_id: int, highest: bool = False):
+  """Return the score, album mbid and AOtD date of a user's lowest (or highest) scored review, or None if they have no reviews. Ties go to the oldest review."""
+  ordering = ['-score', 'pk'] if highest else ['score', 'pk']
+  return Review.objects.filter(user_id=user_id).order_by(*ordering).values('score', 'album__mbid', 'aotd_date').first()
+
+
+# Set the lowest or highest score stats of a user's data from a review (or clear them)
+def setUserExtremeReview(aotd_user: AotdUserData, extreme: dict, highest: bool = False):
+  """Store a review (as returned by getUserExtremeReview) as a user's lowest (or highest) score, None clears it"""
+  prefix = "highest" if highest else "lowest"
+  setattr(aotd_user, f"{prefix}_score_given", extreme['score'] if extreme else None)
+  setattr(aotd_user, f"{prefix}_score_mbid", extreme['album__mbid'] if extreme else None)
+  setattr(aotd_user, f"{prefix}_score_date", extreme['aotd_date'] if extreme else None)
+
+
+# Apply a review's change in score to its user's review stats and score histogram in O(1)
+def updateUserReviewStats(review: Review, old_score: float = None, new_score: float = None):
+  """
+  Apply a review's change in score to its user's review stats and score histogram in O(1).
+  The lowest and highest scores are only looked up again when the review holding one of them is removed or moves away from it.
+  Must be called after the review has been saved (or deleted).
+  Parameters:
+  - review: The review that changed
+  - old_score: The score before the change, None if the review was just created
+  - new_score: The score after the change, None if the review was deleted
+  """
+  with transaction.atomic():
+    aotd_user = AotdUserData.objects.select_for_update().filter(user_id=review.user_id).first()
+    if(aotd_user == None):
+      return
+    # Unbuilt stats are built from the reviews as they are now, which already includes this change
+    if(aotd_user.total_reviews == None):
+      calculateUserReviewData(aotd_user)
+      changed_fields = []
     else:
-      tracking[updateObj.review.user.nickname] = [updateObj]
-      return tracking, True, True
-
-  # Retrieve Album and date of aotd
-  album = aotd_obj.album
-  date = aotd_obj.date
-  # Get all album reviews
-  aotd_reviews_list = list(Review.objects.filter(album=album, aotd_date=date).order_by('last_updated'))
-  # Get all album review updates
-  review_updates_list = list(ReviewHistory.objects.filter(review__in=aotd_reviews_list, aotd_date=date).order_by('recorded_at'))
-  # Declare output object, which is a list of values in timestamp order
-  out = []
-  # Implement a two pointer loop to ensure all of the data is captured from both querysets
-  review_p = 0
-  update_p = 0
-  # Track a list of users and their updates, to more efficiently get changes
-  users_obj = {}
-  # Iterate all events
-  while((review_p != len(aotd_reviews_list)) or (update_p != len(review_updates_list))):
-    curr_review = aotd_reviews_list[review_p] if (review_p != len(aotd_reviews_list)) else None
-    curr_update = review_updates_list[update_p] if (update_p != len(review_updates_list)) else None
-    # Determine the timestamps of each and store the earlier one in the list, then increment
-    if((curr_update == None) or (curr_review.last_updated < curr_update.recorded_at)):
-      out.append(createReviewObj(curr_review))
-      review_p += 1
-    elif((curr_review == None) or (curr_update.recorded_at < curr_review.last_updated)):
-      users_obj, status, first_update = addToUserStack(users_obj, curr_update)
-      # Only add an update to the list if it changed the score
-      if(status): 
-        out.append(createUpdateObj(curr_update, first_update))
-      update_p += 1
-    else: # In the rare event of a simultaneous submission, attach both and increment
-      # Add review object
-      out.append(createReviewObj(curr_review))
-      review_p += 1
-      # Add Update object
-      users_obj, status, first_update = addToUserStack(users_obj, curr_update)
-      # Only add an update to the list if it changed the score
-      if(status): 
-        out.append(createUpdateObj(curr_update, first_update))
-      update_p += 1
-  # Save the object's timeline data
-  aotd_obj.rating_timeline={"timeline": out}
-  aotd_obj.save()
-
-
-# Get the average review score of an album up to a timestamp on any given day
-# Allows retrieval of a score partially thru the day (for timeline purposes)
-def getAlbumPartialReviewScore(album: Album = None, timestamp: datetime.datetime = None, review: Review = None, update: ReviewHistory = None):
-  if(review):
-    timestamp = review.last_updated
-    album = review.album
-    aotd_date = review.aotd_date
-  elif(update):
-    timestamp = update.last_updated
-    album = update.review.album
-    aotd_date = update.aotd_date
-  else:
-    timestamp = timestamp
-    album = album
-    aotd_date = DailyAlbum.objects.get(album=album, date=timestamp.date())
-  # After establishing timestamp values, get all reviews that apply to this album
-  reviews = Review.objects.filter(album=album, aotd_date=aotd_date).filter(review_date__lte=timestamp)
-  # Iterate reviews and get the most recent applicable score, add it to the sum, increment count, and move on.
-  count = 0.0
-  sum = 0.0
-  for review in reviews:
-    if(review.last_updated == review.review_date):
-      sum += review.score
-    elif(review.last_updated > timestamp):
-      # Get most recent applicable update
-      update = review.history.all().filter(last_updated__lte=timestamp).order_by('-last_updated').first()
-      sum += update.score
-    else: # By reaching this point, a review must have had updates but the final review is still below the timestamp
-      sum += review.score
-    count += 1
-  # Calculate average
-  average = (sum/count)
-  return average
-
-# Update a user review's stats in database
-# First step in an attempt at optimizing user review stat retrieval
+      # Apply the change to the count and sum
+      if(old_score == None):
+        aotd_user.total_reviews += 1
+      if(new_score == None):
+        aotd_user.total_reviews -= 1
+      aotd_user.review_score_sum += (new_score or 0) - (old_score or 0)
+      aotd_user.average_review_score = (aotd_user.review_score_sum / aotd_user.total_reviews) if (aotd_user.total_reviews > 0) else 0
+      # A user only reviews an album once per day, so the album and date identify the review holding an extreme
+      mbid = review.album.mbid
+      for highest in (False, True):
+        prefix = "highest" if highest else "lowest"
+        current_score = getattr(aotd_user, f"{prefix}_score_given")
+        holds_extreme = ((getattr(aotd_user, f"{prefix}_score_mbid") == mbid) and (getattr(aotd_user, f"{prefix}_score_date") == review.aotd_date))
+        if(holds_extreme and ((new_score == None) or (new_score != current_score))):
+          # This review held the extreme and moved (or was removed), another review may hold it now
+          if((new_score != None) and ((new_score > current_score) if highest else (new_score < current_score))):
+            setUserExtremeReview(aotd_user, {"score": new_score, "album__mbid": mbid, "aotd_date": review.aotd_date}, highest)
+          else:
+            setUserExtremeReview(aotd_user, getUserExtremeReview(aotd_user.user_id, highest), highest)
+        elif((new_score != None) and ((current_score == None) or ((new_score > current_score) if highest else (new_score < current_score)))):
+          # This review beats the current extreme
+          setUserExtremeReview(aotd_user, {"score": new_score, "album__mbid": mbid, "aotd_date": review.aotd_date}, highest)
+        elif((new_score != None) and (not holds_extreme) and (new_score == current_score)):
+          # This review ties the current extreme, which goes to the older of the two
+          setUserExtremeReview(aotd_user, getUserExtremeReview(aotd_user.user_id, highest), highest)
+      changed_fields = list(REVIEW_STAT_FIELDS)
+    # Apply the change to the score histogram, an unbuilt histogram is built from the reviews as they are now
+    if(aotd_user.score_histogram == None):
+      rebuildUserScoreHistogram(aotd_user)
+    else:
+      old_bucket = scoreToBucket(old_score)
+      new_bucket = scoreToBucket(new_score)
+      if(old_bucket != new_bucket):
+        if(old_bucket != None):
+          aotd_user.score_histogram[old_bucket] -= 1
+        if(new_bucket != None):
+          aotd_user.score_histogram[new_bucket] += 1
+        changed_fields.append('score_histogram')
+    # Write the stats and histogram together
+    if(changed_fields):
+      aotd_user.save(update_fields=changed_fields)
+
+
+# Recalculate a user's review stats from all of their reviews
 def calculateUserReviewData(aotdUserObj: AotdUserData):
-  user = aotdUserObj.user
-  # Get query set of all reviews left by user
-  all_reviews = Review.objects.filter(user=user)
-  # Get a count of total reviews 
-  total_reviews = all_reviews.count()
-  # Get the score of all reviews
-  review_sum = all_reviews.aggregate(Sum('score'))['score__sum']
+  """Recalculate and store a user's review stats from all of their reviews (Used for users whose stats have not been built yet)"""
+  all_reviews = Review.objects.filter(user_id=aotdUserObj.user_id)
+  # Get a count of total reviews and the sum of their scores
+  totals = all_reviews.aggregate(total_reviews=Count('pk'), review_sum=Sum('score'))
+  aotdUserObj.total_reviews = totals['total_reviews']
+  aotdUserObj.review_score_sum = totals['review_sum'] or 0
   # Calculate average review score
-  average_review_score = review_sum/total_reviews
-  # Get lowest scored album
-  lowest_review = all_reviews.order_by('score').first()
-  lowest_review_score = lowest_review.score
-  lowest_review_mbid = lowest_review.album.mbid
-  lowest_review_date =lowest_review.aotd_date
-  # Get highest scored album
-  highest_review = all_reviews.order_by('score').last()
-  highest_review_score = highest_review.score
-  highest_review_mbid = highest_review.album.mbid
-  highest_review_date =highest_review.aotd_date
-  # Update user data
-  aotdUserObj.total_reviews = total_reviews
-  aotdUserObj.review_score_sum = review_sum
-  aotdUserObj.average_review_score = average_review_score
-  aotdUserObj.lowest_score_given = lowest_review_score
-  aotdUserObj.lowest_score_mbid = lowest_review_mbid
-  aotdUserObj.lowest_score_date = lowest_review_date
-  aotdUserObj.highest_score_given = highest_review_score
-  aotdUserObj.highest_score_mbid = highest_review_mbid
-  aotdUserObj.highest_score_date = highest_review_date
-  # Save user data
-  aotdUserObj.save()
\ No newline at end of file
+  aotdUserObj.average_review_score = (aotdUserObj.review_score_sum / aotdUserObj.total_reviews) if (aotdUserObj.total_reviews > 0) else 0
+  # Get lowest and highest scored albums
+  setUserExtremeReview(aotdUserObj, getUserExtremeReview(aotdUserObj.user_id, highest=False), highest=False)
+  setUserExtremeReview(aotdUserObj, getUserExtremeReview(aotdUserObj.user_id, highest=True), highest=True)
+  # Save user data (Only the review stats, other fields such as the score histogram are maintained separately)
+  aotdUserObj.save(update_fields=REVIEW_STAT_FIELDS)
+
+
+# Recalculate the review stats and score histograms of every user in bulk
+def rebuildAllUserReviewStats():
+  """
+  Recalculate the review stats and score histogram of every user from their reviews, for repairing drifted stats.
+  Uses a fixed number of queries no matter how many users or reviews there are. Returns the number of users updated.
+  """
+  # Count and sum of every user's reviews
+  totals = {
+    row['user_id']: row
+    for row in Review.objects.values('user_id').annotate(total_reviews=Count('pk'), review_sum=Sum('score')).order_by()
+  }
+  # Lowest and highest scored review of every user, ranked within each user the same way getUserExtremeReview orders them
+  extremes = (
+    Review.objects
+      .annotate(
+        low_rank=Window(RowNumber(), partition_by=[F('user_id')], order_by=[F('score').asc(), F('pk').asc()]),
+        high_rank=Window(RowNumber(), partition_by=[F('user_id')], order_by=[F('score').desc(), F('pk').asc()])
+      )
+      .filter(Q(low_rank=1) | Q(high_rank=1))
+      .values('user_id', 'score', 'album__mbid', 'aotd_date', 'low_rank', 'high_rank')
+  )
+  lowest = {}
+  highest = {}
+  for row in extremes:
+    if(row['low_rank'] == 1):
+      lowest[row['user_id']] = row
+    if(row['high_rank'] == 1):
+      highest[row['user_id']] = row
+  # Score histogram of every user
+  histograms = {}
+  for row in Review.objects.values('user_id', 'score').annotate(count=Count('pk')).order_by():
+    bucket = scoreToBucket(row['score'])
+    if(bucket != None):
+      histograms.setdefault(row['user_id'], [0] * SCORE_BUCKET_COUNT)[bucket] += row['count']
+  # Apply to every user's data and write it back in batches
+  aotd_users = list(AotdUserData.objects.all())
+  for aotd_user in aotd_users:
+    user_totals = totals.get(aotd_user.user_id, {"total_reviews": 0, "review_sum": 0})
+    aotd_user.total_reviews = user_totals['total_reviews']
+    aotd_user.review_score_sum = user_totals['review_sum'] or 0
+    aotd_user.average_review_score = (aotd_user.review_score_sum / aotd_user.total_reviews) if (aotd_user.total_reviews > 0) else 0
+    setUserExtremeReview(aotd_user, lowest.get(aotd_user.user_id), highest=False)
+    setUserExtremeReview(aotd_user, highest.get(aotd_user.user_id), highest=True)
+    aotd_user.score_histogram = histograms.get(aotd_user.user_id, [0] * SCORE_BUCKET_COUNT)
+  with transaction.atomic():
+    AotdUserData.objects.bulk_update(aotd_users, fields=REVIEW_STAT_FIELDS + ['score_histogram'], batch_size=500)
+  # bulk_update does not send signals, so invalidate cached responses here
+  bumpGeneration("AotdUserData")
+  return len(aotd_users)
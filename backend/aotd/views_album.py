@@ -1,28 +1,41 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.core.exceptions import ObjectDoesNotExist
 from django.forms.models import model_to_dict
 from django.utils import timezone
+from django.db.models import OuterRef, Subquery, Q
 import numpy
 
 from .utils import (
   getAlbumRating,
+  getDailyAlbumRatingCache,
 )
 from users.utils import getUserObj
 from .models import (
   AotdUserData,
   Album,
   Review,
-  DailyAlbum
+  DailyAlbum,
+  DailyAlbumRatingCache
+)
+from .musicbrainz import queueTrackListFetch
+from .cover_art import (
+  queueCoverArtFetch,
+  coverArtFilePath,
+  coverArtOffloadUri,
+  COVER_ART_SIZES
 )
 
 
+from backend.responses import JsonResponse
+from backend.view_cache import cachedView
+from backend.file_serving import serveFile
 import logging
 from dotenv import load_dotenv
 import os
 import json
 import datetime
 import pytz
-import requests
+import base64
 
 # Declare logging
 logger = logging.getLogger('django')
@@ -43,6 +56,61 @@ def parseReleaseDate(date_str):
   else:
     return None
 
+## Helper Method
+def getAlbumListQuery():
+  """
+  Return a queryset of albums annotated with the date of their most recent AOtD (up to today) and that day's rating.
+  Submitters are joined in, so serializing any number of rows from this queryset costs a single query.
+  """
+  today = datetime.datetime.now(tz=pytz.timezone('America/Chicago')).date()
+  last_aotd = DailyAlbum.objects.filter(album=OuterRef('pk'), date__lte=today).order_by('-date')
+  return Album.objects.select_related('submitted_by').annotate(
+    last_aotd_date=Subquery(last_aotd.values('date')[:1]),
+    last_aotd_rating=Subquery(last_aotd.values('rating_cache__average_score')[:1]),
+  )
+
+
+## Helper Method
+def buildAlbumListObj(album: Album):
+  """Build the album list entry for an album retrieved with getAlbumListQuery"""
+  albumObj = {}
+  albumObj['title'] = album.title
+  albumObj['album_id'] = album.mbid
+  albumObj['album_img_src'] = album.getCoverUrl(250)
+  albumObj['album_img_full_src'] = album.cover_url
+  albumObj['album_src'] = album.album_url
+  albumObj['artist'] = {}
+  albumObj['artist']['name'] = album.artist
+  albumObj['artist']['href'] = (album.artist_url if album.artist_url != "" else album.raw_data['album']['artists'][0]['external_urls']['aotd'])
+  albumObj['submitter'] = album.submitted_by.discord_id
+  albumObj['submitter_avatar_url'] = album.submitted_by.get_avatar_url()
+  albumObj['submitter_nickname'] = album.submitted_by.nickname
+  albumObj['submitter_comment'] = album.user_comment
+  albumObj['submission_date'] = album.submission_date.strftime("%m/%d/%Y, %H:%M:%S")
+  albumObj['release_date_str'] = album.release_date_str
+  albumObj['release_date'] = album.release_date.strftime("%m/%d/%Y, %H:%M:%S") if album.release_date else None
+  # Most recent AOtD date and the rating from that day (None if the album has not been AOtD)
+  albumObj['last_aotd'] = album.last_aotd_date
+  albumObj['rating'] = album.last_aotd_rating
+  return albumObj
+
+
+## Helper Method
+def encodeAlbumCursor(album: Album):
+  """Encode the keyset position of an album (submission date and pk) as an opaque cursor string"""
+  return base64.urlsafe_b64encode(f"{album.submission_date.isoformat()}|{album.pk}".encode()).decode()
+
+
+## Helper Method
+def decodeAlbumCursor(cursor: str):
+  """Decode a cursor created by encodeAlbumCursor, returning a (submission_date, pk) tuple. Raises ValueError on a malformed cursor."""
+  try:
+    submission_date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.datetime.fromisoformat(submission_date), int(pk)
+  except Exception as e:
+    raise ValueError(f"Malformed album cursor: {cursor}") from e
+
+
 ## =========================================================================================================================================================================================
 ## ALBUM METHODS
 ## =========================================================================================================================================================================================
@@ -148,18 +216,6 @@ def submitAlbum(request: HttpRequest):
   except ObjectDoesNotExist as e:
     # Get user from database
     user = getUserObj(request.session.get('discord_id'))
-    # Query musicbrainz to get track list
-    # Build Tracks Url
-    url = f"https://musicbrainz.org/ws/2/release/{reqBody['album']['id']}"
-    params = {
-      'inc': 'recordings',
-      'fmt': 'json'
-    }
-    headers = {
-      'User-Agent': 'CordPal/0.0.1 ( www.cordpal.app )'
-    }
-    response = requests.get(url, params=params, headers=headers)
-    data = response.json()
     # Declare new album object
     newAlbum = Album(
       mbid=reqBody['album']['id'],
@@ -174,10 +230,12 @@ def submitAlbum(request: HttpRequest):
       release_date=parseReleaseDate(reqBody['album']['date']),
       release_date_str=reqBody['album']['date'],
       raw_data=reqBody['album'],
-      track_list={ 'tracks': data['media'][0]['tracks'] },
     )
     # Save new album data
     newAlbum.save()
+    # Track list and cover art are fetched in the background, so the submission does not wait on them
+    queueTrackListFetch(newAlbum.mbid)
+    queueCoverArtFetch(newAlbum.mbid)
     return HttpResponse(status=200)
 
 
@@ -237,7 +295,9 @@ def getAlbum(request: HttpRequest, mbid: str):
     out['title'] = albumObj.title
     out['album_id'] = albumObj.mbid
     out['mbid'] = albumObj.mbid
-    out['album_img_src'] = albumObj.cover_url
+    out['album_img_src'] = albumObj.getCoverUrl(500)
+    out['album_img_full_src'] = albumObj.cover_url
+    out['album_img_thumbnails'] = albumObj.getCoverThumbnails()
     out['album_src'] = albumObj.album_url
     out['artist'] = {}
     out['artist']['name'] = albumObj.artist
@@ -265,43 +325,63 @@ def getAllAlbums(request: HttpRequest):
     res = HttpResponse("Method not allowed")
     res.status_code = 405
     return res
-  # Retrieve all albums from database
-  albumObj = Album.objects.all()
-  # Declare list of albums
-  albumList = []
-  # Iterate through albums
-  for album in albumObj:
-    # Build album object
-    albumObj = {}
-    albumObj['title'] = album.title
-    albumObj['album_id'] = album.mbid
-    albumObj['album_img_src'] = album.cover_url
-    albumObj['album_src'] = album.album_url
-    albumObj['artist'] = {}
-    albumObj['artist']['name'] = album.artist
-    albumObj['artist']['href'] = (album.artist_url if album.artist_url != "" else album.raw_data['album']['artists'][0]['external_urls']['aotd'])
-    albumObj['submitter'] = album.submitted_by.discord_id
-    albumObj['submitter_avatar_url'] = album.submitted_by.get_avatar_url()
-    albumObj['submitter_nickname'] = album.submitted_by.nickname
-    albumObj['submitter_comment'] = album.user_comment
-    albumObj['submission_date'] = album.submission_date.strftime("%m/%d/%Y, %H:%M:%S")
-    albumObj['release_date_str'] = album.release_date_str
-    albumObj['release_date'] = album.release_date.strftime("%m/%d/%Y, %H:%M:%S") if album.release_date else None
-    # Check if album has been aotd
-    try:
-      # Get most recent AOtD date
-      albumObj['last_aotd'] = DailyAlbum.objects.filter(album=album).filter(date__lte=datetime.datetime.now(tz=pytz.timezone('America/Chicago'))).latest('date').date # Return most recent instance of album
-      # Get most recent review rating from AOtD
-      albumObj['rating'] = getAlbumRating(mbid=album.mbid, rounded=False, date=albumObj['last_aotd'])
-    except:
-      albumObj['last_aotd'] = None
-      albumObj['rating'] = None 
-    # Append to List
-    albumList.append(albumObj)
+  # Retrieve all albums, with their last AOtD date and rating, in a single query
+  albumList = [buildAlbumListObj(album) for album in getAlbumListQuery()]
   # Return final object
   return JsonResponse({"timestamp": datetime.datetime.now(), "albums_list": albumList})
 
 
+###
+# Get a single page of albums from the album of the day pool, newest submissions first.
+# Uses keyset pagination so every page costs the same single query no matter how large the pool is.
+# Optional Query Params:
+# - cursor: Value of "next_cursor" from the previous page (omit for the first page)
+# - limit: Page size (Default 50, Max 200)
+# - submitter: Discord ID of the submitting user
+# - search: Case insensitive match against album title or artist
+# - picked: "true" to only return albums that have been AOtD, "false" for albums that have not
+###
+def getAlbumsPage(request: HttpRequest):
+  # Make sure request is a get request
+  if(request.method != "GET"):
+    logger.warning("getAlbumsPage called with a non-GET method, returning 405.")
+    res = HttpResponse("Method not allowed")
+    res.status_code = 405
+    return res
+  # Parse page size
+  try:
+    limit = min(max(int(request.GET.get('limit', 50)), 1), 200)
+  except ValueError:
+    return HttpResponse("Invalid limit, must be an integer.", status=400)
+  # Build filtered album query, ordered newest first (Matches album_submission_keyset_idx, so every page is a seek into the index)
+  albums = getAlbumListQuery().order_by('-submission_date', '-pk')
+  if(request.GET.get('submitter')):
+    albums = albums.filter(submitted_by__discord_id=request.GET['submitter'])
+  if(request.GET.get('search')):
+    albums = albums.filter(Q(title__icontains=request.GET['search']) | Q(artist__icontains=request.GET['search']))
+  if(request.GET.get('picked') in ("true", "false")):
+    albums = albums.filter(last_aotd_date__isnull=(request.GET['picked'] == "false"))
+  # Seek past the last album of the previous page
+  if(request.GET.get('cursor')):
+    try:
+      cursor_date, cursor_pk = decodeAlbumCursor(request.GET['cursor'])
+    except ValueError as e:
+      logger.warning(f"getAlbumsPage: {e}")
+      return HttpResponse("Invalid cursor.", status=400)
+    # The leading submission_date bound is the index range, the rest breaks ties within a timestamp
+    albums = albums.filter(Q(submission_date__lte=cursor_date) & (Q(submission_date__lt=cursor_date) | Q(pk__lt=cursor_pk)))
+  # Fetch one extra row to find out if there is another page
+  page = list(albums[:limit + 1])
+  has_next = (len(page) > limit)
+  page = page[:limit]
+  # Build response
+  out = {}
+  out['albums_list'] = [buildAlbumListObj(album) for album in page]
+  out['next_cursor'] = encodeAlbumCursor(page[-1]) if has_next else None
+  out['timestamp'] = datetime.datetime.now()
+  return JsonResponse(out)
+
+
 ###
 # Get the average rating for an album.
 # If a date is not provided in the url bar, will return the most recent aotd ratings for that album
@@ -337,12 +417,15 @@ def getAlbumSTD(request: HttpRequest, mbid: str, date: str = None):
     res = HttpResponse("Method not allowed")
     res.status_code = 405
     return res
-  # Get all ratings for an album
-  reviewList = Review.objects.filter(album__mbid=mbid).filter(aotd_date=aotd_date)
-  # Iterate review list and get scores
-  reviewScores = [rev.score for rev in reviewList]
-  # Get standard deviation
-  standardDev = numpy.std(reviewScores)
+  # Get the day's rating cache, which tracks the sum of squares needed for the standard deviation
+  try:
+    aotd = DailyAlbum.objects.select_related('rating_cache').get(album__mbid=mbid, date=aotd_date)
+    standardDev = getDailyAlbumRatingCache(aotd).getStandardDeviation()
+  except DailyAlbum.DoesNotExist:
+    standardDev = None
+  # Keep numpy's behaviour for an album with no reviews
+  if(standardDev == None):
+    standardDev = numpy.nan
   return JsonResponse({"standard_deviation": standardDev})
 
 
@@ -364,7 +447,8 @@ def getLastXAlbums(request: HttpRequest, count: int):
     albumObj = {}
     albumObj['title'] = album.title
     albumObj['album_id'] = album.mbid
-    albumObj['album_img_src'] = album.cover_url
+    albumObj['album_img_src'] = album.getCoverUrl(250)
+    albumObj['album_img_full_src'] = album.cover_url
     albumObj['artist'] = album.artist
     albumObj['album_src'] = album.album_url
     albumObj['submitter'] = album.submitted_by.nickname
@@ -377,6 +461,7 @@ def getLastXAlbums(request: HttpRequest, count: int):
 ###
 # Get Album Stats (submission numbers)
 ###
+@cachedView(depends_on=["Album", "AotdUserData", "DailyAlbum", "User", "UserAlbumOutage", "UserChanceCache"])
 def getAlbumsStats(request: HttpRequest):
   # Avoid circular import
   from .views_aotd import getChanceOfAotdSelect
@@ -420,6 +505,7 @@ def getAlbumsStats(request: HttpRequest):
 ###
 # Get Lowest and Highest Rated Albums
 ###
+@cachedView(depends_on=["Album", "DailyAlbum", "Review", "User"])
 def getLowestHighestAlbumStats(request: HttpRequest):
   # Make sure request is a get request
   if(request.method != "GET"):
@@ -429,41 +515,21 @@ def getLowestHighestAlbumStats(request: HttpRequest):
     return res
   # Declare out object
   out = {}
-  # Get all albums from album of the day
-  all_albums = DailyAlbum.objects.all()
-  # Declare placeholders 
-  lowest_album = None
-  lowest_album_rating = 11
-  lowest_album_date = None
-  highest_album = None
-  highest_album_rating = -1
-  highest_album_date = None
-  # Iterate through and retreive data
-  for dailyAlbum in all_albums:
-    album_rating = getAlbumRating(dailyAlbum.album.mbid, rounded=False, date=dailyAlbum.date)
-    # If album rating is none, skip
-    if(album_rating == None):
-      continue
-    # Check to see if album meets review requirements (must have 4 or more reviews) [ONLY MAKE THIS CHECK IF IN PROD]
-    if((os.getenv("APP_ENV") == "PROD") and (Review.objects.filter(album=dailyAlbum.album, aotd_date=dailyAlbum.date).count() < 4)):
-      continue
-    # Check for lowest album
-    if((lowest_album == None) or ((album_rating != None) and (album_rating < lowest_album_rating))):
-      lowest_album = dailyAlbum.album
-      lowest_album_rating = album_rating
-      lowest_album_date = dailyAlbum.date
-    # Check for highest album
-    if(highest_album == None or (album_rating != None and album_rating > highest_album_rating)):
-      highest_album = dailyAlbum.album
-      highest_album_rating = album_rating
-      highest_album_date = dailyAlbum.date
+  # Get all rated albums of the day from the rating cache
+  rated_aotds = DailyAlbumRatingCache.objects.filter(review_count__gt=0).select_related('aotd__album__submitted_by')
+  # Check to see if album meets review requirements (must have 4 or more reviews) [ONLY MAKE THIS CHECK IF IN PROD]
+  if(os.getenv("APP_ENV") == "PROD"):
+    rated_aotds = rated_aotds.filter(review_count__gte=4)
+  # Earliest date wins ties, matching the order albums were selected in
+  lowest = rated_aotds.order_by('average_score', 'aotd__date').first()
+  highest = rated_aotds.order_by('-average_score', 'aotd__date').first()
   # Populate out objects
-  out['lowest_album'] = lowest_album.toJSON() if lowest_album else {}
-  out['lowest_album']['rating'] = getAlbumRating(lowest_album.mbid, rounded=False) if lowest_album else 0.0
-  out['lowest_album']['date'] = lowest_album_date if lowest_album_date else datetime.datetime.now().strftime("%Y-%m-%d")
-  out['highest_album'] = highest_album.toJSON() if highest_album else {}
-  out['highest_album']['rating'] = getAlbumRating(highest_album.mbid, rounded=False) if highest_album else 0.0
-  out['highest_album']['date'] = highest_album_date if highest_album_date else datetime.datetime.now().strftime("%Y-%m-%d")
+  out['lowest_album'] = lowest.aotd.album.toJSON() if lowest else {}
+  out['lowest_album']['rating'] = lowest.average_score if lowest else 0.0
+  out['lowest_album']['date'] = lowest.aotd.date if lowest else datetime.datetime.now().strftime("%Y-%m-%d")
+  out['highest_album'] = highest.aotd.album.toJSON() if highest else {}
+  out['highest_album']['rating'] = highest.average_score if highest else 0.0
+  out['highest_album']['date'] = highest.aotd.date if highest else datetime.datetime.now().strftime("%Y-%m-%d")
   # Return Object
   return JsonResponse(out)
 
@@ -533,4 +599,20 @@ def isUserAlbumUploader(request: HttpRequest, mbid: str, user_discord_id: str =
   # Get submitter status
   out = (user == album.submitted_by)
   # Return Object
-  return JsonResponse({'uploader': out})
\ No newline at end of file
+  return JsonResponse({'uploader': out})
+
+###
+# Return a thumbnail of a locally cached album cover (See aotd/cover_art.py).
+# Urls are content addressed (a hash always names the same image), so responses can be cached by clients forever.
+###
+def getCoverArt(request: HttpRequest, cover_hash: str, size: int):
+  # Make sure request is a get request
+  if(request.method != "GET"):
+    logger.warning("getCoverArt called with a non-GET method, returning 405.")
+    res = HttpResponse("Method not allowed")
+    res.status_code = 405
+    return res
+  # Only serve known sizes of well formed hashes (The hash is used to build a file path)
+  if((size not in COVER_ART_SIZES) or (len(cover_hash) != 64) or any(char not in "0123456789abcdef" for char in cover_hash)):
+    return HttpResponse("Cover art not found.", status=404)
+  return serveFile(request, coverArtFilePath(cover_hash, size), "image/jpeg", f"\"{cover_hash}-{size}\"", offload_uri=coverArtOffloadUri(cover_hash, size))
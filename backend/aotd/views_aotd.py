@@ -1,30 +1,34 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.forms.models import model_to_dict
-from django.db.models import Count, Q
 from django.utils import timezone
 from django.core import management
 
 from .utils import (
-  checkSelectionFlag,
+  updateSelectionFlags,
+  calculateAllAOTDChances,
   getAotdUserObj,
   getAlbumRating,
-  generateDayRatingTimeline
+  serializeDayRatingTimeline,
+  getMonthSummary,
+  addDayToMonthPayload,
+  selectAlbumOfDay,
+  SELECTION_WEIGHTINGS
 )
 from .models import (
   Album,
   DailyAlbum,
   AotdUserData,
-  Review,
-  UserAlbumOutage,
   UserChanceCache
 )
 
+from users.utils import getUserObj
+from backend.responses import JsonResponse
+from backend.view_cache import cachedView
 import logging
 from dotenv import load_dotenv
 import os
 import datetime
 import pytz
-import random
 import traceback
 import json
 
@@ -88,8 +92,7 @@ def setAlbumOfDay(request: HttpRequest):
     res.status_code = 405
     return res
   # Check and set selection flags for all users
-  for spot_user in AotdUserData.objects.all():
-    checkSelectionFlag(spot_user)
+  updateSelectionFlags(list(AotdUserData.objects.all()))
   # Get current date
   day = datetime.date.today()
   # Check if a current album of the day already exists
@@ -99,34 +102,13 @@ def setAlbumOfDay(request: HttpRequest):
     return HttpResponse(f"WARN: Album of the day already selected: {currDayAlbum}", status=425)
   except DailyAlbum.DoesNotExist:
     logger.info("Today does not yet have an album, selecting one...")
-  # Get Date a year ago to filter by
-  one_year_ago = day - datetime.timedelta(days=365)
-  # Define a boolean for selecting the right album
-  selected = False
-  # Define Album Object
-  albumOfTheDay = None
-  # Get all users currently in an outage
-  outage_users = list(UserAlbumOutage.objects.filter(start_date__lte=day, end_date__gte=day).values_list('user__discord_id', flat=True))
-  logger.warning(f"Outage Users: {outage_users}")
-  # Get list of all users who are currently AOtD selection blocked
-  blocked_users = list(AotdUserData.objects.filter(selection_blocked_flag=True).values_list('user__discord_id', flat=True))
-  logger.warning(f"Blocked Users: {blocked_users}")
-  # Get set of all eligible albums
-  albumPool = Album.objects.all().exclude(submitted_by__discord_id__in=blocked_users).exclude(submitted_by__discord_id__in=outage_users)
-  while(not selected):
-    # If no eligible albums, error out..
-    if(len(albumPool) == 0):
-      logger.error(f"WARNING! NO ELIGIBLE ALBUMS FOR SELECTION! NO ALBUM WILL BE SELECTED")
-      return HttpResponse(f'No albums eligible for selection!', status=404)
-    # Filter out blocked users albums
-    tempAlbum = random.choice(albumPool)
-    logger.info(f"Temp album selected: {tempAlbum.title}")
-    try:
-      albumCheck = DailyAlbum.objects.filter(date__gte=one_year_ago).get(album=tempAlbum)
-      albumPool = albumPool.exclude(mbid=tempAlbum.mbid)
-    except DailyAlbum.DoesNotExist:
-      albumOfTheDay = tempAlbum
-      selected = True
+  # Build the eligible pool and draw an album (Always with a fresh random seed, seeded draws are only available to scripts)
+  albumOfTheDay, audit = selectAlbumOfDay(day)
+  logger.info(f"AOtD candidate pool: {audit.candidate_count} albums from {audit.eligible_user_count} users (seed: {audit.seed})")
+  # If no eligible albums, error out..
+  if(albumOfTheDay == None):
+    logger.error(f"WARNING! NO ELIGIBLE ALBUMS FOR SELECTION! NO ALBUM WILL BE SELECTED")
+    return HttpResponse(f'No albums eligible for selection!', status=404)
   # Create an album of the day object
   albumOfTheDayObj = DailyAlbum(
     album=albumOfTheDay,
@@ -136,18 +118,58 @@ def setAlbumOfDay(request: HttpRequest):
   albumOfTheDayObj.save()
   yesterday = day - datetime.timedelta(days=1)
   try:
-    # Attempt to get previous AOtD Object and generate a timeline, as well as store final rating for that album in the AOtD object
+    # Attempt to get previous AOtD Object and store final rating for that album in the AOtD object (The timeline is already kept up to date as reviews are submitted)
     yesterday_aotd = DailyAlbum.objects.get(date=yesterday)
-    generateDayRatingTimeline(yesterday_aotd)
     yesterday_aotd.rating = getAlbumRating(yesterday_aotd.album.mbid, False, yesterday.strftime("%Y-%m-%d"))
     yesterday_aotd.save()
   except:
-    logger.error(f"ERROR IN GENERATING TIMELINE DATA FOR DATE: {yesterday.strftime('%Y-%m-%d')} TRACEBACK: {traceback.print_exc()}")
+    logger.error(f"ERROR IN STORING FINAL RATING FOR DATE: {yesterday.strftime('%Y-%m-%d')} TRACEBACK: {traceback.print_exc()}")
+  try:
+    # Add the now closed day to its month's summary (Freezing the month if it was the last day)
+    getMonthSummary(yesterday.year, yesterday.month)
+  except:
+    logger.error(f"ERROR IN UPDATING MONTH SUMMARY FOR DATE: {yesterday.strftime('%Y-%m-%d')} TRACEBACK: {traceback.print_exc()}")
   # Print success
   logger.info(f'Successfully selected album of the day: \"{albumOfTheDayObj}\" submitted by: \"{albumOfTheDay.submitted_by.nickname}\"')
   return HttpResponse(f'Successfully selected album of the day: \"{albumOfTheDayObj}\" submitted by: \"{albumOfTheDay.submitted_by.nickname}\"')
 
 
+###
+# Dry run of the album of the day selection, admins only. Nothing is saved (Use the preview_aotd_selection script to keep an audit).
+# Optional Query Params:
+# - date: Date to run the selection for in YYYY-MM-DD format (Defaults to today)
+# - seed: Integer seed for the draw, the same seed and pool always produce the same album
+# - weighting: "ALBUM" (every album equally likely) or "USER" (every submitter equally likely)
+###
+def previewAlbumOfDay(request: HttpRequest):
+  # Make sure request is a get request
+  if(request.method != "GET"):
+    logger.warning("previewAlbumOfDay called with a non-GET method, returning 405.")
+    res = HttpResponse("Method not allowed")
+    res.status_code = 405
+    return res
+  # Make sure the requesting user is an admin (Previews show which album a seed selects)
+  user = getUserObj(request.session.get('discord_id'))
+  if((user == None) or (not user.is_staff)):
+    logger.warning(f"previewAlbumOfDay called by a non-admin user ({request.session.get('discord_id')}), returning 403.")
+    return HttpResponse(status=403)
+  # Parse request params
+  try:
+    day = datetime.datetime.strptime(request.GET['date'], "%Y-%m-%d").date() if ('date' in request.GET) else datetime.date.today()
+    seed = int(request.GET['seed']) if ('seed' in request.GET) else None
+  except ValueError:
+    return HttpResponse("Invalid request, date must be in YYYY-MM-DD format and seed must be an integer.", status=400)
+  weighting = request.GET.get('weighting', "ALBUM").upper()
+  if(weighting not in SELECTION_WEIGHTINGS):
+    return HttpResponse(f"Invalid weighting, must be one of: {', '.join(SELECTION_WEIGHTINGS)}", status=400)
+  # Run the selection without creating an AOtD
+  album, audit = selectAlbumOfDay(day, seed=seed, weighting=weighting, dry_run=True, save_audit=False)
+  out = {}
+  out['album'] = album.toJSON() if album else None
+  out['audit'] = audit.toJSON()
+  return JsonResponse(out)
+
+
 ###
 # Set a new album of the day.  NOTE: This WILL OVERRIDE any already set album for any date! Returns an HTTPResponse
 ###
@@ -208,97 +230,10 @@ def calculateAOTDChances(request: HttpRequest):
     res = HttpResponse("Method not allowed")
     res.status_code = 405
     return res
-  # Get current date
-  day = datetime.date.today()
-  tomorrow = datetime.date.today() + datetime.timedelta(days=1)
-  # Get Date a year ago to filter by
-  one_year_ago = day - datetime.timedelta(days=365)
-  # Get user list
-  user_list = AotdUserData.objects.all().annotate(
-    total_submissions=Count('user__album', distinct=True),
-    recent_picks=Count(
-      'user__album__dailyalbum',
-      filter=Q(user__album__dailyalbum__date__gte=one_year_ago),
-      distinct=True
-    )
-  )
-  # Get a map of all outages
-  user_outage_map = set(
-    UserAlbumOutage.objects
-      .filter(start_date__lte=tomorrow, end_date__gte=tomorrow)
-      .values_list('user_id', flat=True)
-  )
-  # Iterate all users and update the selection blocked flag
-  for user in user_list:
-    checkSelectionFlag(user)
-  # Get a list of all aotd users
-  aotd_users = AotdUserData.objects.all()
-  # Get a list of users who are eligible for selection
-  eligible_users = aotd_users.filter(
-    selection_blocked_flag=False
-  ).exclude(user_id__in=user_outage_map).select_related('user').annotate(
-    total_submissions=Count('user__album', distinct=True),
-    recent_picks=Count(
-      'user__album__dailyalbum',
-      filter=Q(user__album__dailyalbum__date__gte=one_year_ago),
-      distinct=True
-    )
-  )
-  # Iterate all aotd users and calculate aotd chances
-  for aotdUser in aotd_users:
-    logger.info(f"Calculating chance percentage for user {aotdUser.user.nickname}")
-    # Retrieve user from aotd data
-    user = aotdUser.user
-    # Get the user's chance object
-    userChanceObj: UserChanceCache = UserChanceCache.objects.update_or_create(
-      aotd_user=aotdUser,
-      defaults={
-        'chance_percentage': 0.00,
-        'block_type': None,
-        'outage': None,
-        'reason': None,
-      }
-    )[0]
-    # Check if user is currently under an outage
-    if(user.pk in user_outage_map):
-      logger.info(f"\t{aotdUser.user.nickname} is under an outage!")
-      outage = UserAlbumOutage.objects.filter(start_date__lte=tomorrow, end_date__gte=tomorrow).get(user=user)
-      logger.info(f"User {user.nickname} is currently under an outage, lasts until {outage.end_date.strftime('%Y-%m-%d')}!")
-      # Create outage return json
-      userChanceObj.chance_percentage = 0.00
-      userChanceObj.block_type = "OUTAGE"
-      userChanceObj.outage = outage
-      userChanceObj.reason = f"{outage.reason}"
-    elif(aotdUser.selection_blocked_flag):
-      # Check if user's selections are currently blocked, return 0% chance
-      logger.info(f"\t{aotdUser.user.nickname} is blocked from selection!")
-      # Get user's last review
-      lastReview = Review.objects.filter(user=aotdUser.user).order_by('-aotd_date').first()
-      days_since = day - (lastReview.aotd_date if (lastReview != None) else day)
-      # Store data
-      userChanceObj.chance_percentage = 0.00
-      userChanceObj.block_type = "INACTIVITY"
-      userChanceObj.reason = f"Inactivity, user has not reviewed in over two days. Last review was {days_since.days} days ago."
-    else:
-      # Get counts needed to determine percentage
-      user_submissions_count = Album.objects.filter(submitted_by=user).count()
-      user_eligible_count = user_submissions_count - (DailyAlbum.objects.filter(date__gte=one_year_ago).filter(album__submitted_by=user).count())
-      total_eligible_count = sum(
-        user.total_submissions - user.recent_picks for user in eligible_users
-      )
-      # Do math for percentage
-      try:
-        chance = round((float(user_eligible_count)/float(total_eligible_count)) * 100.00, 2)
-      except:
-        chance = round(0, 2)
-      # Update with correct data
-      userChanceObj.chance_percentage = chance
-      userChanceObj.block_type = None
-      userChanceObj.reason = None
-    # Save user chance object
-    userChanceObj.save()
-  # Return a 200 for successful calculation
-  return HttpResponse(status=200)
+  # Calculate and store chances for all users
+  stats = calculateAllAOTDChances()
+  # Return a 200 for successful calculation, along with how long it took
+  return JsonResponse(stats)
 
 
 ###
@@ -323,7 +258,9 @@ def getChanceOfAotdSelect(request: HttpRequest, user_discord_id: str = ""):
 # Return an object containing all of the aotd objects and their albums in a specific month
 # NOTE: This function has been expanded to include statistics for each month, so less loops and DB calls are needed
 # NOTE 2: This function has been updated to only include AOtD selections up to todays date.
+# NOTE 3: Closed days are read from the month's stored MonthSummary, only the current day is built on request.
 ###
+@cachedView(depends_on=["Album", "DailyAlbum", "Review"])
 def getAOtDByMonth(request: HttpRequest, year: str, month: str):
   # Make sure request is a get request
   if(request.method != "GET"):
@@ -331,84 +268,28 @@ def getAOtDByMonth(request: HttpRequest, year: str, month: str):
     res = HttpResponse("Method not allowed")
     res.status_code = 405
     return res
-  # Get all AOtD Objects for this year and month
-  month_AOtD = DailyAlbum.objects.filter(date__year=year, date__month=month).filter(date__lte=timezone.now())
-  # Create out object
-  out = {}
-  if(len(month_AOtD) != 0):
-    # Track highest and lowest album scores of the month
-    highest_aotd: DailyAlbum = month_AOtD.first()
-    highest_aotd_rating = getAlbumRating(highest_aotd.album.mbid, rounded=False, date=highest_aotd.date)
-    lowest_aotd: DailyAlbum = month_AOtD.first()
-    lowest_aotd_rating = getAlbumRating(lowest_aotd.album.mbid, rounded=False, date=lowest_aotd.date)
-    # Track counts of submitters selected
-    selection_counts = {}
-    for aotd in month_AOtD:
-      albumObj = aotd.album
-      # Get album Rating
-      rating = getAlbumRating(aotd.album.mbid, rounded=False, date=aotd.date)
-      # Check highest and lowest ratings if rating is not null
-      if(rating):
-        if((highest_aotd_rating == None) or (rating > highest_aotd_rating)):
-          highest_aotd = aotd
-          highest_aotd_rating = rating
-        if((lowest_aotd_rating == None) or (rating < lowest_aotd_rating)):
-          lowest_aotd = aotd
-          lowest_aotd_rating = rating
-      # Increment submitter selection count
-      submitter = albumObj.submitted_by.discord_id
-      if(submitter in selection_counts):
-        selection_counts[submitter] += 1
-      else:
-        selection_counts[submitter] = 1
-      # Build album object
-      temp = {}
-      temp['raw_data'] = model_to_dict(albumObj)
-      temp['title'] = albumObj.title
-      temp['album_id'] = albumObj.mbid
-      temp['album_img_src'] = albumObj.cover_url
-      temp['album_src'] = albumObj.album_url
-      temp['artist'] = {}
-      temp['artist']['name'] = albumObj.artist
-      temp['artist']['href'] = (albumObj.artist_url)
-      temp['submitter'] = albumObj.submitted_by.discord_id
-      temp['submitter_comment'] = albumObj.user_comment
-      temp['submission_date'] = albumObj.submission_date.strftime("%m/%d/%Y, %H:%M:%S")
-      # Attach rating of album
-      temp['rating'] = rating
-      # Append out object to output
-      out[aotd.dateToCalString()] = temp
-    # Convert submission numbers to array
-    subNumList = []
-    subNumObj = {}
-    for user in selection_counts.keys():
-      datesList = list(date for date in out.keys() if (out[date]['submitter'] == user))
-      tempObj = {
-        "discord_id": user, 
-        "count": selection_counts[user], 
-        "percent": ((selection_counts[user]/float(len(month_AOtD))) * 100), 
-        "selection_dates": datesList
-      }
-      subNumList.append(tempObj)
-      # Provide the above list as a object as well
-      subNumObj[user] = tempObj
-    # Provide Statistics
-    out['stats'] = {}
-    # Attach lowest and highest album data
-    out['stats']['lowest_aotd_date'] = lowest_aotd.dateToCalString()
-    out['stats']['highest_aotd_date'] = highest_aotd.dateToCalString()
-    # Attach Submission Numbers
-    out['stats']['selection_counts'] = subNumList
-    out['stats']['selection_total'] = len(month_AOtD)
-    # Attach submission numbers object to out JSON 
-    out['stats']['user_stats'] = subNumObj
+  # Validate the month
+  try:
+    year = int(year)
+    month = int(month)
+    datetime.date(year, month, 1)
+  except (ValueError, OverflowError):
+    return HttpResponse("Invalid year or month, month must be between 1 and 12.", status=400)
+  # Get the month's stored summary, which includes every closed day (Closed months are returned as stored)
+  out = getMonthSummary(year, month).payload
+  # Today's AOtD is still being reviewed, so add it to the month live
+  today = timezone.localdate()
+  if((today.year == year) and (today.month == month)):
+    today_aotd = DailyAlbum.objects.filter(date=today).select_related('album__submitted_by', 'rating_cache').first()
+    if(today_aotd != None):
+      addDayToMonthPayload(out, today_aotd)
   # Return out object with timestamp
   out['timestamp'] = timezone.now().strftime("%m/%d/%Y, %H:%M:%S")
   return JsonResponse(out)
 
 
 ###
-# Get timeline data for a single aotd instance. If the data is not yet generated, return empty list in json
+# Get timeline data for a single aotd instance, including the current day as reviews come in. If there is no data, return empty list in json
 # aotd_date expected in %Y-%m-%d format.
 ###
 def getDayTimelineData(request: HttpRequest, aotd_date: str):
@@ -423,5 +304,10 @@ def getDayTimelineData(request: HttpRequest, aotd_date: str):
     aotd_obj = DailyAlbum.objects.get(date=datetime.datetime.strptime(aotd_date, "%Y-%m-%d"))
   except:
     return JsonResponse({"timeline": []})
+  # Get the day's timeline events in a single query
+  events = list(aotd_obj.timeline_events.select_related('user').order_by('timestamp', 'pk'))
+  # Days from before timeline events were stored only have the timeline generated at the end of the day
+  if((len(events) == 0) and aotd_obj.rating_timeline):
+    return JsonResponse({"timeline": aotd_obj.rating_timeline.get('timeline', [])})
   # Return object data
-  return JsonResponse(aotd_obj.rating_timeline)
\ No newline at end of file
+  return JsonResponse(serializeDayRatingTimeline(events))
\ No newline at end of file
@@ -1,5 +1,6 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.core.exceptions import ObjectDoesNotExist
+from backend.responses import JsonResponse
 
 from .utils import (
   getUserObj,
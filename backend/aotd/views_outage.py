@@ -1,5 +1,6 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.utils import timezone
+from backend.responses import JsonResponse
 
 import logging
 from dotenv import load_dotenv
@@ -1,6 +1,9 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Sum
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Sum, F, Q, Window
+from django.db.models.functions import RowNumber
 
 from users.utils import getUserObj
 
@@ -15,15 +18,24 @@ from .models import (
 
 from .utils import (
   checkSelectionFlag,
-  calculateUserReviewData
+  calculateUserReviewData,
+  calculateReviewStats,
+  serializeReviews,
+  prefetchReviewsForJSON,
+  getAotdUserObj,
+  getUserScoreHistogram,
+  SCORE_BUCKET_COUNT
 )
 from reactions.utils import (
   createReaction
 )
 
+from backend.responses import JsonResponse
+from backend.view_cache import cachedView
 import logging
 from dotenv import load_dotenv
 import os
+import base64
 import json
 import datetime
 import pytz
@@ -36,6 +48,36 @@ APP_ENV = os.getenv('APP_ENV') or 'DEV'
 load_dotenv(".env.production" if APP_ENV=="PROD" else ".env.local")
 
 
+# Reviews loaded per query when exporting a review history
+REVIEW_EXPORT_CHUNK_SIZE = 200
+
+
+## Helper Method
+def encodeReviewCursor(review: Review):
+  """Encode the keyset position of a review (AOtD date and pk) as an opaque cursor string"""
+  return base64.urlsafe_b64encode(f"{review.aotd_date.isoformat()}|{review.pk}".encode()).decode()
+
+
+## Helper Method
+def decodeReviewCursor(cursor: str):
+  """Decode a cursor created by encodeReviewCursor, returning an (aotd_date, pk) tuple. Raises ValueError on a malformed cursor."""
+  try:
+    aotd_date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.date.fromisoformat(aotd_date), int(pk)
+  except Exception as e:
+    raise ValueError(f"Malformed review cursor: {cursor}") from e
+
+
+## Helper Method
+def getUserReviewHistoryQuery(user: User, include_raw_album: bool = True):
+  """Return a user's reviews, newest AOtD first, ready for Review.toJSON(full=True)"""
+  reviews = prefetchReviewsForJSON(user.aotd_reviews.order_by('-aotd_date', '-pk'))
+  if(not include_raw_album):
+    # Leave the raw album data in the database instead of loading and dropping it
+    reviews = reviews.defer('album__raw_data')
+  return reviews
+
+
 ## =========================================================================================================================================================================================
 ## REVIEW METHODS
 ## =========================================================================================================================================================================================
@@ -80,10 +122,10 @@ def submitReview(request: HttpRequest):
     )
     # Save new Review data
     newReview.save()
-  # Update user selection_blocked flag status
-  checkSelectionFlag(AotdUserData.objects.get(user=userObj))
-  # Update review stats
-  calculateUserReviewData(AotdUserData.objects.get(user=userObj))
+  # Get AotdUser Object (Resolved with the user for this request)
+  aotdUserObj = getAotdUserObj(request.session.get('discord_id'))
+  # Update user selection_blocked flag status (Review stats are updated as the review is saved)
+  checkSelectionFlag(aotdUserObj)
   return HttpResponse(200)
 
 
@@ -121,12 +163,8 @@ def getReviewsForAlbum(request: HttpRequest, mbid: str, date: str = None):
     out['review_list'] = []
     print(f'No reviews found for album {mbid}...')
     return JsonResponse(out)
-  # Declare outlist and populate
-  outList = []
-  for review in reviewsObj:
-    outObj = review.toJSON()
-    # Append to list
-    outList.append(outObj)
+  # Serialize all reviews, with their users and reactions, in a fixed number of queries
+  outList = serializeReviews(reviewsObj)
   # Return list of reviews
   return JsonResponse({"review_list": outList})
 
@@ -169,6 +207,7 @@ def getUserReviewForAlbum(request: HttpRequest, mbid: str, date: str = None):
 # Get Review stats for all users.
 # TODO: Track streaks of reviews to see which user has been maintaining the streak
 ###
+@cachedView(depends_on=["AotdUserData", "Review"])
 def getAllUserReviewStats(request: HttpRequest):
   # Make sure request is a get request
   if(request.method != "GET"):
@@ -193,10 +232,10 @@ def getAllUserReviewStats(request: HttpRequest):
       "average_review_score": aotdUser.average_review_score,
       "lowest_score_given": aotdUser.lowest_score_given,
       "lowest_score_album": aotdUser.lowest_score_mbid,
-      "lowest_score_date": aotdUser.lowest_score_date.strftime("%m/%d/%Y, %H:%M:%S"),
+      "lowest_score_date": aotdUser.lowest_score_date.strftime("%m/%d/%Y, %H:%M:%S") if aotdUser.lowest_score_date else None,
       "highest_score_given": aotdUser.highest_score_given,
       "highest_score_album": aotdUser.highest_score_mbid,
-      "highest_score_date": aotdUser.highest_score_date.strftime("%m/%d/%Y, %H:%M:%S"),
+      "highest_score_date": aotdUser.highest_score_date.strftime("%m/%d/%Y, %H:%M:%S") if aotdUser.highest_score_date else None,
       }
   # Convert user reviews object to list
   outList = []
@@ -219,10 +258,9 @@ def getUserReviewStats(request: HttpRequest, user_discord_id: str = None):
     userId = user_discord_id
   else:
     userId = request.session.get('discord_id')
-  # Get user object from DB
-  user = User.objects.get(discord_id=userId)
-  # Get AotdUser Object
-  aotdUser = AotdUserData.objects.get(user=user)
+  # Get AotdUser Object, along with its user
+  aotdUser = getAotdUserObj(userId)
+  user = aotdUser.user
   # If this user has not had their data calculated, calculate it
   if(aotdUser.total_reviews == None):
     calculateUserReviewData(aotdUser)
@@ -234,20 +272,14 @@ def getUserReviewStats(request: HttpRequest, user_discord_id: str = None):
     "average_review_score": aotdUser.average_review_score,
     "lowest_score_given": aotdUser.lowest_score_given,
     "lowest_score_album": aotdUser.lowest_score_mbid,
-    "lowest_score_date": aotdUser.lowest_score_date.strftime("%m/%d/%Y, %H:%M:%S"),
+    "lowest_score_date": aotdUser.lowest_score_date.strftime("%m/%d/%Y, %H:%M:%S") if aotdUser.lowest_score_date else None,
     "highest_score_given": aotdUser.highest_score_given,
     "highest_score_album": aotdUser.highest_score_mbid,
-    "highest_score_date": aotdUser.highest_score_date.strftime("%m/%d/%Y, %H:%M:%S"),
+    "highest_score_date": aotdUser.highest_score_date.strftime("%m/%d/%Y, %H:%M:%S") if aotdUser.highest_score_date else None,
   }
-  # Get all reviews left by user
-  user_reviews = Review.objects.filter(user=user)
-  # Convert get list of objects per score
-  index = 0.0
-  tempList = []
-  while(index <= 10):
-    count = user_reviews.filter(score=index).count()
-    tempList.append({ "score": index, "count": count })
-    index += 0.5
+  # Get count of reviews per score from the user's score histogram
+  histogram = getUserScoreHistogram(aotdUser)
+  tempList = [{ "score": bucket/2.0, "count": histogram[bucket] } for bucket in range(SCORE_BUCKET_COUNT)]
   # Attach score counts to user object
   out['score_counts'] = tempList
   # Get final data on lowest and highest albums
@@ -293,19 +325,24 @@ def getSimilarReviewsForRatings(request: HttpRequest):
     return res
   # Retrieve user from session cookie
   user = getUserObj(request.session.get('discord_id'))
-  # Iterate through possible ratings and build return object
-  out = {}
-  score = 0
-  while score <= 10:
-    # Get three reviews returned 
-    user_reviews = Review.objects.filter(user=user).filter(score=score).order_by('-last_updated')[:3]
-    albums_for_score = []
-    for review in user_reviews:
-      albums_for_score.append(review.album.toJSON())
-    # Attach to out object
-    out[f"{score + 0.0}"] = albums_for_score
-    # Increment score
-    score += 0.5
+  aotdUser = getAotdUserObj(request.session.get('discord_id'))
+  # Only query scores the user has actually given (Known from their score histogram)
+  scores = [bucket/2.0 for bucket in range(SCORE_BUCKET_COUNT)]
+  if(aotdUser != None):
+    histogram = getUserScoreHistogram(aotdUser)
+    scores = [bucket/2.0 for bucket in range(SCORE_BUCKET_COUNT) if (histogram[bucket] > 0)]
+  # Get the three most recent reviews for every score, with their albums, in a single query
+  recent_reviews = (
+    Review.objects.filter(user=user, score__in=scores)
+      .select_related('album__submitted_by')
+      .annotate(score_rank=Window(RowNumber(), partition_by=[F('score')], order_by=F('last_updated').desc()))
+      .filter(score_rank__lte=3)
+      .order_by('score', 'score_rank')
+  )
+  # Build return object, with an entry for every possible rating
+  out = {f"{bucket/2.0}": [] for bucket in range(SCORE_BUCKET_COUNT)}
+  for review in recent_reviews:
+    out[f"{review.score + 0.0}"].append(review.album.toJSON())
   # Attach timestamp
   out['metadata'] = {}
   out['metadata']['timestamp'] = datetime.datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
@@ -314,7 +351,10 @@ def getSimilarReviewsForRatings(request: HttpRequest):
 
 
 ###
-# Get ALL Reviews made by a user
+# Get ALL Reviews made by a user.
+# Long histories should use getUserReviewsPage or exportUserReviews instead.
+# Optional Query Params:
+# - raw_album: "false" to leave out each album's raw MusicBrainz data
 ###
 def getAllUserReviews(request: HttpRequest, user_discord_id: str = None):
   # Make sure request is a get request
@@ -329,11 +369,7 @@ def getAllUserReviews(request: HttpRequest, user_discord_id: str = None):
   reviewsObj = user.aotd_reviews.all()
   # Declare outlist and populate
   out = {}
-  out['reviews'] = []
-  for review in reviewsObj:
-    outObj = review.toJSON(full = True)
-    # Append to list
-    out['reviews'].append(outObj)
+  out['reviews'] = serializeReviews(reviewsObj, full = True, include_raw_album = (request.GET.get('raw_album') != "false"))
   # Attach timestamp
   out['metadata'] = {}
   out['metadata']['timestamp'] = datetime.datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
@@ -341,9 +377,96 @@ def getAllUserReviews(request: HttpRequest, user_discord_id: str = None):
   return JsonResponse(out)
 
 
+###
+# Get a page of the Reviews made by a user, newest AOtD first.
+# Uses keyset pagination so every page costs the same number of queries no matter how long the history is.
+# Optional Query Params:
+# - cursor: Value of "next_cursor" from the previous page (omit for the first page)
+# - limit: Page size (Default 50, Max 200)
+# - raw_album: "false" to leave out each album's raw MusicBrainz data
+###
+def getUserReviewsPage(request: HttpRequest, user_discord_id: str = None):
+  # Make sure request is a get request
+  if(request.method != "GET"):
+    logger.warning("getUserReviewsPage called with a non-GET method, returning 405.")
+    res = HttpResponse("Method not allowed")
+    res.status_code = 405
+    return res
+  # Parse page size
+  try:
+    limit = min(max(int(request.GET.get('limit', 50)), 1), 200)
+  except ValueError:
+    return HttpResponse("Invalid limit, must be an integer.", status=400)
+  # Retrieve user from session cookie
+  user = getUserObj(request.session.get('discord_id') if (user_discord_id == None) else user_discord_id)
+  if(user == None):
+    return HttpResponse("User not found.", status=404)
+  include_raw_album = (request.GET.get('raw_album') != "false")
+  reviews = getUserReviewHistoryQuery(user, include_raw_album)
+  # Seek past the last review of the previous page
+  if(request.GET.get('cursor')):
+    try:
+      cursor_date, cursor_pk = decodeReviewCursor(request.GET['cursor'])
+    except ValueError as e:
+      logger.warning(f"getUserReviewsPage: {e}")
+      return HttpResponse("Invalid cursor.", status=400)
+    reviews = reviews.filter(Q(aotd_date__lt=cursor_date) | Q(aotd_date=cursor_date, pk__lt=cursor_pk))
+  # Fetch one extra row to find out if there is another page
+  page = list(reviews[:limit + 1])
+  has_next = (len(page) > limit)
+  page = page[:limit]
+  # Build response
+  out = {}
+  out['reviews'] = [review.toJSON(full=True, include_raw_album=include_raw_album) for review in page]
+  out['next_cursor'] = encodeReviewCursor(page[-1]) if has_next else None
+  # Attach timestamp
+  out['metadata'] = {}
+  out['metadata']['timestamp'] = datetime.datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
+  # Return data
+  return JsonResponse(out)
+
+
+###
+# Export ALL Reviews made by a user as newline delimited JSON (One review per line), newest AOtD first.
+# Reviews are streamed from the database in chunks, so memory use does not grow with the length of the history.
+# Optional Query Params:
+# - raw_album: "false" to leave out each album's raw MusicBrainz data
+###
+def exportUserReviews(request: HttpRequest, user_discord_id: str = None):
+  # Make sure request is a get request
+  if(request.method != "GET"):
+    logger.warning("exportUserReviews called with a non-GET method, returning 405.")
+    res = HttpResponse("Method not allowed")
+    res.status_code = 405
+    return res
+  # Retrieve user from session cookie
+  user = getUserObj(request.session.get('discord_id') if (user_discord_id == None) else user_discord_id)
+  if(user == None):
+    return HttpResponse("User not found.", status=404)
+  include_raw_album = (request.GET.get('raw_album') != "false")
+  reviews = getUserReviewHistoryQuery(user, include_raw_album)
+
+  def reviewLines():
+    # Reactions, users and albums are fetched per chunk, keeping the query count at a few per chunk
+    for review in reviews.iterator(chunk_size=REVIEW_EXPORT_CHUNK_SIZE):
+      yield json.dumps(review.toJSON(full=True, include_raw_album=include_raw_album), cls=DjangoJSONEncoder) + "\n"
+
+  async def asyncReviewLines():
+    # ASGI servers read a sync stream to the end before sending it, so stream chunks straight from an async iterator
+    async for review in reviews.aiterator(chunk_size=REVIEW_EXPORT_CHUNK_SIZE):
+      yield json.dumps(review.toJSON(full=True, include_raw_album=include_raw_album), cls=DjangoJSONEncoder) + "\n"
+
+  # Build streaming response, with the iterator type the server streams without buffering
+  lines = asyncReviewLines() if isinstance(request, ASGIRequest) else reviewLines()
+  response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+  response['Content-Disposition'] = f"attachment; filename=\"reviews_{user.discord_id}.ndjson\""
+  return response
+
+
 ###
 # Get Review statistics for a passed in month
 ###
+@cachedView(depends_on=["Review"])
 def getReviewStatsByMonth(request: HttpRequest, year: str, month: str):
   # Make sure request is a get request
   if(request.method != "GET"):
@@ -353,72 +476,8 @@ def getReviewStatsByMonth(request: HttpRequest, year: str, month: str):
     return res
   # Retrieve all reviews for the passed in month
   monthReviews = Review.objects.filter(review_date__year=year, review_date__month=month)
-  # Get overall review data
-  stat_reviewTotal = monthReviews.count()
-  stat_reviewScoreSum = monthReviews.aggregate(Sum('score'))['score__sum']
-  stat_reviewAverage = (stat_reviewScoreSum/float(stat_reviewTotal)) if (stat_reviewTotal != 0) else 0
-  stat_totalFirstListens = monthReviews.filter(first_listen=True).count()
-  stat_firstListenPercentage = (stat_totalFirstListens/float(stat_reviewTotal) * 100) if (stat_reviewTotal != 0) else 0
-  # Get stats related to user
-  users = monthReviews.values_list('user__discord_id', flat=True).distinct()
-  # Track user's total review count and sum of reviews, get user averages
-  stat_userStats = {}
-  stat_biggestHater = (None, None)
-  stat_biggestLover = (None, None)
-  for user_id in users:
-    userReviews = monthReviews.filter(user__discord_id=user_id)
-    reviewCount = userReviews.count()
-    reviewSum = userReviews.aggregate(Sum('score'))['score__sum']
-    averageScore = (reviewSum/float(reviewCount)) if (reviewCount != 0) else 0
-    firstListenCount = userReviews.filter(first_listen=True).count()
-    # Only check biggest lover and hater if the user has a review count of at least a third of the overall album count
-    if(reviewCount > (monthReviews.values_list('album').distinct().count() / 3)):
-      if((stat_biggestLover[0] == None) or (stat_biggestLover[1] < averageScore)):
-        stat_biggestLover = (user_id, averageScore)
-      if((stat_biggestHater[0] == None) or (stat_biggestHater[1] > averageScore)):
-        stat_biggestHater = (user_id, averageScore)
-    # Add user data to userStats
-    stat_userStats[user_id] = {
-      "discord_id": user_id,
-      "review_count": reviewCount,
-      "review_sum": reviewSum,
-      "review_average": averageScore,
-      "first_listen_count": firstListenCount,
-      "first_listen_percentage": ((firstListenCount/float(reviewCount) * 100) if (reviewCount != 0) else 0),
-      "score_breakdown": []
-    }
-  # Get breakdown of all scores by count and data
-  stat_reviewScoreBreakdown = []
-  score = 0.0
-  while score <= 10.0:
-    # Query all reviews of this score
-    reviews = monthReviews.filter(score=score)
-    stat_reviewScoreBreakdown.append({
-      "score": f"{score + 0.0}",
-      "count": reviews.count(),
-      "percent": (reviews.filter(score=score).count()/float(stat_reviewTotal) * 100) if (stat_reviewTotal != 0) else 0
-    })
-    # Add count of reviews for individual user breakdown
-    for user_id in users:
-      stat_userStats[user_id]['score_breakdown'].append({
-        "score": f"{score + 0.0}",
-        "count": reviews.filter(user__discord_id=user_id).count(),
-        "percent": ((reviews.filter(score=score).filter(user__discord_id=user_id).count()/float(stat_userStats[user_id]['review_count']) * 100) if (stat_userStats[user_id]['review_count'] != 0) else 0)
-      })
-    # Increment score
-    score += 0.5
-  # Create and populate out object
-  out = {}
-  # Attach stats
-  out['total_reviews'] = stat_reviewTotal
-  out['all_review_sum'] = stat_reviewScoreSum
-  out['all_review_average'] = stat_reviewAverage
-  out['biggest_lover_id'] = stat_biggestLover[0]
-  out['biggest_hater_id'] = stat_biggestHater[0]
-  out['all_first_listen_count'] = stat_totalFirstListens
-  out['all_first_listen_percentage'] = stat_firstListenPercentage
-  out['user_stats'] = stat_userStats
-  out['score_stats'] = stat_reviewScoreBreakdown
+  # Calculate all stats for the month's reviews from a single query
+  out = calculateReviewStats(monthReviews)
   # Attach timestamp
   out['metadata'] = {}
   out['metadata']['timestamp'] = datetime.datetime.now().strftime("%m/%d/%Y, %H:%M:%S")
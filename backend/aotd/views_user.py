@@ -1,11 +1,15 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.forms.models import model_to_dict
+from backend.responses import JsonResponse
 
 from users.utils import getUserObj
 
 from .models import (
   AotdUserData,
 )
+from .utils import (
+  getAotdUserObj
+)
 
 import logging
 import requests
@@ -126,6 +130,6 @@ def getSelectionBlockedFlag(request: HttpRequest):
   # Get user data from session
   user = getUserObj(request.session.get('discord_id'))
   # Retrieve and return that user's flag status
-  flag_status = (AotdUserData.objects.get(user=user)).selection_blocked_flag
+  flag_status = getAotdUserObj(user.discord_id).selection_blocked_flag
   logger.info(f"Returning selection blocked flag status of {flag_status} for user {user.discord_id}...")
   return JsonResponse({"selection_blocked": flag_status})
\ No newline at end of file
@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
+
+The event stream (/events/stream) holds its connection open, so serve this application
+with an ASGI server (e.g. `uvicorn backend.asgi:application`) rather than WSGI. Set
+EVENT_BROKER=POSTGRES when running more than one worker process so events published in
+one worker reach the streams held by the others.
 """
 
 import os
@@ -0,0 +1,176 @@
+from django.db import connections, transaction
+from django.utils import timezone
+
+import asyncio
+import logging
+import threading
+import json
+import time
+import os
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Postgres channel used when events are shared between worker processes
+EVENT_CHANNEL = "site_events"
+
+##
+# A single subscriber's queue of pending events, owned by the event loop that created it.
+##
+class EventSubscription:
+
+  def __init__(self, event_types: set = None, max_pending: int = 100):
+    self.loop = asyncio.get_running_loop()
+    self.queue = asyncio.Queue(maxsize=max_pending)
+    self.event_types = event_types
+
+  def wants(self, event: dict):
+    """Return true if this subscriber asked for events of this type (or for all events)"""
+    return (not self.event_types) or (event['type'] in self.event_types)
+
+  def deliver(self, event: dict):
+    """Queue an event for this subscriber, must be run on the subscriber's loop"""
+    try:
+      self.queue.put_nowait(event)
+    except asyncio.QueueFull:
+      # A subscriber that stopped reading should not hold events for everyone else
+      logger.warning(f"Dropping {event['type']} event for slow event stream subscriber")
+
+  async def get(self, timeout: float):
+    """Wait up to timeout seconds for the next event, returning None on timeout"""
+    try:
+      return await asyncio.wait_for(self.queue.get(), timeout)
+    except asyncio.TimeoutError:
+      return None
+
+
+##
+# Pub/sub broker that fans events out to the subscribers of this process.
+# Events can be published from any thread (sync views run in worker threads under ASGI).
+##
+class LocalEventBroker:
+
+  def __init__(self):
+    self.subscriptions = set()
+    self.lock = threading.Lock()
+
+  def subscribe(self, event_types: set = None):
+    """Register a subscriber on the running event loop"""
+    subscription = EventSubscription(event_types)
+    with self.lock:
+      self.subscriptions.add(subscription)
+    return subscription
+
+  def unsubscribe(self, subscription: EventSubscription):
+    """Remove a subscriber, safe to call more than once"""
+    with self.lock:
+      self.subscriptions.discard(subscription)
+
+  def subscriber_count(self):
+    return len(self.subscriptions)
+
+  def publish(self, event: dict):
+    """Publish an event to all subscribers"""
+    self.fanOut(event)
+
+  def fanOut(self, event: dict):
+    """Hand an event to every interested subscriber of this process on its own loop"""
+    with self.lock:
+      subscriptions = [subscription for subscription in self.subscriptions if subscription.wants(event)]
+    for subscription in subscriptions:
+      try:
+        subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+      except RuntimeError:
+        # The subscriber's loop has closed, it will never read again
+        self.unsubscribe(subscription)
+
+
+##
+# Pub/sub broker that shares events between processes with Postgres LISTEN/NOTIFY.
+# Publishing sends a NOTIFY, and a single listener thread per process fans notifications out to local subscribers.
+##
+class PostgresEventBroker(LocalEventBroker):
+
+  def __init__(self, db_alias: str = "default", channel: str = EVENT_CHANNEL):
+    super().__init__()
+    self.db_alias = db_alias
+    self.channel = channel
+    self.listener = None
+
+  def subscribe(self, event_types: set = None):
+    self.startListener()
+    return super().subscribe(event_types)
+
+  def publish(self, event: dict):
+    """Publish an event to subscribers of every process (Including this one, through the listener)"""
+    with connections[self.db_alias].cursor() as cursor:
+      cursor.execute("SELECT pg_notify(%s, %s)", [self.channel, json.dumps(event, default=str)])
+
+  def startListener(self):
+    """Start the notification listener thread for this process if it is not already running"""
+    with self.lock:
+      if((self.listener != None) and self.listener.is_alive()):
+        return
+      self.listener = threading.Thread(target=self.listen, name="event-broker-listener", daemon=True)
+      self.listener.start()
+
+  def listen(self):
+    """Forward notifications to local subscribers, reconnecting if the connection drops"""
+    while True:
+      try:
+        # Open a dedicated autocommit connection, outside of Django's per-thread connection handling
+        wrapper = connections[self.db_alias]
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        conn.autocommit = True
+        conn.execute(f"LISTEN {self.channel}")
+        logger.info(f"Listening for events on postgres channel {self.channel}")
+        for notification in conn.notifies():
+          self.fanOut(json.loads(notification.payload))
+      except Exception as e:
+        logger.error(f"Event listener lost its postgres connection, retrying in 5 seconds. Error: {e}")
+        time.sleep(5)
+
+
+# Process wide broker, created on first use
+_broker = None
+_broker_lock = threading.Lock()
+
+def getEventBroker():
+  """
+  Return the event broker for this process.
+  The EVENT_BROKER environment variable selects it: LOCAL (default, single process) or POSTGRES (shared by all workers).
+  """
+  global _broker
+  with _broker_lock:
+    if(_broker == None):
+      if((os.getenv('EVENT_BROKER') or 'LOCAL').upper() == 'POSTGRES'):
+        _broker = PostgresEventBroker()
+      else:
+        _broker = LocalEventBroker()
+    return _broker
+
+
+def publishEvent(event_type: str, data: dict):
+  """
+  Publish an event to event stream subscribers once the current transaction commits.
+  Parameters:
+  - event_type: One of "review", "reaction", "aotd" or "presence"
+  - data: JSON serializable event data, kept small (Postgres limits notifications to 8000 bytes)
+  """
+  event = {
+    "type": event_type,
+    "data": data,
+    "timestamp": timezone.now().isoformat()
+  }
+  def send():
+    try:
+      getEventBroker().publish(event)
+    except Exception as e:
+      # Streaming is best effort, never fail the write that produced the event
+      logger.error(f"Failed to publish {event_type} event. Error: {e}")
+  transaction.on_commit(send)
+
+
+def formatServerSentEvent(event: dict):
+  """Format an event as a Server-Sent Events message"""
+  return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
@@ -0,0 +1,120 @@
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified, FileResponse, StreamingHttpResponse, Http404
+from django.utils.http import http_date, parse_http_date_safe
+
+import mimetypes
+import logging
+import re
+import os
+
+from .view_cache import etagMatches
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Cache-Control for files whose url changes whenever their content does (e.g. content addressed files)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# How file transfers are handed to the front proxy: "X-Accel-Redirect" (nginx), "X-Sendfile" (Apache/lighttpd), or unset to send files from Django
+FILE_OFFLOAD = os.getenv('FILE_OFFLOAD') or None
+# Bytes read at a time when sending part of a file
+RANGE_CHUNK_SIZE = 64 * 1024
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def fileETag(stat: os.stat_result):
+  """Build an ETag from a file's size and modification time (Changes whenever the file is replaced)"""
+  return f"\"{stat.st_size:x}-{stat.st_mtime_ns:x}\""
+
+
+def parseRangeHeader(header: str, size: int):
+  """
+  Parse a single byte range Range header, returning an inclusive (start, end) tuple, or None to send the whole file.
+  Raises ValueError if the range cannot be satisfied. Multiple ranges are not supported and get the whole file.
+  """
+  match = RANGE_PATTERN.match(header.strip())
+  if(match == None):
+    return None
+  start, end = match.groups()
+  if(start == ""):
+    # Suffix range, the last N bytes
+    if((end == "") or (int(end) == 0)):
+      raise ValueError("Empty suffix range")
+    return max(size - int(end), 0), size - 1
+  start = int(start)
+  end = min(int(end), size - 1) if end else size - 1
+  if((start >= size) or (start > end)):
+    raise ValueError("Range starts after the end of the file")
+  return start, end
+
+
+def readFileRange(path: str, start: int, end: int):
+  """Yield the bytes of a file from start to end (inclusive) in chunks"""
+  with open(path, "rb") as file:
+    file.seek(start)
+    remaining = end - start + 1
+    while(remaining > 0):
+      chunk = file.read(min(RANGE_CHUNK_SIZE, remaining))
+      if(not chunk):
+        break
+      remaining -= len(chunk)
+      yield chunk
+
+
+def isNotModified(request: HttpRequest, etag: str, last_modified: float):
+  """Return true if the request's validators match this version of the file (If-None-Match takes precedence over If-Modified-Since)"""
+  if(request.headers.get('If-None-Match')):
+    return etagMatches(request, etag)
+  modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ""))
+  return (modified_since != None) and (int(last_modified) <= modified_since)
+
+
+def serveFile(request: HttpRequest, path: str, content_type: str = None, etag: str = None, cache_control: str = IMMUTABLE_CACHE_CONTROL, offload_uri: str = None):
+  """
+  Serve a file from disk with validators, answering conditional requests with a 304 and Range requests with a 206.
+  If FILE_OFFLOAD is set, the transfer is handed to the front proxy and no file content passes through Django.
+  Parameters:
+  - request: The request being served
+  - path: Path of the file on disk
+  - content_type: MIME type of the file, guessed from its name if not passed
+  - etag: Strong ETag (Including quotes) identifying this version of the file, built from its size and modification time if not passed
+  - cache_control: Cache-Control header value
+  - offload_uri: Internal proxy location of the file, needed for X-Accel-Redirect (Files without one are sent from Django)
+  """
+  try:
+    stat = os.stat(path)
+  except (FileNotFoundError, NotADirectoryError):
+    raise Http404("File not found")
+  etag = etag or fileETag(stat)
+  content_type = content_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+  # Respond with a 304 if the client already has this version
+  if(isNotModified(request, etag, stat.st_mtime)):
+    response = HttpResponseNotModified()
+  elif((FILE_OFFLOAD == "X-Accel-Redirect") and offload_uri):
+    # nginx sends the file (And handles ranges and conditional requests itself)
+    response = HttpResponse(content_type=content_type)
+    response['X-Accel-Redirect'] = offload_uri
+  elif(FILE_OFFLOAD == "X-Sendfile"):
+    response = HttpResponse(content_type=content_type)
+    response['X-Sendfile'] = os.path.abspath(path)
+  else:
+    byte_range = None
+    # Ranges are only honoured if the client's copy (If-Range) is this version
+    if(request.headers.get('Range') and ((not request.headers.get('If-Range')) or (request.headers['If-Range'] == etag))):
+      try:
+        byte_range = parseRangeHeader(request.headers['Range'], stat.st_size)
+      except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{stat.st_size}"
+        return response
+    if(byte_range == None):
+      response = FileResponse(open(path, "rb"), content_type=content_type)
+    else:
+      start, end = byte_range
+      response = StreamingHttpResponse(readFileRange(path, start, end), status=206, content_type=content_type)
+      response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+      response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = "bytes"
+  response['ETag'] = etag
+  response['Last-Modified'] = http_date(stat.st_mtime)
+  response['Cache-Control'] = cache_control
+  return response
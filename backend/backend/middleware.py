@@ -1,4 +1,4 @@
-from django.http import HttpRequest, JsonResponse
+from django.http import HttpRequest
 from django.utils import timezone
 
 from users.models import (
@@ -6,7 +6,6 @@ from users.models import (
 )
 
 import logging
-import json
 
 class metadataMiddleware:
 
@@ -24,14 +23,13 @@ class metadataMiddleware:
     response = self.get_response(request)
     # Code after this line is executed after the view is called
 
-    # If the response is a JsonResponse, attach or override the response metadata timestamp
-    if isinstance(response, JsonResponse):
-      data = json.loads(response.content)
-      data['meta'] = { 'timestamp': timezone.now().strftime("%d/%m/%Y, %H:%M:%S") }
-      response.content = json.dumps(data)
-    # Attach a header to show that this was not a cache hit
-    response['X-Generated-At'] = timezone.now().strftime("%d/%m/%Y, %H:%M:%S") + " " + timezone.get_current_timezone_name()
-    response["Access-Control-Expose-Headers"] = "X-Generated-At"
+    # JSON bodies get their "meta" key when serialized (See backend/responses.py), so the body is never touched here
+    # Attach a header showing when the data was generated, and whether it came from the view cache (Also the only metadata for streaming responses, whose body is never buffered)
+    generated_at = timezone.localtime(getattr(response, 'generated_at', None) or timezone.now())
+    response['X-Generated-At'] = generated_at.strftime("%d/%m/%Y, %H:%M:%S") + " " + timezone.get_current_timezone_name()
+    if hasattr(response, 'cache_status'):
+      response['X-Generated-At'] += f" (CACHE {response.cache_status})"
+    response["Access-Control-Expose-Headers"] = "X-Generated-At, ETag"
     
     # Returning the response
     return response
\ No newline at end of file
@@ -0,0 +1,23 @@
+from django.http import JsonResponse as DjangoJsonResponse
+from django.utils import timezone
+
+import datetime
+
+
+def jsonMetadata(generated_at: datetime.datetime):
+  """Return the "meta" entry of a JSON response generated at a time"""
+  return { 'timestamp': generated_at.strftime("%d/%m/%Y, %H:%M:%S") }
+
+
+class JsonResponse(DjangoJsonResponse):
+  """
+  JsonResponse that adds the response metadata (A "meta" key) to object data as it is serialized, so the body is never
+  parsed or rewritten afterwards. A "meta" key returned by the view is replaced. Non-object data (safe=False lists) is
+  serialized as is. The generation time is kept on the response as generated_at (Read by metadataMiddleware and cachedView).
+  """
+
+  def __init__(self, data, *args, **kwargs):
+    self.generated_at = timezone.now()
+    if isinstance(data, dict):
+      data = {**data, 'meta': jsonMetadata(self.generated_at)}
+    super().__init__(data, *args, **kwargs)
@@ -0,0 +1,69 @@
+# Compare the latency of adding response metadata against the previous implementation (which parsed and re-serialized every JSON body in metadataMiddleware)
+# Usage: python manage.py runscript backend.scripts.benchmark_metadata_middleware --script-args [rows] [iterations]
+from django.http import JsonResponse as DjangoJsonResponse
+from django.test import RequestFactory
+from django.utils import timezone
+
+from backend.middleware import metadataMiddleware
+from backend.responses import JsonResponse
+
+import json
+import time
+import numpy
+
+
+# Previous implementation, kept here as the baseline
+def legacyMetadata(response):
+  if isinstance(response, DjangoJsonResponse):
+    data = json.loads(response.content)
+    data['meta'] = { 'timestamp': timezone.now().strftime("%d/%m/%Y, %H:%M:%S") }
+    response.content = json.dumps(data)
+  response['X-Generated-At'] = timezone.now().strftime("%d/%m/%Y, %H:%M:%S") + " " + timezone.get_current_timezone_name()
+  response["Access-Control-Expose-Headers"] = "X-Generated-At"
+  return response
+
+
+# Build a payload shaped like getAllUserReviews/getAllAlbums
+def buildPayload(rows: int):
+  return {
+    "review_list": [
+      {
+        "id": index,
+        "album_id": f"{index:08d}-0000-0000-0000-000000000000",
+        "user_id": str(index % 40),
+        "score": (index % 21) / 2,
+        "comment": "Some thoughts on this album. " * 8,
+        "review_date": "10/18/2026, 12:00:00",
+        "first_listen": (index % 2 == 0),
+        "reactions": [{"id": index, "emoji": ":fire:", "user_id": "1"}],
+      }
+      for index in range(rows)
+    ]
+  }
+
+
+def measure(respond, payload: dict, iterations: int):
+  timings = []
+  for _ in range(iterations):
+    # Time serialization along with the middleware, since metadata is now added while serializing
+    start = time.perf_counter()
+    respond(payload)
+    timings.append((time.perf_counter() - start) * 1000)
+  return numpy.percentile(timings, 50), numpy.percentile(timings, 99)
+
+
+def run(*args):
+  rows = int(args[0]) if (len(args) > 0) else 5000
+  iterations = int(args[1]) if (len(args) > 1) else 50
+  payload = buildPayload(rows)
+  request = RequestFactory().get("/")
+  middleware = metadataMiddleware(lambda request: request.benchmark_response)
+  def before(payload: dict):
+    return legacyMetadata(DjangoJsonResponse(payload))
+  def after(payload: dict):
+    request.benchmark_response = JsonResponse(payload)
+    return middleware(request)
+  print(f"Payload: {rows} rows, {len(DjangoJsonResponse(payload).content)/1024/1024:.2f} MB, {iterations} iterations")
+  for name, respond in [("Before (re-parse)", before), ("After (serialize)", after)]:
+    p50, p99 = measure(respond, payload, iterations)
+    print(f"{name:<20} p50: {p50:8.3f} ms   p99: {p99:8.3f} ms")
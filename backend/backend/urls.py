@@ -17,6 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from . import views
+
 urlpatterns = [
     # Prometheus URLs
     path('', include('django_prometheus.urls')),
@@ -28,5 +30,7 @@ urlpatterns = [
     path("spotifyapi/", include('spotifyapi.urls')),
     path("aotd/", include('aotd.urls')),
     path("tenor/", include('tenor.urls')),
+    # Server-Sent Events stream of site updates
+    path("events/stream", views.streamEvents),
     path('admin/', admin.site.urls),
 ]
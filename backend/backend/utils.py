@@ -47,4 +47,21 @@ def postToDiscordWebhook(contentJson: dict, mainMessage: str):
   discordRes = requests.post(f"{os.getenv('DISCORD_WEBHOOK_URL')}", data=json.dumps(payload), headers=headers)
   # Check response
   if(discordRes.status_code != 200):
-    logger.error(f"ERROR: Failed to post data to discord alert webhook\n\tResponse message:\n\t{discordRes.text}")
\ No newline at end of file
+    logger.error(f"ERROR: Failed to post data to discord alert webhook\n\tResponse message:\n\t{discordRes.text}")
+
+##
+# Count the database queries made while it is installed, works regardless of DEBUG.
+# Example:
+#   counter = QueryCounter()
+#   with connection.execute_wrapper(counter):
+#     ...
+#   print(counter.count)
+##
+class QueryCounter:
+
+  def __init__(self):
+    self.count = 0
+
+  def __call__(self, execute, sql, params, many, context):
+    self.count += 1
+    return execute(sql, params, many, context)
@@ -0,0 +1,122 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+import functools
+import hashlib
+import logging
+import time
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Default seconds a cached response is kept, entries are normally replaced well before this by a generation bump
+VIEW_CACHE_TIMEOUT = 60 * 60 * 24
+
+##
+# Response cache for GET views whose output only depends on a few models.
+# Each model has a generation counter that is bumped (from model signals) whenever one of its rows changes.
+# Cache keys include the current generations of the models a view depends on, so a bump makes every
+# dependent entry unreachable without having to find and delete them.
+# NOTE: The counters live in the configured Django cache. With more than one worker process, CACHES must
+#       point at a shared backend (e.g. Redis or Memcached) for a bump in one worker to reach the others.
+##
+
+def generationKey(model_name: str):
+  return f"view_cache_generation:{model_name}"
+
+
+def getGenerations(model_names: list):
+  """Return the current generation of each model, starting any missing counter"""
+  keys = [generationKey(name) for name in model_names]
+  generations = cache.get_many(keys)
+  for key in keys:
+    if(key not in generations):
+      # Seed from the clock so a counter lost to eviction never repeats an earlier value
+      cache.add(key, time.time_ns(), timeout=None)
+      generations[key] = cache.get(key)
+  return [generations[key] for key in keys]
+
+
+def bumpGeneration(*model_names: str):
+  """Invalidate cached responses that depend on the passed in models, once the current transaction commits"""
+  def bump():
+    for name in model_names:
+      try:
+        cache.incr(generationKey(name))
+      except ValueError:
+        # Counter was never started (or was evicted)
+        cache.set(generationKey(name), time.time_ns(), timeout=None)
+  # Bumping before commit would let a concurrent request cache pre-commit data under the new generation
+  transaction.on_commit(bump)
+
+
+class CachedJsonResponse(JsonResponse):
+  """A JsonResponse built from already serialized content (Which already carries the "meta" key it was generated with)"""
+
+  def __init__(self, content: bytes, content_type: str, **kwargs):
+    HttpResponse.__init__(self, content=content, content_type=content_type, **kwargs)
+
+
+def etagMatches(request: HttpRequest, etag: str):
+  """Return true if the request's If-None-Match header matches the etag"""
+  header = request.headers.get('If-None-Match')
+  if(not header):
+    return False
+  etags = parse_etags(header)
+  # Weak comparison, as If-None-Match requires
+  return ("*" in etags) or (etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in etags])
+
+
+def cachedView(depends_on: list, timeout: int = VIEW_CACHE_TIMEOUT):
+  """
+  Decorator caching successful GET responses of a view until one of the models it depends on changes.
+  Responses carry a strong ETag of the cached body (Which includes the "meta" timestamp it was generated with, so every
+  hit is byte for byte identical), and requests sending a matching If-None-Match get a 304.
+  Parameters:
+  - depends_on: Model names (as passed to bumpGeneration) whose changes invalidate the view's responses
+  - timeout: Seconds to keep a cached response
+  """
+  def decorator(view):
+    @functools.wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+      if(request.method != "GET"):
+        return view(request, *args, **kwargs)
+      # Build key from the view, its full path and the generation of each model it depends on
+      generations = ".".join(str(generation) for generation in getGenerations(depends_on))
+      path_hash = hashlib.sha256(request.get_full_path().encode()).hexdigest()
+      key = f"view_cache:{view.__module__}.{view.__name__}:{path_hash}:{generations}"
+      entry = cache.get(key)
+      if(entry == None):
+        response = view(request, *args, **kwargs)
+        # Only cache complete, successful JSON responses
+        if((response.status_code != 200) or response.streaming or (not isinstance(response, JsonResponse))):
+          return response
+        entry = {
+          "content": response.content,
+          "content_type": response['Content-Type'],
+          "etag": f"\"{hashlib.sha256(response.content).hexdigest()}\"",
+          # The time in the body's "meta" key, shown by metadataMiddleware for every hit
+          "generated_at": getattr(response, 'generated_at', None) or timezone.now(),
+        }
+        cache.set(key, entry, timeout)
+        cache_status = "MISS"
+      else:
+        cache_status = "HIT"
+        logger.debug(f"View cache hit for {view.__name__}")
+      # Respond with a 304 if the client already has this version, otherwise the full content
+      if(etagMatches(request, entry['etag'])):
+        response = HttpResponseNotModified()
+      else:
+        response = CachedJsonResponse(entry['content'], entry['content_type'])
+      response['ETag'] = entry['etag']
+      # Clients must revalidate, but can reuse their copy when it is still current
+      response['Cache-Control'] = "no-cache"
+      # Read by metadataMiddleware for the X-Generated-At header
+      response.cache_status = cache_status
+      response.generated_at = entry['generated_at']
+      return response
+    return wrapper
+  return decorator
@@ -0,0 +1,76 @@
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+
+import logging
+
+from .events import (
+  getEventBroker,
+  formatServerSentEvent
+)
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Event types a client can subscribe to
+EVENT_TYPES = {"review", "reaction", "aotd", "presence"}
+# Seconds between keepalive comments, keeps proxies from closing idle streams
+KEEPALIVE_SECONDS = 15
+
+
+###
+# Stream review, reaction, AOtD selection and presence events to the client as Server-Sent Events.
+# Optional query param "types" is a comma separated list of event types to receive (defaults to all).
+# Must be served by the ASGI application (backend/asgi.py) so that an open stream does not hold a worker thread.
+###
+async def streamEvents(request: HttpRequest):
+  # Make sure request is a get request
+  if(request.method != "GET"):
+    logger.warning("streamEvents called with a non-GET method, returning 405.")
+    res = HttpResponse("Method not allowed")
+    res.status_code = 405
+    return res
+  # A WSGI server reads the whole stream before sending it, which for a stream that never ends means never responding
+  if(not isinstance(request, ASGIRequest)):
+    logger.error("streamEvents called through WSGI, returning 503. Serve backend.asgi:application with an ASGI server.")
+    res = HttpResponse("Event stream requires an ASGI server")
+    res.status_code = 503
+    return res
+  # Only logged in users can subscribe
+  discord_id = await request.session.aget('discord_id')
+  if(discord_id == None):
+    logger.warning("streamEvents called without a session, returning 401.")
+    res = HttpResponse("Not logged in")
+    res.status_code = 401
+    return res
+  # Validate requested event types
+  requested_types = set(filter(None, request.GET.get('types', "").split(",")))
+  if(not requested_types.issubset(EVENT_TYPES)):
+    res = HttpResponse(f"Unknown event types: {', '.join(sorted(requested_types - EVENT_TYPES))}")
+    res.status_code = 400
+    return res
+
+  async def eventStream():
+    # Subscribe inside the generator so the subscription belongs to the loop serving the stream
+    broker = getEventBroker()
+    subscription = broker.subscribe(requested_types)
+    logger.info(f"Event stream opened for {discord_id} ({broker.subscriber_count()} subscribers)")
+    try:
+      # Tell the browser how long to wait before reconnecting
+      yield "retry: 5000\n\n"
+      while True:
+        event = await subscription.get(KEEPALIVE_SECONDS)
+        if(event == None):
+          yield ": keepalive\n\n"
+        else:
+          yield formatServerSentEvent(event)
+    finally:
+      # Runs when the client disconnects and the stream is cancelled
+      broker.unsubscribe(subscription)
+      logger.info(f"Event stream closed for {discord_id}")
+
+  # Build streaming response
+  response = StreamingHttpResponse(eventStream(), content_type="text/event-stream")
+  response['Cache-Control'] = "no-cache"
+  # Disable response buffering in nginx
+  response['X-Accel-Buffering'] = "no"
+  return response
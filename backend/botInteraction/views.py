@@ -1,4 +1,5 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
+from backend.responses import JsonResponse
 
 import logging
 from dotenv import load_dotenv
@@ -0,0 +1,135 @@
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import os
+
+from users.models import (
+  User
+)
+from discordapi.models import (
+  DiscordTokens
+)
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Seconds a user's avatar is trusted after it was checked against the Discord CDN
+DISCORD_AVATAR_CHECK_SECONDS = int(os.getenv('DISCORD_AVATAR_CHECK_SECONDS') or 60 * 60 * 6)
+# Seconds before a failed check is retried
+DISCORD_AVATAR_RETRY_SECONDS = 60 * 5
+# Users checked at a time (Loaded with one query)
+DISCORD_AVATAR_BATCH_SIZE = 25
+# Seconds to wait to connect and for a response
+DISCORD_AVATAR_TIMEOUT = (3.05, 10)
+
+##
+# Out of band avatar validation. Discord changes the avatar url when a user changes their avatar, so a stored avatar hash
+# can go stale (The old url 404s). Auth checks only queue a user for a check, which is a cache lookup when the avatar was
+# checked recently. Queued users are checked in batches by a background worker, which fetches the new avatar hash from
+# the Discord API when the old url is gone.
+##
+
+# Reused connection to the Discord CDN and API
+_session = requests.Session()
+
+
+def avatarCheckKey(user: User):
+  """Cache key of a user's avatar check (Includes the avatar hash, so a changed avatar is checked again)"""
+  return f"discord_avatar_checked:{user.discord_id}:{user.discord_avatar}"
+
+
+def isAvatarUrlValid(user: User):
+  """Return false if the CDN no longer has a user's stored avatar"""
+  response = _session.head(user.get_avatar_url(), timeout=DISCORD_AVATAR_TIMEOUT, allow_redirects=True)
+  if(response.status_code == 404):
+    return False
+  response.raise_for_status()
+  return True
+
+
+def fetchDiscordAvatar(user: User):
+  """Return a user's current avatar hash from the Discord API, using (And if needed refreshing) their stored token"""
+  from discordapi.utils import refreshDiscordToken
+  tokenData = DiscordTokens.objects.get(user=user)
+  # Ensure token is valid
+  if((tokenData.expiry_date == None) or (timezone.now() > tokenData.expiry_date)):
+    refreshDiscordToken(None, user.discord_id)
+    tokenData = DiscordTokens.objects.get(user=user)
+  reqHeaders = {
+    'Authorization': f"{tokenData.token_type} {tokenData.access_token}"
+  }
+  discordRes = _session.get(f"{os.getenv('DISCORD_API_ENDPOINT')}/users/@me", headers=reqHeaders, timeout=DISCORD_AVATAR_TIMEOUT)
+  discordRes.raise_for_status()
+  return discordRes.json()['avatar']
+
+
+def refreshDiscordAvatars(discord_ids: list):
+  """Check the avatars of a batch of users, storing the new avatar hash of any that went stale. Returns the number of users updated."""
+  updated = 0
+  for user in User.objects.filter(discord_id__in=discord_ids):
+    key = avatarCheckKey(user)
+    try:
+      if(not isAvatarUrlValid(user)):
+        logger.info(f"Refreshing discord profile picture of user {user.nickname}...")
+        avatar = fetchDiscordAvatar(user)
+        if(avatar != user.discord_avatar):
+          user.discord_avatar = avatar
+          user.save(update_fields=['discord_avatar'])
+          updated += 1
+      # Trust the (possibly new) avatar until the next check is due
+      cache.set(avatarCheckKey(user), "checked", timeout=DISCORD_AVATAR_CHECK_SECONDS)
+    except Exception as e:
+      logger.warning(f"Failed to check discord profile picture of user {user.nickname}, retrying later. Error: {e}")
+      cache.set(key, "failed", timeout=DISCORD_AVATAR_RETRY_SECONDS)
+  return updated
+
+
+# Discord IDs waiting for a check, and whether the worker is already draining them
+_pending = set()
+_pending_lock = threading.Lock()
+_draining = False
+
+# Background worker for avatar checks
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="discord-avatars")
+
+def queueAvatarCheck(user: User):
+  """
+  Queue a background check of a user's avatar, unless it was checked (or queued) within DISCORD_AVATAR_CHECK_SECONDS.
+  Only touches the cache, never makes a request. Returns true if the check was queued.
+  """
+  global _draining
+  # Claim the check, so each avatar is queued once no matter how many requests (or processes) see it
+  if(not cache.add(avatarCheckKey(user), "queued", timeout=DISCORD_AVATAR_CHECK_SECONDS)):
+    return False
+  with _pending_lock:
+    _pending.add(user.discord_id)
+    start = not _draining
+    _draining = True
+  if(start):
+    _executor.submit(drainAvatarChecks)
+  return True
+
+
+def drainAvatarChecks():
+  """Check queued avatars in batches until none are left"""
+  global _draining
+  try:
+    while True:
+      with _pending_lock:
+        if(len(_pending) == 0):
+          _draining = False
+          return
+        batch = [_pending.pop() for _ in range(min(len(_pending), DISCORD_AVATAR_BATCH_SIZE))]
+      try:
+        refreshDiscordAvatars(batch)
+      except Exception as e:
+        logger.error(f"Failed to check discord profile pictures of {len(batch)} users. Error: {e}")
+  finally:
+    # The worker thread's connection is not managed by the request cycle
+    connection.close()
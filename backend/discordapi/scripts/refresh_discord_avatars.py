@@ -0,0 +1,20 @@
+# Checks the discord profile picture of every user with a stored avatar, in batches, storing the new avatar of any that changed.
+# Avatars are normally checked in the background when their owner loads the site, run this to refresh users that have not been on in a while.
+from users.models import (
+  User
+)
+
+from discordapi.avatars import (
+  refreshDiscordAvatars,
+  DISCORD_AVATAR_BATCH_SIZE
+)
+
+def run():
+  # Retreive users with a custom avatar (Default avatars never go stale)
+  discord_ids = list(User.objects.exclude(discord_avatar=None).exclude(discord_avatar="").order_by('pk').values_list('discord_id', flat=True))
+  updated = 0
+  # Iterate batches
+  for start in range(0, len(discord_ids), DISCORD_AVATAR_BATCH_SIZE):
+    updated += refreshDiscordAvatars(discord_ids[start:start + DISCORD_AVATAR_BATCH_SIZE])
+    print(f"Checked {min(start + DISCORD_AVATAR_BATCH_SIZE, len(discord_ids))}/{len(discord_ids)} users")
+  print(f"\n\nUpdated {updated} profile pictures")
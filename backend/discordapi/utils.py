@@ -8,6 +8,9 @@ from users.models import (
 from discordapi.models import (
   DiscordTokens
 )
+from discordapi.avatars import (
+  queueAvatarCheck
+)
 
 import requests
 import datetime 
@@ -96,49 +99,12 @@ def refreshDiscordToken(request: HttpRequest, discord_user_id: str = ""):
   discordResJSON['id'] = userDiscordId
   # Store discord data in database
   storeDiscordTokenInDatabase(request, discordResJSON)
-  # After updating session, check if user's profile picture needs to be updated
-  refreshDiscordProfilePic(request)
+  # After updating session, check if user's profile picture needs to be updated (In the background)
+  queueAvatarCheck(tokenData.user)
   # Return True if Successful
   return True
 
 
-def refreshDiscordProfilePic(request: HttpRequest):
-  try:
-    # Check if user profile photo is still accurate, if not update data
-    user = User.objects.get(discord_id=request.session['discord_id'])
-    # Get user token data from DB
-    tokenData = DiscordTokens.objects.get(user = user)
-  except Exception as e:
-    return False
-  # Call avatar url
-  avatar_res = requests.get(user.get_avatar_url())
-  # If 404, refresh avatar data
-  if(avatar_res.status_code == 404):
-    logger.info("Refreshing user's discord profile picture...")
-    # Ensure user is logged in
-    if(isDiscordTokenExpired(request)):
-      refreshDiscordToken(request)
-    # Prep request data and headers to discord api
-    reqHeaders = { 
-      'Authorization': f"{tokenData.token_type} {tokenData.access_token}"
-    }
-    # Send Request to API
-    logger.info("Making request to discord api...")
-    try:
-      discordRes = requests.get(f"{os.getenv('DISCORD_API_ENDPOINT')}/users/@me", headers=reqHeaders)
-      if(discordRes.status_code != 200):
-        print("Error in request:\n" + str(discordRes.json()))
-        discordRes.raise_for_status()
-    except:
-      return HttpResponse(status=500)
-    # Convert response to Json
-    discordResJSON = discordRes.json()
-    # Store avatar hash in user object
-    user.discord_avatar = discordResJSON['avatar']
-    # Update user
-    user.save()
-
-
 def checkPreviousAuthorization(request: HttpRequest):
   # Check if session is stored in data
   logger.info("Checking if sessionid exists...")
@@ -146,7 +112,8 @@ def checkPreviousAuthorization(request: HttpRequest):
     # Get user instance and data
     user = User.objects.get(discord_id = request.session.get('discord_id'))
     tokenData = DiscordTokens.objects.get(user = user)
-    refreshDiscordProfilePic(request)
+    # Check the user's profile picture in the background if it has not been checked recently
+    queueAvatarCheck(user)
     return True
   except Exception as e:
     if(isinstance(e, (User.DoesNotExist, DiscordTokens.DoesNotExist))):
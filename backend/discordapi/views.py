@@ -1,5 +1,6 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.contrib.auth import logout as auth_logout
+from backend.responses import JsonResponse
 
 from users.utils import (
   doesUserExist,
@@ -1,6 +1,7 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.forms.models import model_to_dict
 from django.utils import timezone
+from backend.responses import JsonResponse
 
 import logging
 from dotenv import load_dotenv
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0004_image_content_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['-upload_timestamp', '-image_id'], name='image_upload_keyset_idx'),
+        ),
+    ]
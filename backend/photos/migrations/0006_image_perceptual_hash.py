@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0005_image_upload_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='perceptual_hash',
+            field=models.CharField(default=None, max_length=16, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('photos', '0006_image_perceptual_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='perceptual_hash_updated_at',
+            field=models.DateTimeField(db_index=True, default=None, null=True),
+        ),
+    ]
@@ -35,14 +35,50 @@ class Image(models.Model):
   )
   # Tagged Users
   tagged_users = models.ManyToManyField(User)
-  # Filename of the image
+  # Filename of the image (As uploaded. Legacy images are stored under it, prefixed with a random hex)
   filename = models.CharField(max_length=300)
+  # SHA-256 of the image file, which is stored under it (See photos/utils.py). Null for legacy images not yet rehomed
+  content_hash = models.CharField(max_length=64, null=True, default=None, db_index=True)
+  # Perceptual hash (dHash) of the image as hex, for finding near duplicates (See photos/perceptual_hash.py). Null until computed
+  perceptual_hash = models.CharField(max_length=16, null=True, default=None)
+  # When perceptual_hash was last written, so every process can tell its index of hashes is stale. Set along with the hash
+  perceptual_hash_updated_at = models.DateTimeField(null=True, default=None, db_index=True)
   # Filetype of the image
   filetype = models.CharField(
     max_length=100,
     null=True
   )
 
+  class Meta:
+    indexes = [
+      # Keyset pagination of the gallery, newest first (See views.getImagePage)
+      models.Index(fields=['-upload_timestamp', '-image_id'], name='image_upload_keyset_idx'),
+    ]
+
+  def displayFilename(self):
+    """Return the filename the image was uploaded with"""
+    if(self.content_hash == None):
+      # Remove hex in front of legacy filenames for readability
+      return self.filename[(self.filename.index("_") + 1):]
+    return self.filename
+
+  def toJSON(self):
+    """
+    Return the image's data as a dict. Use select_related('uploader', 'artist') and prefetch_related('tagged_users')
+    when serializing several images, so no query is made per image.
+    """
+    imageData = {}
+    imageData['image_id'] = self.image_id
+    imageData['title'] = self.title
+    imageData['description'] = self.description
+    imageData['upload_timestamp'] = self.upload_timestamp.strftime("%m/%d/%Y, %H:%M:%S")
+    imageData['uploader'] = self.uploader.discord_id if self.uploader else None
+    imageData['creator'] = self.artist.discord_id if self.artist else None
+    imageData['filename'] = self.displayFilename()
+    imageData['filetype'] = self.filetype
+    imageData['tagged_users'] = [user.discord_id for user in self.tagged_users.all()]
+    return imageData
+
   # toString Method
   def __str__(self):
     return self.title
\ No newline at end of file
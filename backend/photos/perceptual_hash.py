@@ -0,0 +1,139 @@
+from django.db.models import Count, Max
+
+from PIL import Image as PILImage
+import numpy as np
+
+import threading
+import datetime
+import logging
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Width and height of the grid an image is shrunk to before hashing (The hash has PERCEPTUAL_HASH_SIZE ** 2 bits)
+PERCEPTUAL_HASH_SIZE = 8
+# Default and largest hamming distance (In bits, out of 64) at which two images are considered near duplicates
+SIMILAR_IMAGE_DISTANCE = 10
+MAX_SIMILAR_IMAGE_DISTANCE = 20
+
+##
+# Near duplicate detection with a difference hash (dHash). An image is shrunk to a 9x8 greyscale grid and each bit of the hash
+# records whether a pixel is brighter than its left neighbour. Recompression, resizing and small edits only flip a few bits,
+# so the hamming distance between two hashes measures how alike the images look.
+# Hashes are stored on Image as 16 hex characters and searched with a BK-tree, which only visits the part of the tree within
+# the searched distance instead of comparing against every image.
+##
+
+def computePerceptualHash(path: str):
+  """Return the dHash of an image file as 16 hex characters (Animated images are hashed by their first frame)"""
+  with PILImage.open(path) as image:
+    # Let JPEGs decode at a reduced size, the hash only needs a few pixels
+    image.draft("L", (PERCEPTUAL_HASH_SIZE * 8, PERCEPTUAL_HASH_SIZE * 8))
+    grid = image.convert("L").resize((PERCEPTUAL_HASH_SIZE + 1, PERCEPTUAL_HASH_SIZE), PILImage.LANCZOS)
+  pixels = np.asarray(grid, dtype=np.int16)
+  bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+  return np.packbits(bits).tobytes().hex()
+
+
+def hammingDistance(hash_a: int, hash_b: int):
+  """Return the number of bits that differ between two hashes"""
+  return (hash_a ^ hash_b).bit_count()
+
+
+class BKTree:
+  """
+  Burkhard-Keller tree of integer hashes under the hamming distance. Each child is stored under its distance from its parent,
+  so by the triangle inequality a search within a distance only needs to descend into children whose key is that close to its own.
+  Each node holds every item added with its hash.
+  """
+
+  def __init__(self):
+    self.root = None
+    self.size = 0
+
+  def add(self, hash_value: int, item):
+    self.size += 1
+    if(self.root == None):
+      self.root = (hash_value, [item], {})
+      return
+    node = self.root
+    while True:
+      distance = hammingDistance(hash_value, node[0])
+      if(distance == 0):
+        node[1].append(item)
+        return
+      if(distance not in node[2]):
+        node[2][distance] = (hash_value, [item], {})
+        return
+      node = node[2][distance]
+
+  def search(self, hash_value: int, max_distance: int):
+    """Return a list of (distance, item) tuples for every item within max_distance of a hash, closest first"""
+    matches = []
+    if(self.root == None):
+      return matches
+    stack = [self.root]
+    while(len(stack) > 0):
+      node_hash, items, children = stack.pop()
+      distance = hammingDistance(hash_value, node_hash)
+      if(distance <= max_distance):
+        matches.extend((distance, item) for item in items)
+      for child_distance, child in children.items():
+        if(abs(child_distance - distance) <= max_distance):
+          stack.append(child)
+    matches.sort(key=lambda match: match[0])
+    return matches
+
+
+# Seconds before the newest hash seen that hashes are looked for again, so a hash that committed after a newer one is still picked up
+PERCEPTUAL_HASH_INDEX_WINDOW_SECONDS = 60 * 5
+
+# Process wide tree of every hashed image's id. Staleness is read from the database on every lookup (So hashes written by
+# other processes, like the backfill script, are found): new hashes are added to the tree, and it is only rebuilt when an
+# indexed image's hash changed or an image was deleted (The tree holds more images than are hashed)
+_index = None
+_indexed_hashes = {}
+_last_updated = None
+_index_lock = threading.Lock()
+
+def getPerceptualHashIndex():
+  """Return a BKTree of the ids of every image with a perceptual hash, keyed by the hash"""
+  global _index, _indexed_hashes, _last_updated
+  from .models import Image
+  with _index_lock:
+    state = Image.objects.aggregate(count=Count('perceptual_hash'), last_updated=Max('perceptual_hash_updated_at'))
+    if(_index != None):
+      if((state['count'] == len(_indexed_hashes)) and (state['last_updated'] == _last_updated)):
+        return _index
+      # Look for hashes written since the last lookup
+      images = Image.objects.exclude(perceptual_hash=None)
+      if(_last_updated != None):
+        images = images.filter(perceptual_hash_updated_at__gte=(_last_updated - datetime.timedelta(seconds=PERCEPTUAL_HASH_INDEX_WINDOW_SECONDS)))
+      new_hashes = {}
+      for image_id, perceptual_hash in images.values_list('image_id', 'perceptual_hash').iterator():
+        if(image_id not in _indexed_hashes):
+          new_hashes[image_id] = perceptual_hash
+        elif(_indexed_hashes[image_id] != perceptual_hash):
+          # The tree can't remove an image, rebuild it
+          new_hashes = None
+          break
+      if((new_hashes != None) and (len(_indexed_hashes) + len(new_hashes) == state['count'])):
+        for image_id, perceptual_hash in new_hashes.items():
+          _index.add(int(perceptual_hash, 16), image_id)
+        _indexed_hashes.update(new_hashes)
+        _last_updated = state['last_updated']
+        return _index
+    # Build the tree from every hashed image
+    _index = BKTree()
+    _indexed_hashes = {}
+    for image_id, perceptual_hash in Image.objects.exclude(perceptual_hash=None).values_list('image_id', 'perceptual_hash').iterator():
+      _index.add(int(perceptual_hash, 16), image_id)
+      _indexed_hashes[image_id] = perceptual_hash
+    _last_updated = state['last_updated']
+    logger.info(f"Built perceptual hash index of {_index.size} images")
+    return _index
+
+
+def findSimilarImages(perceptual_hash: str, max_distance: int = SIMILAR_IMAGE_DISTANCE):
+  """Return a list of (distance, image_id) tuples of every image within max_distance of a perceptual hash, closest first"""
+  return getPerceptualHashIndex().search(int(perceptual_hash, 16), max_distance)
@@ -0,0 +1,57 @@
+# Computes the perceptual hash (Used to find near duplicates) of every image that does not have one yet.
+# Hashes are normally computed at upload, run this once for images uploaded before that.
+# Files are decoded and hashed in a pool of worker processes, pass the number of processes to use (Defaults to one per CPU):
+# python manage.py runscript backfill_perceptual_hashes --script-args 4
+from concurrent.futures import ProcessPoolExecutor
+
+from django.utils import timezone
+
+from photos.models import (
+  Image
+)
+
+from photos.utils import (
+  photoPath
+)
+
+from photos.perceptual_hash import (
+  computePerceptualHash
+)
+
+# Images saved at a time
+BATCH_SIZE = 500
+
+def hashFile(path: str):
+  """Worker process task, returns the (path, hash, error) of a file"""
+  try:
+    return path, computePerceptualHash(path), None
+  except Exception as e:
+    return path, None, str(e)
+
+def run(*args):
+  processes = int(args[0]) if args else None
+  failed_update = []
+  # Retreive images without a hash, grouped by file (Images sharing a file share its hash)
+  images = list(Image.objects.filter(perceptual_hash=None).order_by('pk').only('image_id', 'filename', 'content_hash'))
+  images_by_path = {}
+  for image in images:
+    images_by_path.setdefault(photoPath(image), []).append(image)
+  print(f"Hashing {len(images_by_path)} files of {len(images)} images...")
+  updated = []
+  with ProcessPoolExecutor(max_workers=processes) as executor:
+    for index, (path, perceptual_hash, error) in enumerate(executor.map(hashFile, images_by_path.keys(), chunksize=16)):
+      if(error != None):
+        failed_update.append({"path": path, "error": error})
+        continue
+      for image in images_by_path[path]:
+        image.perceptual_hash = perceptual_hash
+        image.perceptual_hash_updated_at = timezone.now()
+        updated.append(image)
+      # Save finished images in batches, so an interrupted run keeps its progress
+      if(len(updated) >= BATCH_SIZE):
+        Image.objects.bulk_update(updated, ['perceptual_hash', 'perceptual_hash_updated_at'])
+        print(f"Saved {len(updated)} hashes ({index+1}/{len(images_by_path)} files)")
+        updated = []
+  Image.objects.bulk_update(updated, ['perceptual_hash', 'perceptual_hash_updated_at'])
+  # Print out any failures
+  print(f"\n\nFAILED:\n{failed_update}")
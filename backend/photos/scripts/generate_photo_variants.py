@@ -0,0 +1,28 @@
+# Generates the resized copies (JPEG and WebP) of every uploaded image that does not have them yet.
+# Copies are normally generated at upload, run this once for images uploaded before that, or after adding a size to PHOTO_VARIANT_SIZES.
+from photos.models import (
+  Image
+)
+
+from photos.utils import (
+  generatePhotoVariants
+)
+
+def run():
+  failed_update = []
+  # Retreive all images (Images sharing a stored file share its copies, so only one of them is needed)
+  images = list(Image.objects.all().order_by('pk').only('image_id', 'filename', 'content_hash'))
+  seen_hashes = set()
+  # Iterate images
+  for index, image in enumerate(images):
+    if(image.content_hash != None):
+      if(image.content_hash in seen_hashes):
+        continue
+      seen_hashes.add(image.content_hash)
+    try:
+      written = generatePhotoVariants(image)
+      print(f"Generated {written} resized copies of {image.filename} ({index+1}/{len(images)})")
+    except Exception as e:
+      failed_update.append({"filename": image.filename, "error": e})
+  # Print out any failures
+  print(f"\n\nFAILED:\n{failed_update}")
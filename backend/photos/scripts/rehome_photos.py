@@ -0,0 +1,62 @@
+# Moves images stored under their uuid prefixed filename (In the top of PHOTOSHOP_PATH) into content addressed storage.
+# Each file is hashed and copied to its blob (Identical files end up sharing one), the image is updated to point at it,
+# and only then are the old file and its resized copies removed. Safe to rerun, images already rehomed are skipped.
+# Pass "dry" to only print what would be moved: python manage.py runscript rehome_photos --script-args dry
+import hashlib
+import os
+
+from photos.models import (
+  Image
+)
+
+from photos.utils import (
+  PHOTO_VARIANT_SIZES,
+  PHOTO_VARIANT_FORMATS,
+  legacyPhotoPath,
+  photoVariantPath,
+  storePhotoFile,
+  generatePhotoVariants
+)
+
+# Bytes read at a time while hashing and copying
+CHUNK_SIZE = 1024 * 1024
+
+def readChunks(path: str):
+  with open(path, "rb") as file:
+    while(chunk := file.read(CHUNK_SIZE)):
+      yield chunk
+
+def run(*args):
+  dry_run = ("dry" in args)
+  failed_update = []
+  reused = 0
+  # Retreive images not yet rehomed
+  images = list(Image.objects.filter(content_hash=None).order_by('pk'))
+  # Iterate images
+  for index, image in enumerate(images):
+    legacy_path = legacyPhotoPath(image.filename)
+    try:
+      if(dry_run):
+        content_hash = hashlib.sha256()
+        for chunk in readChunks(legacy_path):
+          content_hash.update(chunk)
+        print(f"Would move {image.filename} to {content_hash.hexdigest()} ({index+1}/{len(images)})")
+        continue
+      # Copy the file into its blob, removing the legacy files only once the image points at it
+      content_hash, created = storePhotoFile(readChunks(legacy_path))
+      reused += (0 if created else 1)
+      legacy_variants = [photoVariantPath(image, size, extension) for size in PHOTO_VARIANT_SIZES for extension in PHOTO_VARIANT_FORMATS]
+      # Remove hex in front of the filename, it is no longer needed to keep it unique
+      image.filename = image.displayFilename()
+      image.content_hash = content_hash
+      image.save(update_fields=['filename', 'content_hash'])
+      for path in [legacy_path] + legacy_variants:
+        if(os.path.exists(path)):
+          os.remove(path)
+      generatePhotoVariants(image)
+      print(f"Moved {legacy_path} to {content_hash} ({index+1}/{len(images)})")
+    except Exception as e:
+      failed_update.append({"filename": image.filename, "error": e})
+  print(f"\n\n{reused} images were duplicates of an already stored file")
+  # Print out any failures
+  print(f"\n\nFAILED:\n{failed_update}")
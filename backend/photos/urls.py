@@ -6,9 +6,12 @@ from . import views
 urlpatterns = [
   path('getAllImages/', views.getAllImages),
   path('image/<int:imageID>/', views.getImage),
+  path('image/<int:imageID>/<int:size>/', views.getImageVariant),
   path('uploadImage/', views.uploadImage),
   path('getImageInfo/<int:imageID>/', views.getImageInfo),
+  path('getSimilarImages/<int:imageID>/', views.getSimilarImages),
   path('getImageIds/', views.getImageIds),
+  path('getImagePage/', views.getImagePage),
   path('getAllUploaders/', views.getAllUploaders),
   path('getAllArtists/', views.getAllArtists)
 ]
@@ -0,0 +1,180 @@
+from django.db.models import Count, Prefetch, Q
+
+from PIL import Image as PILImage
+
+from urllib.parse import quote
+import datetime
+import base64
+import mimetypes
+import tempfile
+import hashlib
+import logging
+import io
+import os
+
+from users.models import User
+from .models import Image
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Longest side (in pixels) of the resized copies generated for every uploaded image
+PHOTO_VARIANT_SIZES = (320, 640, 1280)
+# Formats resized copies are stored in, by file extension
+PHOTO_VARIANT_FORMATS = {"jpg": "JPEG", "webp": "WEBP"}
+# Internal nginx location serving PHOTOSHOP_PATH, used when FILE_OFFLOAD is X-Accel-Redirect
+PHOTOSHOP_ACCEL_PREFIX = os.getenv('PHOTOSHOP_ACCEL_PREFIX') or None
+
+##
+# Uploaded images are stored content addressed, under the SHA-256 of their bytes in sharded subdirectories
+# (PHOTOSHOP_PATH/blobs/ab/cd/abcd...). Uploading the same file again reuses the stored file (and its resized copies).
+# Images uploaded before this are stored under their filename until rehomed by the rehome_photos script.
+##
+
+
+def photoPath(image):
+  """Return the path of an uploaded image's file (Legacy images not yet rehomed are stored under their filename)"""
+  if(image.content_hash == None):
+    return legacyPhotoPath(image.filename)
+  return photoBlobPath(image.content_hash)
+
+
+def legacyPhotoPath(filename: str):
+  """Return the path of an image stored under its (uuid prefixed) filename, before images were content addressed"""
+  return f"{os.getenv('PHOTOSHOP_PATH')}{filename}"
+
+
+def photoBlobPath(content_hash: str):
+  """Return the path of a stored image file, sharded by the first four characters of its hash"""
+  return f"{os.getenv('PHOTOSHOP_PATH')}blobs/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+
+
+def photoVariantPath(image, size: int, extension: str):
+  """Return the path of a resized copy of an uploaded image (Shared by every image with the same content)"""
+  if(image.content_hash == None):
+    return f"{os.getenv('PHOTOSHOP_PATH')}variants/{size}/{image.filename}.{extension}"
+  return f"{os.getenv('PHOTOSHOP_PATH')}variants/{size}/{image.content_hash[:2]}/{image.content_hash}.{extension}"
+
+
+def photoContentType(image):
+  """Return the MIME type of an uploaded image (Stored files have no extension to guess it from)"""
+  if(image.filetype and ("/" in image.filetype)):
+    return image.filetype
+  return mimetypes.guess_type(image.filename)[0] or "application/octet-stream"
+
+
+def photoOffloadUri(path: str):
+  """Return the internal proxy location of a file under PHOTOSHOP_PATH, or None if no location is configured"""
+  if(PHOTOSHOP_ACCEL_PREFIX == None):
+    return None
+  return f"{PHOTOSHOP_ACCEL_PREFIX.rstrip('/')}/{quote(os.path.relpath(path, os.getenv('PHOTOSHOP_PATH')))}"
+
+
+def storePhotoFile(chunks):
+  """
+  Store an image streamed in as chunks of bytes (Such as UploadedFile.chunks()), hashing it while it is written.
+  Returns a (content_hash, created) tuple, created is False if the same file was already stored (And is reused).
+  """
+  blobs_dir = f"{os.getenv('PHOTOSHOP_PATH')}blobs/"
+  os.makedirs(blobs_dir, exist_ok=True)
+  digest = hashlib.sha256()
+  # Written next to the blobs, so moving it into place is a rename on the same filesystem
+  temp_file = tempfile.NamedTemporaryFile(dir=blobs_dir, suffix=".tmp", delete=False)
+  try:
+    with temp_file:
+      for chunk in chunks:
+        digest.update(chunk)
+        temp_file.write(chunk)
+      temp_file.flush()
+      os.fsync(temp_file.fileno())
+    content_hash = digest.hexdigest()
+    path = photoBlobPath(content_hash)
+    if(os.path.exists(path)):
+      os.remove(temp_file.name)
+      return content_hash, False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.chmod(temp_file.name, 0o644)
+    os.replace(temp_file.name, path)
+    return content_hash, True
+  except BaseException:
+    if(os.path.exists(temp_file.name)):
+      os.remove(temp_file.name)
+    raise
+
+
+def generatePhotoVariants(image):
+  """
+  Write a JPEG and a WebP copy of an uploaded image at every variant size (Never larger than the original), skipping any already written.
+  Animated images are left alone, their original is always served. Returns the number of files written.
+  """
+  written = 0
+  # Duplicates of a stored file already have its copies, skip decoding it
+  if(all(os.path.exists(photoVariantPath(image, size, extension)) for size in PHOTO_VARIANT_SIZES for extension in PHOTO_VARIANT_FORMATS)):
+    return 0
+  with PILImage.open(photoPath(image)) as original:
+    if(getattr(original, "is_animated", False)):
+      return 0
+    # Keep transparency for WebP, JPEG has none
+    picture = original.convert("RGBA" if ("A" in original.getbands()) else "RGB")
+  for size in PHOTO_VARIANT_SIZES:
+    variant = None
+    for extension, image_format in PHOTO_VARIANT_FORMATS.items():
+      path = photoVariantPath(image, size, extension)
+      if(os.path.exists(path)):
+        continue
+      if(variant == None):
+        variant = picture.copy()
+        variant.thumbnail((size, size), PILImage.LANCZOS)
+      buffer = io.BytesIO()
+      if(image_format == "JPEG"):
+        variant.convert("RGB").save(buffer, format="JPEG", quality=85, optimize=True, progressive=True)
+      else:
+        variant.save(buffer, format="WEBP", quality=80, method=4)
+      # Write through a temporary file, so a partially written variant is never served
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(f"{path}.tmp", "wb") as file:
+        file.write(buffer.getvalue())
+      os.replace(f"{path}.tmp", path)
+      written += 1
+  return written
+
+
+def getGalleryQuery():
+  """Return all images, newest first, with the users Image.toJSON() needs loaded in two queries in total"""
+  return Image.objects.select_related('uploader', 'artist').prefetch_related(
+    Prefetch('tagged_users', queryset=User.objects.only('pk', 'discord_id'))
+  ).order_by('-upload_timestamp', '-image_id')
+
+
+def filterImagesByTaggedUsers(images, nicknames: list):
+  """
+  Filter images down to those tagged with every one of the passed in users (By nickname).
+  Uses a single GROUP BY ... HAVING COUNT subquery over the tags, instead of one join per user.
+  """
+  nicknames = set(nicknames)
+  if(len(nicknames) == 0):
+    return images
+  tagged_image_ids = Image.tagged_users.through.objects.filter(user__nickname__in=nicknames).values('image_id').annotate(
+    tag_count=Count('user_id', distinct=True)
+  ).filter(tag_count=len(nicknames)).values('image_id')
+  return images.filter(image_id__in=tagged_image_ids)
+
+
+def encodeImageCursor(image):
+  """Encode the keyset position of an image (Upload time and pk) as an opaque cursor string"""
+  return base64.urlsafe_b64encode(f"{image.upload_timestamp.isoformat()}|{image.pk}".encode()).decode()
+
+
+def decodeImageCursor(cursor: str):
+  """Decode a cursor created by encodeImageCursor, returning an (upload_timestamp, pk) tuple. Raises ValueError on a malformed cursor."""
+  try:
+    upload_timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.datetime.fromisoformat(upload_timestamp), int(pk)
+  except Exception as e:
+    raise ValueError(f"Malformed image cursor: {cursor}") from e
+
+
+def seekImagesAfter(images, cursor: str):
+  """Filter images (Ordered newest first) down to those after the position of a cursor"""
+  upload_timestamp, pk = decodeImageCursor(cursor)
+  return images.filter(Q(upload_timestamp__lt=upload_timestamp) | Q(upload_timestamp=upload_timestamp, image_id__lt=pk))
@@ -1,14 +1,36 @@
-from django.http import HttpRequest, HttpResponse, FileResponse, JsonResponse
-from django.core.files.storage import FileSystemStorage
+from django.http import HttpRequest, HttpResponse
+from django.db import transaction
+from django.utils import timezone
 
 import logging
 import os
-import uuid
 import json
 
 
 from .models import Image
+from .utils import (
+  photoPath,
+  photoBlobPath,
+  photoVariantPath,
+  photoOffloadUri,
+  photoContentType,
+  storePhotoFile,
+  generatePhotoVariants,
+  getGalleryQuery,
+  filterImagesByTaggedUsers,
+  encodeImageCursor,
+  seekImagesAfter,
+  PHOTO_VARIANT_SIZES
+)
+from .perceptual_hash import (
+  computePerceptualHash,
+  findSimilarImages,
+  SIMILAR_IMAGE_DISTANCE,
+  MAX_SIMILAR_IMAGE_DISTANCE
+)
 from users.models import User
+from backend.responses import JsonResponse
+from backend.file_serving import serveFile
 
 # Declare logging
 logger = logging.getLogger('django')
@@ -16,6 +38,9 @@ logger = logging.getLogger('django')
 # Determine runtime enviornment
 APP_ENV = os.getenv('APP_ENV') or 'DEV'
 
+# Uploaded images never change under the same filename, but can be deleted
+PHOTO_CACHE_CONTROL = "public, max-age=604800"
+
 ###
 # Get all Image items in database
 ###
@@ -57,13 +82,33 @@ def uploadImage(request: HttpRequest):
   else:
     img_creator = None
   img_uploader = User.objects.get(discord_id = request.session['discord_id'])
-  # Generate list of tagged users (Only populate if not empty)
-  img_tagged_users_list = []
-  if(img_tagged_users != ""):
-    for userID in img_tagged_users.split(","):
-      img_tagged_users_list.append(User.objects.get(discord_id = userID))
-  # Generate new filename
-  img_filename = uuid.uuid4().hex + "_" + img_filename
+  # Retrieve tagged users in one query (Only populate if not empty)
+  img_tagged_ids = set(img_tagged_users.split(",")) if img_tagged_users else set()
+  img_tagged_users_list = list(User.objects.filter(discord_id__in=img_tagged_ids))
+  if(len(img_tagged_users_list) != len(img_tagged_ids)):
+    logger.warning(f"uploadImage called with unknown tagged users: {img_tagged_ids - set(user.discord_id for user in img_tagged_users_list)}")
+    res = HttpResponse("Unknown tagged user")
+    res.status_code = 400
+    return res
+  # Stream image out to filesystem, stored under its hash (An identical file already stored is reused)
+  logger.info(f"Attempting to write out image {img_filename}...")
+  try:
+    content_hash, created = storePhotoFile(img_image_binary.chunks())
+  except:
+    logger.exception("UNABLE TO WRITE IMAGE TO BACKEND!")
+    error_res = HttpResponse("Writing image to backend filesystem failed.")
+    error_res.status_code = 500
+    return error_res
+  if(not created):
+    logger.info(f"Image {img_filename} is a duplicate of stored file {content_hash}, reusing it.")
+  # Hash what the image looks like for near duplicate search (Images with the same file share it)
+  perceptual_hash = Image.objects.filter(content_hash=content_hash).exclude(perceptual_hash=None).values_list('perceptual_hash', flat=True).first()
+  if(perceptual_hash == None):
+    try:
+      perceptual_hash = computePerceptualHash(photoBlobPath(content_hash))
+    except Exception:
+      # Left for the backfill_perceptual_hashes script
+      logger.exception(f"Unable to compute perceptual hash of image {img_filename} ({content_hash})")
   # Create new image object
   imageDB_entry = Image(
     title = img_title,
@@ -71,27 +116,22 @@ def uploadImage(request: HttpRequest):
     uploader = img_uploader,
     artist = img_creator,
     filename = img_filename,
+    content_hash = content_hash,
+    perceptual_hash = perceptual_hash,
+    perceptual_hash_updated_at = (timezone.now() if perceptual_hash else None),
     filetype = img_filetype
   )
-  # Write out image to filesystem
-  write_path = os.getenv('PHOTOSHOP_PATH') + img_filename
-  logger.info(f"Attempting to write out image to {write_path}...")
+  # Generate resized copies for galleries (The original is still served if this fails, duplicates already have them)
   try:
-    file_storage = FileSystemStorage(location=os.path.dirname(write_path))
-    file_storage.save(img_filename, img_image_binary)
-  except:
-    logger.exception("UNABLE TO WRITE IMAGE TO BACKEND!")
-    error_res = HttpResponse("Writing image to backend filesystem failed.")
-    error_res.status_code = 500
-    return error_res
-  # Save image data into database
-  imageDB_entry.save()
-  # Retrieve new image from DB
-  image_obj = Image.objects.get(filename = img_filename)
-  # Add Tagged Users
-  image_obj.tagged_users.add(*img_tagged_users_list)
-  # Save Image
-  image_obj.save()
+    generatePhotoVariants(imageDB_entry)
+  except Exception:
+    logger.exception(f"Unable to generate resized copies of image {img_filename} ({content_hash})")
+  # Save image data and tagged users into database
+  with transaction.atomic():
+    imageDB_entry.save()
+    Image.tagged_users.through.objects.bulk_create([
+      Image.tagged_users.through(image=imageDB_entry, user=user) for user in img_tagged_users_list
+    ])
   # Return 200
   return HttpResponse(200)
 
@@ -112,22 +152,11 @@ def getImageInfo(request: HttpRequest, imageID: int):
     res = HttpResponse("Missing Image ID")
     res.status_code = 422 
     return res
-  # Retrieve image data from the database
-  image = Image.objects.get(image_id=imageID)
+  # Retrieve image data (And its users) from the database
+  image = getGalleryQuery().get(image_id=imageID)
   # Create out dict
-  imageData = {}
-  # Populate Out Dict
-  imageData['image_id'] = image.image_id
-  imageData['title'] = image.title
-  imageData['description'] = image.description
-  imageData['upload_timestamp'] = image.upload_timestamp.strftime("%m/%d/%Y, %H:%M:%S")
-  imageData['uploader'] = image.uploader.discord_id
-  imageData['creator'] = image.artist.discord_id
-  imageData['filename'] = image.filename[(image.filename.index("_") + 1):] # Remove hex in front for readability
-  imageData['tagged_users'] = []
-  # Get list of discord IDs
-  for user in image.tagged_users.all():
-    imageData['tagged_users'].append(user.discord_id)
+  imageData = image.toJSON()
+  imageData['variant_sizes'] = list(PHOTO_VARIANT_SIZES)
   # Return json
   return JsonResponse(imageData)
 
@@ -148,9 +177,43 @@ def getImage(request: HttpRequest, imageID: int):
     res = HttpResponse("Missing Image ID")
     res.status_code = 422 
     return res
-  # Retrieve filename from database
-  fileName = Image.objects.get(image_id=imageID).filename
-  return FileResponse(open(f"{os.getenv('PHOTOSHOP_PATH')}{fileName}", "rb"))
+  # Retrieve image from database
+  image = Image.objects.get(image_id=imageID)
+  path = photoPath(image)
+  # Stored files are named by their hash, which makes a strong ETag that is the same on every server
+  etag = f"\"{image.content_hash}\"" if image.content_hash else None
+  return serveFile(request, path, content_type=photoContentType(image), etag=etag, cache_control=PHOTO_CACHE_CONTROL, offload_uri=photoOffloadUri(path))
+
+
+###
+# Return a resized copy of an image, no larger than the passed in size (One of PHOTO_VARIANT_SIZES) on its longest side.
+# WebP is returned to clients that accept it, JPEG otherwise. Falls back to the original if no resized copy exists (e.g. animated images).
+###
+def getImageVariant(request: HttpRequest, imageID: int, size: int):
+  # Make sure request is a get request
+  if(request.method != "GET"):
+    logger.warning("getImageVariant called with a non-GET method, returning 405.")
+    res = HttpResponse("Method not allowed")
+    res.status_code = 405
+    return res
+  # Make sure the size is one that is generated
+  if(size not in PHOTO_VARIANT_SIZES):
+    res = HttpResponse(f"Unknown image size, must be one of {', '.join(map(str, PHOTO_VARIANT_SIZES))}")
+    res.status_code = 404
+    return res
+  # Retrieve image from database
+  image = Image.objects.get(image_id=imageID)
+  # Pick the format the client can display
+  extension = "webp" if ("image/webp" in request.headers.get('Accept', "")) else "jpg"
+  path = photoVariantPath(image, size, extension)
+  content_type = None
+  if(not os.path.exists(path)):
+    path = photoPath(image)
+    content_type = photoContentType(image)
+  response = serveFile(request, path, content_type=content_type, cache_control=PHOTO_CACHE_CONTROL, offload_uri=photoOffloadUri(path))
+  # The same url returns a different format depending on the Accept header
+  response['Vary'] = "Accept"
+  return response
 
 
 ###
@@ -172,9 +235,8 @@ def getImageIds(request: HttpRequest):
   # Get all objects
   imageQuery = Image.objects.all()
   # Retrieve data from request body and filter
-  if(body_params["tagged"] != 'undefined'): # NOTE: Tagged users current doesnt work
-    for nick in body_params['tagged']:
-      imageQuery = imageQuery.filter(tagged_users__nickname=nick)
+  if(body_params["tagged"] != 'undefined'):
+    imageQuery = filterImagesByTaggedUsers(imageQuery, body_params['tagged'])
   if(body_params["uploader"] != 'undefined'):
     imageQuery = imageQuery.filter(uploader__nickname=body_params['uploader'])
   if(body_params["artist"] != 'undefined'):
@@ -186,6 +248,90 @@ def getImageIds(request: HttpRequest):
   return JsonResponse({"imageIds": outstring})
 
 
+###
+# Get a page of images with all of their data (Uploader, creator and tagged users), newest upload first.
+# Uses keyset pagination, so every page costs the same two queries no matter how many images there are.
+# Optional Query Params:
+# - cursor: Value of "next_cursor" from the previous page (omit for the first page)
+# - limit: Page size (Default 50, Max 200)
+# - tagged: Comma separated User Nicknames, only images tagged with ALL of them are returned
+# - uploader: Single User Nickname
+# - artist: Single User Nickname
+###
+def getImagePage(request: HttpRequest):
+  # Make sure request is a get request
+  if(request.method != "GET"):
+    logger.warning("getImagePage called with a non-GET method, returning 405.")
+    res = HttpResponse("Method not allowed")
+    res.status_code = 405
+    return res
+  # Parse page size
+  try:
+    limit = min(max(int(request.GET.get('limit', 50)), 1), 200)
+  except ValueError:
+    return HttpResponse("Invalid limit, must be an integer.", status=400)
+  images = getGalleryQuery()
+  # Filter by query params
+  if(request.GET.get('tagged')):
+    images = filterImagesByTaggedUsers(images, request.GET['tagged'].split(","))
+  if(request.GET.get('uploader')):
+    images = images.filter(uploader__nickname=request.GET['uploader'])
+  if(request.GET.get('artist')):
+    images = images.filter(artist__nickname=request.GET['artist'])
+  # Seek past the last image of the previous page
+  if(request.GET.get('cursor')):
+    try:
+      images = seekImagesAfter(images, request.GET['cursor'])
+    except ValueError as e:
+      logger.warning(f"getImagePage: {e}")
+      return HttpResponse("Invalid cursor.", status=400)
+  # Fetch one extra row to find out if there is another page
+  page = list(images[:limit + 1])
+  has_next = (len(page) > limit)
+  page = page[:limit]
+  # Build response
+  out = {}
+  out['images'] = [image.toJSON() for image in page]
+  out['variant_sizes'] = list(PHOTO_VARIANT_SIZES)
+  out['next_cursor'] = encodeImageCursor(page[-1]) if has_next else None
+  return JsonResponse(out)
+
+
+###
+# Return the images that look like an image (Re-uploads, crops, recompressed or lightly edited copies), most alike first.
+# Optional Query Params:
+# - max_distance: Number of perceptual hash bits (Out of 64) allowed to differ (Default 10, Max 20)
+###
+def getSimilarImages(request: HttpRequest, imageID: int):
+  # Make sure request is a get request
+  if(request.method != "GET"):
+    logger.warning("getSimilarImages called with a non-GET method, returning 405.")
+    res = HttpResponse("Method not allowed")
+    res.status_code = 405
+    return res
+  # Parse distance
+  try:
+    max_distance = min(max(int(request.GET.get('max_distance', SIMILAR_IMAGE_DISTANCE)), 0), MAX_SIMILAR_IMAGE_DISTANCE)
+  except ValueError:
+    return HttpResponse("Invalid max_distance, must be an integer.", status=400)
+  # Retrieve image's hash from the database
+  perceptual_hash = Image.objects.filter(image_id=imageID).values_list('perceptual_hash', flat=True).first()
+  if(perceptual_hash == None):
+    return HttpResponse("Image not found or not hashed yet.", status=404)
+  # Look up near duplicates in the index, then load them all at once
+  matches = [(distance, image_id) for distance, image_id in findSimilarImages(perceptual_hash, max_distance) if image_id != imageID]
+  images = getGalleryQuery().in_bulk([image_id for _, image_id in matches])
+  # Build response
+  out = {}
+  out['images'] = []
+  for distance, image_id in matches:
+    if(image_id in images):
+      imageData = images[image_id].toJSON()
+      imageData['distance'] = distance
+      out['images'].append(imageData)
+  return JsonResponse(out)
+
+
 ###
 # Return a list of all discord User IDs that have submitted photoshops
 ###
@@ -1,17 +1,42 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.forms.models import model_to_dict
+from django.contrib.contenttypes.models import ContentType
 
 from .models import Reaction
-from users.models import UserAction
+from users.audit import recordUserAction
+from backend.events import publishEvent
+from backend.view_cache import bumpGeneration
 
 @receiver(post_save, sender=Reaction)
 def log_reaction_creation(sender, instance: Reaction, created, **kwargs):
   if created:  # Ensure it runs only on first creation
-    UserAction.objects.create(
+    recordUserAction(
       user=instance.user,
       action_type="CREATE",
       entity_type="REACTION",
       entity_id=instance.pk,
       details={"emoji": instance.emoji, "reaction_pk": instance.pk}
-    )
\ No newline at end of file
+    )
+
+@receiver(post_save, sender=Reaction)
+def publish_reaction_change(sender, instance: Reaction, created, **kwargs):
+  # Push the reaction to event stream subscribers, along with the type of object it is attached to
+  publishEvent("reaction", {
+    "action": "CREATE" if created else "UPDATE",
+    "target_type": ContentType.objects.get_for_id(instance.content_type_id).model,
+    "reaction": instance.toJSON()
+  })
+
+@receiver(post_delete, sender=Reaction)
+def publish_reaction_deletion(sender, instance: Reaction, **kwargs):
+  publishEvent("reaction", {
+    "action": "DELETE",
+    "target_type": ContentType.objects.get_for_id(instance.content_type_id).model,
+    "reaction": {"id": instance.pk, "user_id": instance.user_id, "target_object_id": instance.object_id, "emoji": instance.emoji}
+  })
+
+@receiver([post_save, post_delete], sender=Reaction)
+def bump_view_cache_generation(sender, instance: Reaction, **kwargs):
+  # Cached responses built from reactions are now out of date
+  bumpGeneration("Reaction")
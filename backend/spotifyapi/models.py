@@ -113,7 +113,7 @@ class Album(models.Model):
   # Custom delete function to log the user action
   def delete(self, deleter=None, reason=None, *args, **kwargs):
     # Log the action before actually deleting
-    from users.models import UserAction  # Import inside to avoid circular import
+    from users.audit import recordUserAction  # Import inside to avoid circular import
     from spotifyapi.utils import albumToDict
 
     # If deleter is not provided, log critical log and do not delete album
@@ -121,7 +121,7 @@ class Album(models.Model):
       logger.critical(f"ATTEMPTED DELETE OF ALBUM (ID: {self.spotify_id}) WITH NO USER PASSED IN! KEEPING ALBUM: {self.title}")
       return
     # Create user action log
-    UserAction.objects.create(
+    recordUserAction(
       user=deleter, 
       action_type="DELETE",
       entity_type="ALBUM",
@@ -208,7 +208,7 @@ class Review(models.Model):
 
     def save(self, *args, **kwargs):
       """Save override, will create a history object and user action."""
-      from users.models import UserAction
+      from users.audit import recordUserAction
       # Create a history record before updating the review
       if self.pk:  # Only if this is an update, not a new review
         # Fetch the original (pre-save) instance from the DB
@@ -225,7 +225,7 @@ class Review(models.Model):
           version=old_review.version
         )
         # Create UserAction for review update
-        UserAction.objects.create(
+        recordUserAction(
           user=self.user, 
           action_type="UPDATE",
           entity_type="REVIEW",
@@ -320,14 +320,14 @@ class UserAlbumOutage(models.Model):
   # Custom delete function to log the user action
   def delete(self, deleter=None, delete_reason=None, *args, **kwargs):
     # Log the action before actually deleting
-    from users.models import UserAction  # Import inside to avoid circular import
+    from users.audit import recordUserAction  # Import inside to avoid circular import
 
     # If deleter is not provided, log critical log and do not delete album
     if(deleter == None):
       logger.critical(f"ATTEMPTED DELETE OF ALBUM_SELECTION_OUTAGE (ID: {self.pk}) WITH NO DELETER USER PASSED IN! KEEPING OUTAGE: {self.pk}")
       return
     # Create user action log
-    UserAction.objects.create(
+    recordUserAction(
       user=deleter, 
       action_type="DELETE",
       entity_type="ALBUM_SELECTION_OUTAGE",
@@ -6,12 +6,12 @@ from .models import (
   Review,
   UserAlbumOutage
 )
-from users.models import UserAction
+from users.audit import recordUserAction
 
 @receiver(post_save, sender=Album)
 def log_album_creation(sender, instance: Album, created, **kwargs):
   if created:  # Ensure it runs only on first creation
-    UserAction.objects.create(
+    recordUserAction(
       user=instance.submitted_by,
       action_type="CREATE",
       entity_type="ALBUM",
@@ -22,7 +22,7 @@ def log_album_creation(sender, instance: Album, created, **kwargs):
 @receiver(post_save, sender=Review)
 def log_review_creation(sender, instance: Review, created, **kwargs):
   if created:  # Ensure it runs only on first creation
-    UserAction.objects.create(
+    recordUserAction(
       user=instance.user,
       action_type="CREATE",
       entity_type="REVIEW",
@@ -34,7 +34,7 @@ def log_review_creation(sender, instance: Review, created, **kwargs):
 @receiver(post_save, sender=UserAlbumOutage)
 def log_album_selection_outage_creation(sender, instance: UserAlbumOutage, created, **kwargs):
   if created:  # Ensure it runs only on first creation
-    UserAction.objects.create(
+    recordUserAction(
       user=(instance.admin_enactor if (instance.admin_enacted) else instance.user),
       action_type="CREATE",
       entity_type="ALBUM_SELECTION_OUTAGE",
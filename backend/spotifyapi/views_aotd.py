@@ -1,8 +1,9 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.forms.models import model_to_dict
 from django.db.models import Count, Q
 from django.utils import timezone
 from django.core import management
+from backend.responses import JsonResponse
 
 from .utils import (
   checkSelectionFlag,
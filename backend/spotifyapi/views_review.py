@@ -1,6 +1,7 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import Sum
+from backend.responses import JsonResponse
 
 from users.utils import getSpotifyUser
 
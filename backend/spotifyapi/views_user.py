@@ -1,5 +1,6 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.forms.models import model_to_dict
+from backend.responses import JsonResponse
 
 from .utils import (
   isSpotifyTokenExpired,
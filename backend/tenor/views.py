@@ -1,4 +1,5 @@
-from django.http import HttpRequest, JsonResponse, HttpResponse
+from django.http import HttpRequest, HttpResponse
+from backend.responses import JsonResponse
 
 import logging
 import requests
@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
+
+import contextlib
+import contextvars
+import datetime
+import logging
+import gzip
+import json
+import os
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Directory archived UserActions are written to
+USER_ACTION_ARCHIVE_DIR = os.getenv('USER_ACTION_ARCHIVE_DIR') or 'archives/user_actions'
+
+# UserActions waiting to be written for the request currently being handled (None outside of collectUserActions)
+_pending_actions = contextvars.ContextVar('pending_user_actions', default=None)
+
+##
+# Write-behind audit log. Actions are recorded in memory and only queued once the transaction they belong
+# to commits (so actions of a rolled back write are never logged). While collecting (LastSeenMiddleware
+# collects for every request) queued actions are written together with a single bulk insert at the end,
+# otherwise each action is written as soon as it is queued.
+##
+
+def recordUserAction(user, action_type: str, entity_type: str, entity_id: int, details: dict = None, timestamp=None):
+  """
+  Record a UserAction, written once the current transaction commits.
+  Parameters:
+  - user: User that performed the action (May be None)
+  - action_type: One of UserAction.ACTION_TYPES (CREATE, UPDATE, DELETE, LOGIN or LOGOUT)
+  - entity_type: Type of the affected object, such as "REVIEW" or "ALBUM"
+  - entity_id: pk of the affected object
+  - details: JSON serializable extra details (e.g., old vs. new values)
+  - timestamp: Time of the action, defaults to now
+  """
+  from users.models import UserAction
+  # Build the row now, so it records the values and time of the action rather than of the write
+  action = UserAction(
+    user=user,
+    action_type=action_type,
+    entity_type=entity_type,
+    entity_id=entity_id,
+    details=details,
+    timestamp=timestamp or timezone.now()
+  )
+  def queue():
+    pending = _pending_actions.get()
+    if(pending == None):
+      writeUserActions([action])
+    else:
+      pending.append(action)
+  transaction.on_commit(queue)
+
+
+def writeUserActions(actions: list):
+  """Write UserActions to the database with a single bulk insert, returning the number written"""
+  from users.models import UserAction
+  if(len(actions) == 0):
+    return 0
+  try:
+    UserAction.objects.bulk_create(actions, batch_size=500)
+  except Exception as e:
+    # The change being audited has already been committed, losing its log entry must not fail it
+    logger.error(f"Failed to write {len(actions)} user actions. Error: {e}")
+    return 0
+  return len(actions)
+
+
+@contextlib.contextmanager
+def collectUserActions():
+  """Hold UserActions recorded inside the block in memory, and write them with one bulk insert when it exits"""
+  token = _pending_actions.set([])
+  try:
+    yield
+  finally:
+    pending = _pending_actions.get()
+    _pending_actions.reset(token)
+    writeUserActions(pending)
+
+
+def archiveUserActions(before: datetime.datetime, archive_dir: str = USER_ACTION_ARCHIVE_DIR, batch_size: int = 5000):
+  """
+  Move UserActions older than a time out of the database into gzip compressed NDJSON files (One action per line).
+  Each batch is written to one file per month, named after the month and the range of ids it holds, and its rows are
+  only deleted once the files are on disk. Rerunning after an interruption rewrites the same files. Returns the number of actions archived.
+  Parameters:
+  - before: Archive actions with a timestamp before this time
+  - archive_dir: Directory to write the archive files to
+  - batch_size: Actions read, written and deleted at a time
+  """
+  from users.models import UserAction
+  os.makedirs(archive_dir, exist_ok=True)
+  actions = UserAction.objects.filter(timestamp__lt=before).order_by('pk').values(
+    'id', 'user_id', 'user__discord_id', 'action_type', 'entity_type', 'entity_id', 'timestamp', 'details'
+  )
+  archived = 0
+  while True:
+    # Archived rows are deleted, so the next batch is always at the start
+    batch = list(actions[:batch_size])
+    if(len(batch) == 0):
+      break
+    # Split the batch by month
+    months = {}
+    for action in batch:
+      months.setdefault(action['timestamp'].strftime("%Y-%m"), []).append(action)
+    for month, month_actions in months.items():
+      path = os.path.join(archive_dir, f"user_actions_{month}_{month_actions[0]['id']}-{month_actions[-1]['id']}.ndjson.gz")
+      # Write to a temporary file and move it into place, so a partial file is never left under an archive name
+      with open(f"{path}.tmp", "wb") as raw_file:
+        with gzip.GzipFile(fileobj=raw_file, mode="wb") as archive_file:
+          for action in month_actions:
+            archive_file.write((json.dumps(action, cls=DjangoJSONEncoder) + "\n").encode())
+        raw_file.flush()
+        os.fsync(raw_file.fileno())
+      os.replace(f"{path}.tmp", path)
+    UserAction.objects.filter(pk__in=[action['id'] for action in batch]).delete()
+    archived += len(batch)
+    logger.info(f"Archived {archived} user actions to {archive_dir}")
+  return archived
@@ -3,6 +3,13 @@ from django.http import HttpRequest, HttpResponseRedirect
 from users.models import (
   User
 )
+from users.presence import presence_tracker
+from users.audit import collectUserActions
+from users.utils import (
+  setRequestUser,
+  resetRequestUser
+)
+from backend.events import publishEvent
 
 import logging
 import datetime
@@ -26,27 +33,43 @@ class LastSeenMiddleware:
     # Get Request Path
     full_path = request.get_full_path()
     # Get session data from request
+    request.site_user = None
+    request_user_token = None
     try:
-      # Get user object 
-      user = User.objects.get(discord_id=request.session['discord_id'])
+      # Get user object (With aotd data, resolved once and shared with the view through request.site_user and getUserObj)
+      user = User.objects.select_related('aotd_data').get(discord_id=request.session['discord_id'])
+      request.site_user = user
+      request_user_token = setRequestUser(user)
       # Log method call (With username)
       self.logger.info(f"Incoming Request from user \"{user.nickname}\": {full_path}")
       # Get current timestamp
       time = datetime.datetime.now(tz=pytz.timezone('America/Chicago'))
-      # Update only heartbeat timestamp if its a heartbeat call, otherwise update last_request_timestamp
+      # Store status before this request, to notify event stream subscribers if it changes
+      previous_status = self.getOnlineStatus(user)
+      # Record only heartbeat timestamp if its a heartbeat call, otherwise record last_request_timestamp (Presence is kept in memory and written to the database in batches)
       if(full_path in self.heartbeat_endpoint_paths):
+        timezone_string = None
         if(full_path == "/users/heartbeat"):
           # Update timezone if timezone is in request
-          user.timezone_string = json.loads(request.body)['heartbeat']['timezone']
-          self.logger.info(f"Setting timezone to {str(user.timezone_string)} for user {user.nickname}")
-        user.last_heartbeat_timestamp = time
+          timezone_string = json.loads(request.body)['heartbeat']['timezone']
+          self.logger.info(f"Setting timezone to {str(timezone_string)} for user {user.nickname}")
+        presence_tracker.seen(user, heartbeat_time=time, timezone_string=timezone_string)
         self.logger.debug(f"Setting last_heartbeat_timestamp to {str(time)} for user {user.nickname}")
-        user.save()
       else:
-        user.last_heartbeat_timestamp = time # Also update heartbeat, why not
-        user.last_request_timestamp = time
+        presence_tracker.seen(user, request_time=time, heartbeat_time=time) # Also update heartbeat, why not
         self.logger.debug(f"Setting last_request_timestamp to {str(time)} for user {user.nickname}")
-        user.save()
+      # Push presence changes to event stream subscribers
+      current_status = self.getOnlineStatus(user)
+      if(current_status != previous_status):
+        publishEvent("presence", {
+          "user_id": user.pk,
+          "discord_id": user.discord_id,
+          "status": current_status,
+          "last_request_timestamp": user.get_presence('last_request_timestamp'),
+          "last_heartbeat_timestamp": user.get_presence('last_heartbeat_timestamp')
+        })
+      # Write batched presence data to the database once per flush interval
+      presence_tracker.flushIfDue()
     except Exception as e:
       if(isinstance(e, User.DoesNotExist)):
         # Log method call (With username)
@@ -62,9 +85,23 @@ class LastSeenMiddleware:
           self.logger.error(f"ERROR IN USER MIDDLEWARE: PATH: {full_path} TRACEBACK: {traceback.print_exc()}")
     
     # Code above this line is executed before the view is called
-    # Retrieving the response 
-    response = self.get_response(request)
+    # Retrieving the response (UserActions recorded by the view are written together once it returns)
+    try:
+      with collectUserActions():
+        response = self.get_response(request)
+    finally:
+      # The resolved user belongs to this request only
+      if(request_user_token != None):
+        resetRequestUser(request_user_token)
     # Code after this line is executed after the view is called
 
     # Returning the response
-    return response
\ No newline at end of file
+    return response
+
+
+  def getOnlineStatus(self, user: User):
+    """Return the online status of a user, treating users that have never made a request as Offline"""
+    try:
+      return user.online_status()
+    except TypeError:
+      return "Offline"
@@ -50,10 +50,15 @@ class User(AbstractUser):
         return f"https://cdn.discordapp.com/avatars/{self.discord_id}/{self.discord_avatar}.png"
     return f"https://cdn.discordapp.com/embed/avatars/{int(self.discord_discriminator) % 5}.png"
 
+  def get_presence(self, field: str):
+    """Return the freshest value of a presence field (last_request_timestamp, last_heartbeat_timestamp or timezone_string), including activity not yet flushed to the database."""
+    from users.presence import presence_tracker
+    return presence_tracker.get(self, field)
+
   def is_online(self):
     """Return true if the last_heartbeat_timestamp is within 1 min."""
     try:
-      return ((timezone.now() - self.last_heartbeat_timestamp) < timedelta(minutes=1))
+      return ((timezone.now() - self.get_presence('last_heartbeat_timestamp')) < timedelta(minutes=1))
     except:
       return False
   
@@ -61,7 +66,7 @@ class User(AbstractUser):
     """Return one of three strings: ONLINE, AWAY, or OFFLINE"""
     if(not self.is_online()):
       return "Offline"
-    time_since_request = (timezone.now() - self.last_request_timestamp)
+    time_since_request = (timezone.now() - self.get_presence('last_request_timestamp'))
     if(time_since_request > timedelta(minutes=2)):
       return "Away"
     # If we reach this point, they have had a heartbeat and a request within the last two mins, meaning they are online
@@ -69,7 +74,7 @@ class User(AbstractUser):
   
   def last_seen(self):
     """Return String stating how long its been since the user was last seen."""
-    time_since = (timezone.now() - self.last_request_timestamp)
+    time_since = (timezone.now() - self.get_presence('last_request_timestamp'))
     # Calculate minutes and remaining seconds
     minutes, seconds = divmod(int(time_since.total_seconds()), 60)
     # Calculate hours and remaining minutes
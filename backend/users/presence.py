@@ -0,0 +1,156 @@
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+import atexit
+import datetime
+import logging
+import threading
+import time
+import os
+
+# Declare logging
+logger = logging.getLogger('django')
+
+# Seconds between database flushes of presence data, must stay well under the one minute online window
+PRESENCE_FLUSH_SECONDS = float(os.getenv('PRESENCE_FLUSH_SECONDS') or 15)
+# Users written by each update query
+PRESENCE_FLUSH_BATCH_SIZE = 500
+
+##
+# In-memory store of user presence (last request, last heartbeat and timezone), written on every request
+# and flushed to the user table in batches. Reads overlay the hot values on the (possibly stale) user row,
+# so each process sees its own requests immediately and other processes' requests after their next flush.
+# Only values seen since the last flush are held and written, and timestamps are never moved back, so
+# processes flushing the same users do not overwrite each other's newer values.
+##
+class PresenceTracker:
+
+  # User fields owned by the tracker, the only fields written by a flush
+  FIELDS = ['last_request_timestamp', 'last_heartbeat_timestamp', 'timezone_string']
+  # Fields that only ever move forward
+  TIMESTAMP_FIELDS = ['last_request_timestamp', 'last_heartbeat_timestamp']
+
+  def __init__(self, flush_seconds: float = PRESENCE_FLUSH_SECONDS):
+    self.flush_seconds = flush_seconds
+    self.lock = threading.Lock()
+    # User pk -> dict of the tracked field values seen since the last flush
+    self.entries = {}
+    self.last_flush = time.monotonic()
+    # Flushes pending values when no request arrives to do it
+    self.timer = None
+
+  def seen(self, user, request_time: datetime.datetime = None, heartbeat_time: datetime.datetime = None, timezone_string: str = None):
+    """
+    Record activity for a user, without touching the database.
+    Parameters:
+    - user: User the activity belongs to
+    - request_time: Time of a (non heartbeat) request
+    - heartbeat_time: Time of a heartbeat
+    - timezone_string: Timezone reported by the client
+    """
+    with self.lock:
+      entry = self.entries.setdefault(user.pk, {})
+      if(request_time != None):
+        entry['last_request_timestamp'] = self._latest(entry.get('last_request_timestamp'), request_time)
+      if(heartbeat_time != None):
+        entry['last_heartbeat_timestamp'] = self._latest(entry.get('last_heartbeat_timestamp'), heartbeat_time)
+      if(timezone_string != None):
+        entry['timezone_string'] = timezone_string
+      # Keep the passed in user current too, it is still read after its entry is flushed
+      for field in entry:
+        setattr(user, field, self.get(user, field))
+      if(self.timer == None):
+        self.timer = threading.Timer(self.flush_seconds, self._flushFromTimer)
+        self.timer.daemon = True
+        self.timer.start()
+
+  def get(self, user, field: str):
+    """Return the freshest known value of a tracked field for a user"""
+    stored = getattr(user, field)
+    entry = self.entries.get(user.pk)
+    if((entry == None) or (field not in entry)):
+      return stored
+    if(field == 'timezone_string'):
+      # Set by this process since the last flush, so newer than the loaded row
+      return entry[field]
+    return self._latest(stored, entry[field])
+
+  def flushIfDue(self):
+    """Flush pending presence data if the flush interval has passed, return the number of users written"""
+    if((time.monotonic() - self.last_flush) < self.flush_seconds):
+      return 0
+    return self.flush()
+
+  def flush(self):
+    """Write all pending presence data to the database, one update per batch of users"""
+    from users.models import User
+    # Take the pending entries, so requests arriving during the write are kept for the next flush
+    with self.lock:
+      self.last_flush = time.monotonic()
+      if(len(self.entries) == 0):
+        return 0
+      pending = self.entries
+      self.entries = {}
+    try:
+      with transaction.atomic():
+        pks = list(pending.keys())
+        for start in range(0, len(pks), PRESENCE_FLUSH_BATCH_SIZE):
+          batch = {pk: pending[pk] for pk in pks[start:start + PRESENCE_FLUSH_BATCH_SIZE]}
+          User.objects.filter(pk__in=batch.keys()).update(**self._buildUpdate(User, batch))
+    except Exception as e:
+      # Put the entries back to be retried on the next flush, merged with anything seen since
+      logger.error(f"Failed to flush presence data for {len(pending)} users, will retry. Error: {e}")
+      with self.lock:
+        for pk, values in pending.items():
+          entry = self.entries.setdefault(pk, {})
+          for field, value in values.items():
+            if(field in self.TIMESTAMP_FIELDS):
+              entry[field] = self._latest(entry.get(field), value)
+            else:
+              entry.setdefault(field, value)
+      return 0
+    logger.debug(f"Flushed presence data for {len(pending)} users")
+    return len(pending)
+
+  def _buildUpdate(self, User, batch: dict):
+    """Return the update() keyword arguments writing each user's pending values, and leaving every other value as stored"""
+    updates = {}
+    for field in self.FIELDS:
+      whens = [When(pk=pk, then=Value(values[field])) for pk, values in batch.items() if field in values]
+      if(len(whens) == 0):
+        continue
+      value = Case(*whens, default=F(field), output_field=User._meta.get_field(field))
+      if(field in self.TIMESTAMP_FIELDS):
+        # Keep a newer timestamp flushed by another process
+        value = Greatest(Coalesce(F(field), value), value)
+      updates[field] = value
+    return updates
+
+  def _flushFromTimer(self):
+    with self.lock:
+      self.timer = None
+    try:
+      self.flush()
+    finally:
+      # The timer thread's connection is not managed by the request cycle
+      connection.close()
+
+  def _latest(self, first: datetime.datetime, second: datetime.datetime):
+    if(first == None):
+      return second
+    if(second == None):
+      return first
+    return max(first, second)
+
+
+# Process wide presence tracker
+presence_tracker = PresenceTracker()
+
+# Do not lose the last interval of presence data on a clean shutdown
+@atexit.register
+def flushPresenceOnExit():
+  try:
+    presence_tracker.flush()
+  except Exception as e:
+    logger.error(f"Failed to flush presence data on exit. Error: {e}")
@@ -0,0 +1,22 @@
+# Moves old UserActions out of the database into compressed NDJSON files (See users.audit.archiveUserActions).
+# Meant to be run monthly. Keeps the current month and the previous N months (Default 6, or USER_ACTION_RETENTION_MONTHS) in the database.
+# Usage: python manage.py runscript archive_user_actions [--script-args <months to keep>]
+from django.utils import timezone
+
+import datetime
+import os
+
+from users.audit import (
+  archiveUserActions,
+  USER_ACTION_ARCHIVE_DIR
+)
+
+def run(*args):
+  retention_months = int(args[0]) if args else int(os.getenv('USER_ACTION_RETENTION_MONTHS') or 6)
+  # Archive everything before the start of the oldest month being kept
+  today = timezone.localdate()
+  month_index = (today.year * 12 + today.month - 1) - retention_months
+  cutoff = timezone.make_aware(datetime.datetime(month_index // 12, month_index % 12 + 1, 1))
+  print(f"Archiving user actions from before {cutoff} to {USER_ACTION_ARCHIVE_DIR}...")
+  archived = archiveUserActions(cutoff)
+  print(f"Archived {archived} user actions")
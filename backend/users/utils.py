@@ -7,10 +7,14 @@ from backend.utils import (
 
 from .models import User
 import logging
+import contextvars
 
 # Declare logging
 logger = logging.getLogger('django')
 
+# User resolved from the session of the request currently being handled (Set by LastSeenMiddleware)
+_request_user = contextvars.ContextVar('request_user', default=None)
+
 
 def createUserFromDiscordJSON(discordDataJson):
   '''Create a new user from discord Json data'''
@@ -51,8 +55,26 @@ def getSpotifyUser(discord_id):
     return None
   
 
+def setRequestUser(user: User):
+  """Store the user resolved for the current request, returns a token for resetRequestUser"""
+  return _request_user.set(user)
+
+
+def resetRequestUser(token):
+  """Clear the user resolved for the current request once the response is built"""
+  _request_user.reset(token)
+
+
+def getRequestUser():
+  """Return the user resolved for the current request (with aotd_data loaded), or None"""
+  return _request_user.get()
+
+
 def getUserObj(discord_id):
-  """Return User Object corresponding to discord id"""
+  """Return User Object corresponding to discord id, reusing the current request's user when it matches"""
+  request_user = _request_user.get()
+  if((request_user != None) and (discord_id != None) and (request_user.discord_id == discord_id)):
+    return request_user
   try:
     return User.objects.filter(discord_id=discord_id).first()
   except ObjectDoesNotExist:
@@ -1,11 +1,14 @@
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse
 from django.utils import timezone
 from django.forms.models import model_to_dict
 from django.contrib.auth.password_validation import password_validators_help_texts, validate_password
 from django.core.exceptions import ValidationError
 
 from .models import User
+from .utils import getUserObj
 from discordapi.models import DiscordTokens
+from backend.responses import JsonResponse
+from backend.view_cache import bumpGeneration
 
 import logging
 import os
@@ -60,7 +63,7 @@ def getUserList(request: HttpRequest):
     tempDict['discord_id'] = user.discord_id
     tempDict['avatar_url'] = user.get_avatar_url()
     tempDict['nickname'] = user.nickname
-    tempDict['last_request_timestamp'] = user.last_request_timestamp
+    tempDict['last_request_timestamp'] = user.get_presence('last_request_timestamp')
     # Store tempDict in out json
     out['users'][user.guid] = tempDict
   # Return dict response
@@ -172,6 +175,8 @@ def updateUserData(request: HttpRequest):
   reqBody = json.loads(request.body)
   # Retrieve user data via session storage then update user data
   User.objects.filter(discord_id=request.session['discord_id']).update(**reqBody)
+  # update() sends no signals, so invalidate cached responses showing user data (e.g. nicknames) here
+  bumpGeneration("User")
   # Return success code
   return HttpResponse(200)
 
@@ -218,8 +223,8 @@ def getAllOnlineData(request: HttpRequest):
     temp["online"] = user.is_online()
     temp['last_seen'] = user.last_seen()
     temp['status'] = user.online_status()
-    temp['last_request_timestamp'] = user.last_request_timestamp
-    temp['last_heartbeat_timestamp'] = user.last_heartbeat_timestamp
+    temp['last_request_timestamp'] = user.get_presence('last_request_timestamp')
+    temp['last_heartbeat_timestamp'] = user.get_presence('last_heartbeat_timestamp')
     out[user.discord_id] = temp
   # Return users and timestamp
   out['timestamp'] = timezone.now()
@@ -269,7 +274,9 @@ def heartbeat(request: HttpRequest):
     res.status_code = 405
     return res
   try:
-    user = User.objects.get(discord_id=request.session['discord_id'])
+    user = getUserObj(request.session['discord_id'])
+    if(user == None):
+      raise User.DoesNotExist
     logger.debug(f"Heartbeat received from {user.nickname}...")
   except:
     logger.warning(f"HEARTBEAT RECIEVED FROM UNKNOWN USER!")